@@ -5,17 +5,31 @@
 # Use of this source code is governed by the MIT license
 ###############################################################################
 import argparse
+import concurrent.futures
 import fnmatch
+import glob
+import gzip
+import hashlib
+import itertools
+import json
 import logging
 import os
 import os.path
+import re
 import shutil
 import subprocess
 import sys
+import threading
+import time
 import traceback
 
 import config_flaskpylar as confpylar
 
+try:
+    import brotli
+except ImportError:
+    brotli = None  # .br siblings will not be generated
+
 
 def logconfig(quiet, verbose):
     if quiet:
@@ -38,36 +52,692 @@ WORK_DIR = 'app'
 WEBIGNORE = 'webignore'
 APP_PKG = confpylar.FLASKPYLAR_APP_PKG
 
+# Precompressed siblings generated for bundles and vfs files. The server picks
+# one of them according to Accept-Encoding and never compresses on the fly
+GZIP_EXT = '.gz'
+BROTLI_EXT = '.br'
+
+# Fingerprinted copies (anpylar.<hash>.js) are listed in the manifest
+MANIFEST = confpylar.FLASKPYLAR_MANIFEST
+HASH_LEN = 12
+VFS_EXT = '.auto_vfs.js'
+
+# Layout of webpack dir with --link: releases/<name> and current -> release
+RELEASES_DIR = 'releases'
+CURRENT_LINK = 'current'
+
+# Input hashes of apps/bundle from previous runs, to skip unchanged work
+BUILD_CACHE = '.flaskpylar-cache.json'
+CACHE_SKIP_DIRS = ['__pycache__']
+CACHE_SKIP_PATTERNS = ['*.pyc', '*~']
+
+
+def glob_to_regex(pat):
+    # Translates a gitignore-style glob to a regular expression: "*", "?" and
+    # character classes do not cross "/", "**" does
+    i, n, res = 0, len(pat), []
+    while i < n:
+        c = pat[i]
+        i += 1
+        if c == '*':
+            if pat[i:i + 1] == '*':  # "**"
+                i += 1
+                if pat[i:i + 1] == '/':  # "**/" zero or more directories
+                    i += 1
+                    res.append('(?:.*/)?')
+                else:
+                    res.append('.*')
+            else:
+                res.append('[^/]*')
+        elif c == '?':
+            res.append('[^/]')
+        elif c == '\\' and i < n:  # escaped char
+            res.append(re.escape(pat[i]))
+            i += 1
+        elif c == '[':
+            j = i
+            if j < n and pat[j] in '!^':
+                j += 1
+            if j < n and pat[j] == ']':
+                j += 1
+            while j < n and pat[j] != ']':
+                j += 1
+
+            if j >= n:  # unclosed, literal "["
+                res.append('\\[')
+            else:
+                stuff = pat[i:j].replace('\\', '\\\\')
+                neg = ''
+                if stuff[0] in '!^':
+                    stuff = '^' + stuff[1:]
+                    neg = '(?!/)'  # not "/" either
+
+                res.append(neg + '[' + stuff + ']')
+                i = j + 1
+        else:
+            res.append(re.escape(c))
+
+    return ''.join(res)
+
+
+def compile_patterns(patterns):
+    # Compiles gitignore-style patterns to a list of (negated, file_re,
+    # dir_re) with a single regex for each run of consecutive rules with the
+    # same polarity (usually there is only one). Rules:
+    #   - blank lines and lines starting with "#" are skipped
+    #   - "!pattern" re-includes what a previous pattern excluded
+    #   - "pattern/" matches only directories
+    #   - a "/" at the start or in the middle anchors the pattern to the root,
+    #     else it matches the name at any level
+    rules = []
+    for p in patterns:
+        p = p.rstrip('\n').rstrip()
+        if not p or p.startswith('#'):
+            continue
+
+        negated = p.startswith('!')
+        if negated:
+            p = p[1:]
+
+        dironly = p.endswith('/')
+        p = p.rstrip('/')
+        if not p:
+            continue
+
+        anchored = '/' in p
+        rx = glob_to_regex(p.lstrip('/'))
+        if not anchored:
+            rx = '(?:.*/)?' + rx
+
+        rules.append((negated, dironly, rx))
+
+    compiled = []
+    for negated, group in itertools.groupby(rules, key=lambda r: r[0]):
+        group = list(group)
+        frx = [rx for _, dironly, rx in group if not dironly]
+        drx = [rx for _, dironly, rx in group]
+        file_re = re.compile('|'.join(frx)) if frx else None
+        compiled.append((negated, file_re, re.compile('|'.join(drx))))
+
+    return compiled
+
 
 class Ignorer:
-    # Define a function object which filters which things go to deployment
-    def __init__(self, rootdir, devdir, keep_dev, skip_patterns):
+    # Decides which things go to deployment. The webignore patterns are
+    # compiled once and the dev dir is recognized by device/inode
+    def __init__(self, rootdir, devdir, keep_dev, skip_patterns,
+                 dry_run=False):
         self.rootdir = rootdir
-        self.devdir = devdir
-        self.keep_dev = keep_dev
-        self.skip_patterns = skip_patterns
-
-    def __call__(self, d, listdir):
-        to_ignore = []
-
-        # Check if dev dir and skipping all contents is needed
-        if not self.keep_dev:
-            for l in listdir:
-                ld = os.path.join(d, l)
-                if os.path.samefile(self.devdir, ld):
-                    logging.info('Skipping devdir: %s', ld)
-                    to_ignore.append(l)  # append l from listdir
-                    break
-
-        # Check patterns
-        for p in self.skip_patterns:
-            to_ignore.extend(fnmatch.filter(listdir, p))
-
-        # unique names in the list
-        to_ignore = list(set(to_ignore))
+        self.dry_run = dry_run
+        self.rules = compile_patterns(skip_patterns)
+
+        self.devkey = None
+        if not keep_dev and os.path.exists(devdir):
+            st = os.stat(devdir)
+            self.devkey = (st.st_dev, st.st_ino)
+
+        self.skipped_files = self.skipped_bytes = self.skipped_dirs = 0
+
+    def match(self, relpath, isdir):
+        # last matching rule wins: check the runs backwards
+        for negated, file_re, dir_re in reversed(self.rules):
+            rx = dir_re if isdir else file_re
+            if rx is not None and rx.fullmatch(relpath):
+                return not negated
+
+        return False
+
+    def account(self, entry, isdir):
+        # Adds entry to the counters (dry runs). Skipped directories are
+        # pruned: counted, but never descended into
+        if isdir:
+            self.skipped_dirs += 1
+            return
+
+        try:
+            self.skipped_bytes += entry.stat().st_size
+        except OSError:
+            pass  # broken links and the like
+
+        self.skipped_files += 1
+
+    def scan(self, d):
+        # Returns the entries of directory d which go to deployment
         rel_d = os.path.relpath(d, self.rootdir)
-        logging.info('Directory: %s -> ignoring %s', rel_d, to_ignore)
-        return to_ignore
+        rel_d = '' if rel_d == os.curdir else rel_d.replace(os.sep, '/') + '/'
+
+        kept = []
+        with os.scandir(d) as it:
+            for entry in it:
+                isdir = entry.is_dir()
+                relpath = rel_d + entry.name
+                if isdir and self.devkey is not None and \
+                   entry.inode() == self.devkey[1] and \
+                   entry.stat().st_dev == self.devkey[0]:
+                    logging.info('Skipping devdir: %s', entry.path)
+                elif self.match(relpath, isdir):
+                    if self.dry_run:
+                        logging.info('Skipping: %s', relpath)
+                    else:
+                        logging.debug('Skipping: %s', relpath)
+                else:
+                    kept.append(entry)
+                    continue
+
+                if self.dry_run:
+                    self.account(entry, isdir)
+
+        kept.sort(key=lambda e: e.name)
+        return kept
+
+    def report(self):
+        if self.dry_run:
+            logging.info('Skipped %d files (%d bytes) and %d directories',
+                         self.skipped_files, self.skipped_bytes,
+                         self.skipped_dirs)
+
+
+def compress_file(filename):
+    # Generate .gz and .br siblings at max compression level for filename,
+    # skipping those which are already newer than the source
+    with open(filename, 'rb') as f:
+        data = f.read()
+
+    mtime = os.path.getmtime(filename)
+    compressors = [(GZIP_EXT, lambda d: gzip.compress(d, 9))]
+    if brotli is not None:
+        compressors.append(
+            (BROTLI_EXT, lambda d: brotli.compress(d, quality=11)))
+    else:
+        logging.info('brotli not available, skipping .br for: %s', filename)
+
+    for ext, compressor in compressors:
+        cname = filename + ext
+        if os.path.exists(cname) and os.path.getmtime(cname) >= mtime:
+            logging.info('Compressed file is up to date: %s', cname)
+            continue
+
+        logging.info('Compressing %s -> %s', filename, cname)
+        cdata = compressor(data)
+        with open(cname, 'wb') as f:
+            f.write(cdata)
+
+        logging.info('Compressed size %d -> %d', len(data), len(cdata))
+
+
+def hash_file(filename, h=None):
+    # Updates and returns hash h (a new sha256 if None) with filename contents
+    if h is None:
+        h = hashlib.sha256()
+
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+
+    return h
+
+
+def hash_tree(root, h):
+    # Updates hash h with the relative names and contents of files in root
+    for d, dnames, fnames in os.walk(root):
+        dnames[:] = sorted(x for x in dnames if x not in CACHE_SKIP_DIRS)
+        for fname in sorted(fnames):
+            if any(fnmatch.fnmatch(fname, p) for p in CACHE_SKIP_PATTERNS):
+                continue
+
+            fullname = os.path.join(d, fname)
+            h.update(os.path.relpath(fullname, root).encode('utf-8') + b'\0')
+            hash_file(fullname, h)
+            h.update(b'\0')
+
+    return h
+
+
+class BuildCache:
+    # Keeps the input hashes (keys) of the last successful builds in a json
+    # file. With force, keys are not looked up (but are recorded)
+    def __init__(self, filename, force=False):
+        self.filename = filename
+        self.force = force
+        self.data = {}
+        if force:
+            logging.info('Forced build, not using cache: %s', filename)
+            return
+
+        try:
+            with open(filename) as f:
+                self.data = json.load(f)
+        except FileNotFoundError:
+            logging.info('No build cache found at: %s', filename)
+        except (OSError, ValueError) as e:
+            logging.info('Ignoring unreadable build cache %s: %s', filename, e)
+
+    def get(self, section, name):
+        if self.force:
+            return None
+
+        return self.data.get(section, {}).get(name)
+
+    def set(self, section, name, key):
+        self.data.setdefault(section, {})[name] = key
+
+    def save(self):
+        logging.info('Saving build cache: %s', self.filename)
+        tmpname = self.filename + '.tmp'
+        try:
+            with open(tmpname, 'w') as f:
+                json.dump(self.data, f, indent=2, sort_keys=True)
+
+            os.replace(tmpname, self.filename)
+        except OSError as e:  # a missing cache only means a slower build
+            logging.error('Failed to save build cache: %s', str(e))
+
+
+def fingerprint_name(filename, digest):
+    # anpylar.js -> anpylar.<digest>.js
+    base, ext = os.path.splitext(filename)
+    return '{}.{}{}'.format(base, digest[:HASH_LEN], ext)
+
+
+def fingerprint_file(filename):
+    # Create a content-hashed copy of filename (and of its precompressed
+    # siblings) removing stale copies. Returns the name of the copy
+    hashed = fingerprint_name(filename, hash_file(filename).hexdigest())
+    base, ext = os.path.splitext(filename)
+    stale_re = re.compile(
+        re.escape(base) + r'\.[0-9a-f]{%d}' % HASH_LEN + re.escape(ext) +
+        r'(' + re.escape(GZIP_EXT) + '|' + re.escape(BROTLI_EXT) + ')?$')
+
+    for stale in glob.glob(glob.escape(base) + '.*' + ext + '*'):
+        if stale_re.match(stale) and not stale.startswith(hashed):
+            logging.info('Removing stale fingerprinted file: %s', stale)
+            os.remove(stale)
+
+    for sfx in ('', GZIP_EXT, BROTLI_EXT):
+        src, dst = filename + sfx, hashed + sfx
+        if not os.path.exists(src):
+            continue
+
+        if os.path.exists(dst) and \
+           os.path.getmtime(dst) >= os.path.getmtime(src):
+            logging.info('Fingerprinted file is up to date: %s', dst)
+            continue
+
+        logging.info('Fingerprinting %s -> %s', src, dst)
+        shutil.copy2(src, dst)
+
+    return hashed
+
+
+def write_manifest(outdir, assets):
+    # assets is a list of files under outdir. The manifest maps the logical
+    # names (relative to outdir, with "/" separator) to the fingerprinted ones
+    manifest = {}
+    for asset in assets:
+        hashed = fingerprint_file(asset)
+        logical = os.path.relpath(asset, outdir).replace(os.sep, '/')
+        hashed = os.path.relpath(hashed, outdir)
+        manifest[logical] = hashed.replace(os.sep, '/')
+
+    mname = os.path.join(outdir, MANIFEST)
+    try:
+        with open(mname) as f:
+            if json.load(f) == manifest:
+                logging.info('Asset manifest is up to date: %s', mname)
+                return
+    except (OSError, ValueError):
+        pass  # missing or broken, (re)write it
+
+    logging.info('Writing asset manifest: %s', mname)
+    tmpname = mname + '.tmp'
+    with open(tmpname, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    os.replace(tmpname, mname)  # readers never see a half-written manifest
+
+
+class AppLog:
+    # Buffers the log records of an app build, which runs concurrently with
+    # others, to have them printed in one go once the build is over
+    def __init__(self):
+        self.records = []
+
+    def info(self, msg, *args):
+        self.records.append((logging.INFO, msg, args))
+
+    def error(self, msg, *args):
+        self.records.append((logging.ERROR, msg, args))
+
+    def flush(self):
+        for level, msg, args in self.records:
+            logging.log(level, msg, *args)
+
+        self.records = []
+
+
+class AppBuildError(Exception):
+    pass
+
+
+class AppBuilder:
+    # Paketizes and copies statics/templates of apps in a thread pool. The
+    # first failure cancels the rest of the builds
+    def __init__(self, appsdir, appsoutdir, staticdst, tmpldst,
+                 paket_cmd_base, cache):
+        self.cache = cache
+        self.appsdir = appsdir
+        self.appsoutdir = appsoutdir
+        self.staticdst = staticdst
+        self.tmpldst = tmpldst
+        self.paket_cmd_base = paket_cmd_base
+
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+        self.procs = set()  # running subprocesses, terminated on cancel
+
+    def cancel(self):
+        self.cancelled.set()
+        with self.lock:
+            for proc in self.procs:
+                proc.terminate()
+
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise AppBuildError('Cancelled due to a previous failure')
+
+    def call(self, cmd, log):
+        log.info('Executing command "%s"', ' '.join(cmd))
+        with self.lock:
+            self.check_cancelled()
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT,
+                                    universal_newlines=True)
+            self.procs.add(proc)
+
+        try:
+            output, _ = proc.communicate()
+        finally:
+            with self.lock:
+                self.procs.discard(proc)
+
+        if output:
+            logf = log.error if proc.returncode else log.info
+            logf('%s', output.rstrip())
+
+        if proc.returncode:
+            raise AppBuildError(
+                'Command failed with code: {}'.format(proc.returncode))
+
+    def copytree(self, dname, what, srcdir, dstbase, log):
+        self.check_cancelled()
+        if not os.path.exists(srcdir):
+            log.info('No %s found for: %s', what, dname)
+            return
+
+        target = os.path.join(dstbase, dname)
+        if os.path.exists(target):
+            log.info('Deleting %s target for %s at %s', what, dname, target)
+            try:
+                shutil.rmtree(target)
+            except OSError:
+                log.error(traceback.format_exc())
+                raise AppBuildError('Error removing dir')
+
+        try:
+            log.info('copytree %s -> %s', srcdir, target)
+            shutil.copytree(srcdir, target)
+        except (OSError, shutil.Error):
+            log.error(traceback.format_exc())
+            raise AppBuildError('Error during {} copying'.format(what))
+
+    def input_key(self, fdname, paket_cmd):
+        # The key covers the tool flags/outputs and the contents of the app
+        # (which include app package, static files and templates)
+        h = hashlib.sha256()
+        h.update(json.dumps(paket_cmd).encode('utf-8'))
+        h.update(json.dumps([self.staticdst, self.tmpldst]).encode('utf-8'))
+        return hash_tree(fdname, h).hexdigest()
+
+    def __call__(self, dname, log):
+        # Builds a single app, returns the name of the generated vfs file and
+        # the input key of the build
+        self.check_cancelled()
+        fdname = os.path.join(self.appsdir, dname)
+        log.info('Paketizing: %s', fdname)
+        apptarget = os.path.join(fdname, APP_PKG)
+        log.info('Checking if app or package repo: %s', apptarget)
+        if os.path.exists(apptarget):
+            log.info('Apps has "app" ... paketizing subapp')
+            paket_cmd = self.paket_cmd_base + (
+                ['--vfspath', APP_PKG, os.path.join(fdname, APP_PKG)])
+        else:
+            log.info('Apps has no "app" ... paketizing complete')
+            paket_cmd = self.paket_cmd_base + [fdname]
+
+        filename = os.path.basename(fdname) + VFS_EXT
+        outfile = os.path.join(self.appsoutdir, filename)
+        log.info('output file for paket is: %s', outfile)
+        paket_cmd.append(outfile)
+
+        staticapp = os.path.join(fdname, 'static')
+        tmplapp = os.path.join(fdname, 'templates')
+
+        key = self.input_key(fdname, paket_cmd)
+        if self.cache.get('apps', dname) == key:
+            # outputs may have been removed since (--clean-output, manually)
+            outputs = [outfile]
+            if os.path.exists(staticapp):
+                outputs.append(os.path.join(self.staticdst, dname))
+            if os.path.exists(tmplapp):
+                outputs.append(os.path.join(self.tmpldst, dname))
+
+            if all(os.path.exists(x) for x in outputs):
+                log.info('App unchanged, reusing previous build: %s', dname)
+                return outfile, key
+
+        self.call(paket_cmd, log)
+
+        # Manage static files and put the templates in place
+        self.copytree(dname, 'static files', staticapp, self.staticdst, log)
+        self.copytree(dname, 'templates', tmplapp, self.tmpldst, log)
+        return outfile, key
+
+
+def build_apps(dnames, appsdir, appsoutdir, staticdst, tmpldst,
+               paket_cmd_base, jobs, cache):
+    # Builds the apps in dnames concurrently and returns the vfs files in the
+    # same order as dnames. Exits at the first failure
+    builder = AppBuilder(appsdir, appsoutdir, staticdst, tmpldst,
+                         paket_cmd_base, cache)
+    logs = {dname: AppLog() for dname in dnames}
+    logging.info('Building %d apps with %d jobs', len(dnames), jobs)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(builder, dname, logs[dname]): dname
+                   for dname in dnames}
+
+        results = {}
+        for future in concurrent.futures.as_completed(futures):
+            dname = futures[future]
+            try:
+                results[dname], key = future.result()
+            except concurrent.futures.CancelledError:
+                continue
+            except Exception as e:
+                logs[dname].flush()
+                logging.error('Build of app %s failed: %s', dname, e)
+                builder.cancel()
+                for f in futures:
+                    f.cancel()
+
+                executor.shutdown(wait=True)
+                cache.save()  # keep the successful builds
+                sys.exit(1)
+
+            logs[dname].flush()
+            cache.set('apps', dname, key)
+
+    return [results[dname] for dname in dnames]
+
+
+class TreeSync:
+    # Brings dst in line with src (skipping what ignorer says) copying only
+    # changed files and removing those which no longer exist in src. With a
+    # prev tree, dst is a new tree in which unchanged files are hardlinked
+    # from prev. With dry_run, things are only logged
+    def __init__(self, ignorer, skipdirs=(), checksum=False, dry_run=False):
+        self.ignorer = ignorer
+        self.skipdirs = set(skipdirs)  # (st_dev, st_ino) never to descend
+        self.checksum = checksum
+        self.dry_run = dry_run
+        self.copied = self.linked = self.unchanged = self.deleted = 0
+
+    def same(self, src, sst, dst):
+        # size and mtime (preserved by copy2) first, contents if asked for
+        if dst is None:
+            return False
+
+        try:
+            dst_st = os.stat(dst)
+        except FileNotFoundError:
+            return False
+
+        if dst_st.st_size != sst.st_size:
+            return False
+
+        if self.checksum:
+            return hash_file(src).digest() == hash_file(dst).digest()
+
+        return dst_st.st_mtime_ns == sst.st_mtime_ns
+
+    def act(self, what, *args):
+        # Logs the action and says if it has to be carried out
+        if self.dry_run:
+            logging.info('Would ' + what, *args)
+            return False
+
+        logging.debug(what.capitalize(), *args)
+        return True
+
+    def remove(self, path):
+        self.deleted += 1
+        if not self.act('remove from webpack: %s', path):
+            return
+
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+    def sync(self, src, dst, prev=None):
+        if not os.path.isdir(dst) and self.act('create dir: %s', dst):
+            os.makedirs(dst)
+
+        kept = set()
+        for entry in self.ignorer.scan(src):
+            sst = entry.stat()
+            if (sst.st_dev, sst.st_ino) in self.skipdirs:
+                continue
+
+            name = entry.name
+            kept.add(name)
+            sname, dname = entry.path, os.path.join(dst, name)
+            pname = None if prev is None else os.path.join(prev, name)
+            if entry.is_dir():
+                if os.path.lexists(dname) and not os.path.isdir(dname):
+                    self.remove(dname)
+
+                self.sync(sname, dname, pname)
+                continue
+
+            if os.path.isdir(dname) and not os.path.islink(dname):
+                self.remove(dname)
+
+            if prev is None and self.same(sname, sst, dname):
+                self.unchanged += 1
+            elif prev is not None and self.same(sname, sst, pname):
+                self.linked += 1
+                if self.act('link: %s -> %s', pname, dname):
+                    os.link(pname, dname)
+            else:
+                self.copied += 1
+                if self.act('copy: %s -> %s', sname, dname):
+                    shutil.copy2(sname, dname)
+
+        if os.path.isdir(dst):
+            for name in sorted(os.listdir(dst)):  # no longer in src
+                if name not in kept:
+                    self.remove(os.path.join(dst, name))
+
+    def report(self):
+        logging.info('Webpack: %d copied, %d linked, %d unchanged, %d removed',
+                     self.copied, self.linked, self.unchanged, self.deleted)
+        self.ignorer.report()
+
+
+def webpack_sync(rootdir, webdir, ignorer, checksum, dry_run):
+    # Incremental deployment into webdir, which may be under rootdir and has
+    # to exist to be recognized and not copied into itself
+    if not dry_run:
+        os.makedirs(webdir, exist_ok=True)
+
+    skipdirs = []
+    if os.path.exists(webdir):
+        webst = os.stat(webdir)
+        skipdirs.append((webst.st_dev, webst.st_ino))
+
+    tsync = TreeSync(ignorer, skipdirs, checksum, dry_run)
+    tsync.sync(rootdir, webdir)
+    tsync.report()
+
+
+def webpack_link(rootdir, webdir, ignorer, checksum, keep_releases, dry_run):
+    # Deployment into a new release under webdir/releases, hardlinking files
+    # unchanged with regards to the current release, and flipping the
+    # webdir/current symlink atomically to it once complete
+    relsdir = os.path.join(webdir, RELEASES_DIR)
+    current = os.path.join(webdir, CURRENT_LINK)
+    prev = os.path.realpath(current) if os.path.islink(current) else None
+    if prev is not None and not os.path.isdir(prev):
+        prev = None
+
+    relname = time.strftime('%Y%m%d-%H%M%S')
+    release = os.path.join(relsdir, relname)
+    n = 0
+    while os.path.exists(release):
+        n += 1
+        release = os.path.join(relsdir, '{}-{}'.format(relname, n))
+
+    logging.info('Creating release %s (previous: %s)', release, prev)
+    if not dry_run:
+        os.makedirs(relsdir, exist_ok=True)
+
+    skipdirs = []
+    if os.path.exists(webdir):
+        webst = os.stat(webdir)
+        skipdirs.append((webst.st_dev, webst.st_ino))
+
+    tsync = TreeSync(ignorer, skipdirs, checksum, dry_run)
+    tsync.sync(rootdir, release, prev)
+    tsync.report()
+    if dry_run:
+        return
+
+    # symlink in place with a relative target and atomic replacement
+    tmplink = current + '.tmp'
+    if os.path.lexists(tmplink):
+        os.remove(tmplink)
+
+    os.symlink(os.path.relpath(release, webdir), tmplink)
+    os.replace(tmplink, current)
+    logging.info('Current release is now: %s', release)
+
+    # Prune old releases, never the current one
+    releases = sorted(os.listdir(relsdir))
+    for old in releases[:max(0, len(releases) - max(1, keep_releases))]:
+        oldpath = os.path.join(relsdir, old)
+        if os.path.realpath(oldpath) != os.path.realpath(release):
+            logging.info('Removing old release: %s', oldpath)
+            shutil.rmtree(oldpath)
 
 
 def run(pargs=None):
@@ -149,7 +819,10 @@ def run(pargs=None):
             logging.error('Failed: %s', str(e))
             sys.exit(1)
 
+    cache = BuildCache(os.path.join(workdir, BUILD_CACHE), force=args.force)
+
     pkg_list = []  # needed for bundle initialization/creationg below
+    to_compress = []  # bundle and vfs files which get precompressed siblings
     if not args.init:
         if args.no_paketize:
             logging.info('Skipping paketization')
@@ -165,82 +838,14 @@ def run(pargs=None):
             tmpldst = os.path.join(tmpldir, APPS_DIR)
             staticdst = os.path.join(staticdir, APPS_DIR)
 
-            for dname in dnames:
-                fdname = os.path.join(appsdir, dname)
-                logging.info('Paketizing: %s', fdname)
-                apptarget = os.path.join(fdname, APP_PKG)
-                logging.info('Checking if app or package repo: %s', apptarget)
-                if os.path.exists(apptarget):
-                    logging.info('Apps has "app" ... paketizing subapp')
-                    paket_cmd = paket_cmd_base + (
-                        ['--vfspath', APP_PKG, os.path.join(fdname, APP_PKG)])
-                else:
-                    logging.info('Apps has no "app" ... paketizing complete')
-                    paket_cmd = paket_cmd_base + [fdname]
+            results = build_apps(
+                sorted(dnames), appsdir, appsoutdir, staticdst, tmpldst,
+                paket_cmd_base, max(1, args.jobs), cache)
 
-                filename = os.path.basename(fdname) + '.auto_vfs.js'
-                outfile = os.path.join(appsoutdir, filename)
+            # results come in the order of the sorted names: stable pkg_list
+            for outfile in results:
                 pkg_list += ['--auto-vfs', outfile]
-                logging.info('output file for paket is: %s', outfile)
-                paket_cmd.append(outfile)
-
-                logging.info('Executing command "%s"', ' '.join(paket_cmd))
-                ret = subprocess.call(paket_cmd)
-                if ret:
-                    logging.error('Command failed with code: %d', ret)
-                    sys.exit(1)
-
-                # Manage static files
-                logging.info('Managing static files for: %s', fdname)
-                staticapp = os.path.join(fdname, 'static')
-                if not os.path.exists(staticapp):
-                    logging.info('No static files found for: %s', dname)
-                    continue
-
-                statictarget = os.path.join(staticdst, dname)
-                if os.path.exists(statictarget):
-                    logging.info('Deleting static target for %s at %s',
-                                 dname, statictarget)
-                    try:
-                        shutil.rmtree(statictarget)
-                    except:
-                        logging.error('Error removing dir')
-                        logging.error(traceback.format_exc())
-                        sys.exit(1)
-                try:
-                    logging.info('copytree %s -> %s', staticapp, statictarget)
-                    shutil.copytree(staticapp, statictarget)
-                except:
-                    logging.error('Error during template copying')
-                    logging.error(traceback.format_exc())
-                    sys.exit(1)
-
-                # Template section
-                logging.info('Looking for templates for: %s', fdname)
-
-                # Now put the templates in place
-                tmplapp = os.path.join(fdname, 'templates')
-                if not os.path.exists(tmplapp):
-                    logging.info('No templates found for: %s', dname)
-                    continue
-
-                tmpltarget = os.path.join(tmpldst, dname)
-                if os.path.exists(tmpltarget):
-                    logging.info('Deleting template target for %s at %s',
-                                 dname, tmpltarget)
-                    try:
-                        shutil.rmtree(tmpltarget)
-                    except:
-                        logging.error('Error removing dir')
-                        logging.error(traceback.format_exc())
-                        sys.exit(1)
-                try:
-                    logging.info('copytree %s -> %s', tmplapp, tmpltarget)
-                    shutil.copytree(tmplapp, tmpltarget)
-                except:
-                    logging.error('Error during template copying')
-                    logging.error(traceback.format_exc())
-                    sys.exit(1)
+                to_compress.append(outfile)
 
     else:
         logging.info('Initializing. Skipping package paketization')
@@ -285,28 +890,65 @@ def run(pargs=None):
         ajs_name = os.path.join(outdir, args.bundle_name)
         bundle_cmd.append(ajs_name)
 
-        logging.info('Creating bundle with command: %s', ' '.join(bundle_cmd))
-        ret = subprocess.call(bundle_cmd)
-        if ret:
-            logging.error('Command failed with code: %d', ret)
-            sys.exit(1)
+        # The bundle depends on its flags and on the vfs files (optimization
+        # strips what the apps don't use)
+        h = hashlib.sha256(json.dumps(bundle_cmd).encode('utf-8'))
+        for vfsname in pkg_list[1::2]:  # pkg_list: ['--auto-vfs', name] * N
+            hash_file(vfsname, h)
+
+        key = h.hexdigest()
+        if cache.get('bundle', ajs_name) == key and os.path.exists(ajs_name):
+            logging.info('Bundle inputs unchanged, skipping: %s', ajs_name)
+        else:
+            logging.info('Creating bundle with command: %s',
+                         ' '.join(bundle_cmd))
+            ret = subprocess.call(bundle_cmd)
+            if ret:
+                logging.error('Command failed with code: %d', ret)
+                sys.exit(1)
+
+            cache.set('bundle', ajs_name, key)
+
+        to_compress.append(ajs_name)
+
+    cache.save()
+
+    if args.no_compress:
+        logging.info('Skipping generation of precompressed files')
+    else:
+        for cfile in to_compress:
+            try:
+                compress_file(cfile)
+            except OSError as e:
+                logging.error('Compression failed: %s', str(e))
+                sys.exit(1)
 
     if args.init:
         sys.exit(0)  # nothing else to do
 
+    if args.no_fingerprint:
+        logging.info('Skipping fingerprinting of assets')
+    else:
+        assets = []
+        ajs_name = os.path.join(outdir, args.bundle_name)
+        if os.path.exists(ajs_name):
+            assets.append(ajs_name)
+
+        # fingerprinted copies end in .<hash>.js and are not matched
+        for vfsname in sorted(os.listdir(appsoutdir)):
+            if vfsname.endswith(VFS_EXT):
+                assets.append(os.path.join(appsoutdir, vfsname))
+
+        try:
+            write_manifest(outdir, assets)
+        except OSError as e:
+            logging.error('Fingerprinting failed: %s', str(e))
+            sys.exit(1)
+
     # Webpacking if requested
     if args.webpack:
         logging.info('Webpacking')
         webdir = os.path.join(rootdir, args.webpack)
-        if os.path.exists(webdir):
-            logging.info('Webpack dir %s exists. Removing', webdir)
-            try:
-                shutil.rmtree(webdir)
-            except OSError as e:
-                logging.error('Failed: %s', str(e))
-                sys.exit(1)
-
-        # Note: copytree creates the output directory itself
 
         # read patterns from file if possible
         if args.web_ignore:
@@ -335,10 +977,16 @@ def run(pargs=None):
             skip_patterns = []
 
         # Create an Ignorer to skip some files
-        ignorer = Ignorer(rootdir, devdir, args.keep_dev, skip_patterns)
-        # Proceed to actual tree copying
+        ignorer = Ignorer(rootdir, devdir, args.keep_dev, skip_patterns,
+                          dry_run=args.dry_run)
+        # Proceed to actual tree copying (only changed files)
         try:
-            shutil.copytree(rootdir, webdir, ignore=ignorer)
+            if args.link:
+                webpack_link(rootdir, webdir, ignorer, args.checksum,
+                             args.keep_releases, args.dry_run)
+            else:
+                webpack_sync(rootdir, webdir, ignorer, args.checksum,
+                             args.dry_run)
         except:
             logging.error('Error during webpack copying')
             logging.error(traceback.format_exc())
@@ -371,11 +1019,29 @@ def parse_args(pargs=None, name=None):
                         help=('Keep dev directory contents in webpack'))
 
     pgroup.add_argument('--web-ignore', action='store',
-                        help=('Read patterns (unix-shell style) to ignore '
+                        help=('Read patterns (gitignore style) to ignore '
                               ' from the specified file'
                               '. If not specified, then a file named {}'
                               ' will be used if available'.format(WEBIGNORE)))
 
+    pgroup.add_argument('--link', action='store_true',
+                        help=('Deploy to a new release directory under'
+                              ' WEBPACK/{} hardlinking unchanged files and'
+                              ' atomically switch the WEBPACK/{} symlink to'
+                              ' it'.format(RELEASES_DIR, CURRENT_LINK)))
+
+    pgroup.add_argument('--keep-releases', action='store', type=int,
+                        default=3,
+                        help='Number of releases to keep with --link')
+
+    pgroup.add_argument('--dry-run', action='store_true',
+                        help=('List what webpacking would skip, copy, link'
+                              ' and remove without doing it'))
+
+    pgroup.add_argument('--checksum', action='store_true',
+                        help=('Compare contents and not only size and'
+                              ' modification time to detect changed files'))
+
     pgroup.add_argument('--web-debug', action='store_true',
                         help=('The default for webpacking is to generate a'
                               ' bundle with no debugging. Use this option to'
@@ -398,6 +1064,18 @@ def parse_args(pargs=None, name=None):
     pgroup.add_argument('--clean-output', action='store_true',
                         help='Remove apps dir under output before starting')
 
+    pgroup = parser.add_argument_group(title='Build Cache')
+    pgroup.add_argument('--force', action='store_true',
+                        help=('Rebuild apps and bundle even if their inputs'
+                              ' are unchanged according to the build cache'
+                              ' ({} in workdir)'.format(BUILD_CACHE)))
+
+    pgroup = parser.add_argument_group(title='Paketization')
+    pgroup.add_argument('--jobs', '-j', action='store', type=int,
+                        default=os.cpu_count() or 1,
+                        help=('Number of apps to paketize (including copying'
+                              ' of static files and templates) concurrently'))
+
     pgroup = parser.add_argument_group(title='Bundle Generation')
     pgroup.add_argument('--bundle-name', action='store', default=BUNDLE_NAME,
                         help='File Name for anpylar.js output')
@@ -414,6 +1092,15 @@ def parse_args(pargs=None, name=None):
     pgroup.add_argument('--no-paketize', action='store_true',
                         help='Skip paketization of apps')
 
+    pgroup.add_argument('--no-compress', action='store_true',
+                        help=('Skip generation of precompressed .gz/.br'
+                              ' siblings for bundle and vfs files'))
+
+    pgroup.add_argument('--no-fingerprint', action='store_true',
+                        help=('Skip generation of content-hashed copies of'
+                              ' bundle and vfs files and of the asset'
+                              ' manifest ({})'.format(MANIFEST)))
+
     pgroup = parser.add_mutually_exclusive_group()
     pgroup.add_argument('--quiet', '-q', action='store_true',
                         help='Remove output (errors will be reported)')
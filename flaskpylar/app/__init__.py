@@ -7,11 +7,15 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+import gc
 import uuid
 
-from flask import Flask, abort, redirect
+from flask import Flask, abort, redirect, session
 import jinja2
 
+from . import assets
+from .static_files import send_precompressed
+
 
 class Flask(Flask):
 
@@ -31,11 +35,44 @@ class Flask(Flask):
         super().register_blueprint(bp, *args, **kwargs)
         self.jinja_loader.loaders[1].mapping[bp.name] = bp.jinja_loader
 
+    # Deliver precompressed (.br, .gz) versions of static files if available
+    def send_static_file(self, filename):
+        if not self.has_static_folder:
+            raise RuntimeError('No static folder for this object')
+
+        if not assets.is_fingerprinted(filename):
+            cache_timeout = self.get_send_file_max_age(filename)
+            return send_precompressed(self.static_folder, filename,
+                                      cache_timeout=cache_timeout)
+
+        # content-hashed name: the file can be cached forever
+        max_age = self.config['FLASKPYLAR_IMMUTABLE_MAX_AGE']
+        resp = send_precompressed(self.static_folder, filename,
+                                  cache_timeout=max_age)
+        resp.headers['Cache-Control'] = \
+            'public, max-age={}, immutable'.format(max_age)
+        return resp
+
     # Doing things just before run, allows us to have app declared at module
     # level and modifiy the config (TESTING True/False) with the definitions in
     # the blueprints and routes here having access to the modified
     # configuration (from run.py)
     def run(self, *args, **kwargs):
+        self.setup()
+
+        # Now delegate to original Flask.run
+        super().run(*args, **kwargs)
+
+    _is_setup = False
+
+    # Registers routes and blueprints (once). Also usable by anything driving
+    # the app without calling run (benchmarks for example)
+    def setup(self):
+        if self._is_setup:
+            return
+
+        self._is_setup = True
+
         # Avoid this pestering browser request from getting to the blueprints
         # should actually be handled by web-server
         @app.route('/favicon.ico')
@@ -48,6 +85,30 @@ class Flask(Flask):
         def index(path=None):
             return redirect('/pyroes')
 
+        # Api requests with a bearer token skip the session cookie
+        if app.config['FLASKPYLAR_API_TOKENS']:
+            from .tokens import TokenSessionInterface
+            app.session_interface = TokenSessionInterface(prefix='/api/')
+
+        # Compress dynamic responses (api, rendered templates)
+        if app.config['FLASKPYLAR_COMPRESS']:
+            from .compress import CompressMiddleware
+            app.wsgi_app = CompressMiddleware(app.wsgi_app, app.config)
+
+        # Opt-in profiling of single requests (token or sampling)
+        if app.config['FLASKPYLAR_PROFILE']:
+            from . import profiling
+            profiling.install(app)
+
+        # Outermost: timing includes compression, bytes are those sent
+        if app.config['FLASKPYLAR_METRICS']:
+            from . import metrics
+            metrics.install(app)
+
+        if app.config['FLASKPYLAR_ACCESS_LOG']:
+            from . import access_log
+            access_log.install(app)
+
         # Load modules which define routes
         from . import api
         from . import app_loader
@@ -60,6 +121,10 @@ class Flask(Flask):
                             _login_to=True,
                             url_prefix='/users')
 
+        # Fingerprinted assets are only generated for the packed application
+        if not app.config['TESTING']:
+            assets.load_manifest(app)
+
         # Hint where to go after login
         app.config['LOGIN_TO'] = {'next': '/pyroes'}
 
@@ -68,14 +133,38 @@ class Flask(Flask):
                             _login_required=True,
                             _local_template=True)
 
-        # Now delegate to original Flask.run
-        super().run(*args, **kwargs)
+    def template_names(self):
+        '''Names of the templates of the app and of the blueprints'''
+        apploader, bploaders = self.jinja_loader.loaders
+        names = list(apploader.list_templates())
+        for prefix, loader in sorted(bploaders.mapping.items()):
+            if loader is not None:  # blueprint without templates
+                names.extend(prefix + bploaders.delimiter + name
+                             for name in loader.list_templates())
+
+        return names
+
+    # Does what the first requests would otherwise do in each worker process
+    def warmup(self):
+        self.url_map.update()  # sorts the rules
+
+        for name in self.template_names():
+            self.jinja_env.get_template(name)  # compiled and cached
+
+        from .passwords import verifier
+        context = verifier.context
+        for scheme in context.schemes():
+            handler = context.handler(scheme)
+            if hasattr(handler, 'get_backend'):
+                handler.get_backend()  # loads the hashing backend
 
 
 # Create an configure the app
 app = Flask(__name__)
 app.config.from_object('config_flaskpylar')
 app.config.from_object('config')
+# Overrides for a deployment (or a benchmark) from a file
+app.config.from_envvar('FLASKPYLAR_SETTINGS', silent=True)
 
 
 # Define a CSRF Token Generator for Forms
@@ -86,3 +175,31 @@ def generate_csrf_token():
 
 
 app.jinja_env.globals['csrf_token'] = generate_csrf_token
+# url_for('static', ...) resolves to the fingerprinted names of the manifest
+app.jinja_env.globals['url_for'] = assets.url_for
+
+
+def create_app(testing=None, warmup=True, freeze=True):
+    '''
+    Returns the app ready to serve: routes and blueprints registered and, with
+    ``warmup``, templates compiled and password hashing loaded. Meant to be
+    called in the master process of a prefork server, before the workers are
+    forked, which then share that memory (copy-on-write). ``testing`` (if not
+    None) sets ``TESTING``.
+
+    With ``freeze`` (python >= 3.7) the objects made so far are left out of
+    garbage collection, which would otherwise write to them and copy their
+    memory pages into each worker
+    '''
+    if testing is not None:
+        app.config['TESTING'] = testing
+
+    app.setup()
+    if warmup:
+        app.warmup()
+
+    if freeze and hasattr(gc, 'freeze'):
+        gc.collect()
+        gc.freeze()
+
+    return app
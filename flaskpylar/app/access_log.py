@@ -0,0 +1,265 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+from flask import request
+
+LOGGER = 'flaskpylar.access'
+EXTENSION = 'flaskpylar_access_log'  # key in app.extensions
+ROUTE_KEY = 'flaskpylar.route'  # (blueprint, endpoint), see mark_routes
+
+# Fields which can be selected (FLASKPYLAR_ACCESS_LOG_FIELDS)
+FIELDS = ('time', 'pid', 'remote', 'method', 'path', 'query', 'blueprint',
+          'endpoint', 'status', 'bytes', 'duration', 'agent')
+
+
+class JsonFormatter(logging.Formatter):
+    '''Formats records whose msg is a dict as a compact json line'''
+    def format(self, record):
+        return json.dumps(record.msg, separators=(',', ':'), sort_keys=True)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    '''
+    QueueHandler which never blocks: records are dropped (and counted) if the
+    queue is full. Records are queued as they are, to be formatted by the
+    thread of the listener
+    '''
+    dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class AccessLog(object):
+    '''
+    Emits one json line per request (selected ``fields``) to the logger
+    ``flaskpylar.access``, for a fraction (``sample``) of the requests and
+    for all those ending with a server error. The output (``filename`` or
+    stderr) is written by a background thread (one per worker process), fed
+    through a bounded queue of ``maxqueue`` records
+    '''
+    def __init__(self, fields, sample=1.0, filename=None, maxqueue=10000):
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError('Unknown access log fields: {}'.format(
+                ', '.join(sorted(unknown))))
+
+        self.fields = tuple(fields)
+        self.sample = sample
+        self.filename = filename
+        self.maxqueue = maxqueue
+
+        self.handler = None
+        self._listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        self.logger = logging.getLogger(LOGGER)
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+
+    def _start(self):
+        # Threads don't survive a fork: each worker process starts its own
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            if self.handler is not None:
+                self.logger.removeHandler(self.handler)
+
+            if self.filename:
+                out = logging.FileHandler(self.filename)
+            else:
+                out = logging.StreamHandler(sys.stderr)
+
+            out.setFormatter(JsonFormatter())
+            self.handler = DroppingQueueHandler(queue.Queue(self.maxqueue))
+            self._listener = logging.handlers.QueueListener(
+                self.handler.queue, out)
+            self._listener.start()
+            self.logger.addHandler(self.handler)
+            self._pid = os.getpid()
+
+    def stop(self):
+        '''Writes the queued records and stops the thread of the listener'''
+        with self._lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+                self.logger.removeHandler(self.handler)
+
+            self._listener = self._pid = None
+
+    def log(self, environ, status, nbytes, duration):
+        if status < 500 and random.random() >= self.sample:
+            return
+
+        if self._pid != os.getpid():
+            self._start()
+
+        path = environ.get('SCRIPT_NAME', '') + environ.get('PATH_INFO', '')
+        values = {
+            'time': round(time.time(), 3),
+            'pid': self._pid,
+            'remote': environ.get('REMOTE_ADDR'),
+            'method': environ.get('REQUEST_METHOD'),
+            'path': path,
+            'query': environ.get('QUERY_STRING', ''),
+            'blueprint': None,
+            'endpoint': None,
+            'status': status,
+            'bytes': nbytes,
+            'duration': round(duration * 1000.0, 3),  # ms
+            'agent': environ.get('HTTP_USER_AGENT'),
+        }
+        values['blueprint'], values['endpoint'] = \
+            environ.get(ROUTE_KEY, (None, None))
+
+        self.logger.info({k: values[k] for k in self.fields})
+
+
+def file_wrappers(environ):
+    '''
+    Makes the file wrappers of the server (``wsgi.file_wrapper``) created
+    for the request recognizable. Returns a function telling if a result is
+    one of them, which middlewares have to return untouched: the server
+    sends them with sendfile only if it gets the very same object
+    '''
+    wrapper = environ.get('wsgi.file_wrapper')
+    if wrapper is None:
+        return lambda result: False
+
+    made = []
+
+    def file_wrapper(*args, **kwargs):
+        result = wrapper(*args, **kwargs)
+        made.append(result)
+        return result
+
+    environ['wsgi.file_wrapper'] = file_wrapper
+    return lambda result: any(result is x for x in made)
+
+
+class CountedBody(object):
+    '''
+    Iterable over the response body (``result`` of a wsgi app) which counts
+    the bytes and calls ``done(nbytes)`` when closed (after the body has been
+    sent)
+    '''
+    def __init__(self, result, done):
+        self._result = result
+        self._done = done
+        self.nbytes = 0
+
+    def __iter__(self):
+        for data in self._result:
+            self.nbytes += len(data)
+            yield data
+
+    def close(self):
+        try:
+            if hasattr(self._result, 'close'):
+                self._result.close()
+        finally:
+            self._done(self.nbytes)
+
+
+class MeasureMiddleware(object):
+    '''
+    Measures each request of the wrapped wsgi app, from the call until the
+    response body has been sent, and passes it to ``sink.log(environ, status,
+    nbytes, duration)`` (an ``AccessLog`` or ``metrics.Metrics``).
+
+    File wrappers (static files) go out untouched, for the server to send
+    them with sendfile: their bytes are taken from ``Content-Length`` and the
+    time ends when the app returns them
+    '''
+    def __init__(self, app, sink):
+        self._app = app
+        self.sink = sink
+
+    def __call__(self, environ, start_response):
+        t0 = time.perf_counter()
+        response = [500, None]  # status, content length
+        is_file_wrapper = file_wrappers(environ)
+
+        def _start_response(status, headers, exc_info=None):
+            response[0] = int(status.split(' ', 1)[0])
+            response[1] = next((v for k, v in headers
+                                if k.lower() == 'content-length'), None)
+            return start_response(status, headers, exc_info)
+
+        def done(nbytes):
+            self.sink.log(environ, response[0], nbytes,
+                          time.perf_counter() - t0)
+
+        try:
+            result = self._app(environ, _start_response)
+        except Exception:
+            done(0)
+            raise
+
+        if is_file_wrapper(result):
+            try:
+                nbytes = int(response[1] or 0)
+            except ValueError:
+                nbytes = 0
+
+            done(nbytes)
+            return result
+
+        return CountedBody(result, done)
+
+
+def _mark_route():
+    request.environ[ROUTE_KEY] = (request.blueprint, request.endpoint)
+
+
+def mark_routes(app):
+    '''
+    Makes blueprint and endpoint of the requests to ``app`` available to wsgi
+    middlewares (which don't see flask's url matching) in the environ
+    '''
+    if _mark_route not in app.before_request_funcs.get(None, ()):
+        app.before_request(_mark_route)
+
+
+def install(app):
+    '''
+    Wraps the wsgi app of the flask ``app`` with an access log configured
+    with ``FLASKPYLAR_ACCESS_LOG_*``. Returns the ``AccessLog``
+    '''
+    config = app.config
+    access_log = AccessLog(
+        config['FLASKPYLAR_ACCESS_LOG_FIELDS'],
+        sample=config['FLASKPYLAR_ACCESS_LOG_SAMPLE'],
+        filename=config['FLASKPYLAR_ACCESS_LOG_FILE'],
+        maxqueue=config['FLASKPYLAR_ACCESS_LOG_QUEUE'])
+
+    app.extensions[EXTENSION] = access_log
+    mark_routes(app)
+    app.wsgi_app = MeasureMiddleware(app.wsgi_app, access_log)
+    atexit.register(access_log.stop)  # write what is still queued
+    return access_log
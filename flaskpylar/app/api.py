@@ -13,11 +13,16 @@ from flask import abort, jsonify, request, Blueprint
 from flask_login import current_user, login_required, login_user, logout_user
 
 
-from passlib.apps import custom_app_context as pwd_context
-
 from . import app
+from . import tokens
+from . passwords import VerifierBusy
 from . user_management import User
 from . import pyroes_management
+from .metrics import phase
+from .pyroes_store import FIELDS
+from .response_cache import JsonResponseCache
+from .streams import (NDJSON_MIMETYPE, iter_json_array, iter_ndjson,
+                      stream_ndjson)
 
 mod = Blueprint(
     'api',
@@ -25,13 +30,18 @@ mod = Blueprint(
     url_prefix='/api',
 )
 
+# Encoded pages of pyroes per user, renewed when the version of the data
+# changes
+_pyroes_cache = JsonResponseCache(app.config['FLASKPYLAR_RESPONSE_CACHE_SIZE'])
+
 
 @mod.route('/login', methods=['POST'])
 def login():
     app.logger.debug('LOGINTO is: %s', str(app.config.get('LOGIN_TO', {})))
     if current_user.is_authenticated:
-        l_to = app.config.get('LOGIN_TO', {}).copy()
-        return urlencode(list(l_to.items()))
+        # no new token: it is only issued after checking the password, else
+        # a token could renew itself forever
+        return _logged_in(current_user, token=False)
 
     fdata = request.form
     app.logger.debug('fdata is: %s', fdata)
@@ -44,12 +54,30 @@ def login():
         return abort(401)  # username doesn't exist
 
     password = fdata.get('password', '')
-    if not user.check_password(password):
+    try:
+        verified = user.check_password(password)
+    except VerifierBusy:
+        # too many logins being verified, let the client retry later
+        retry = str(app.config['FLASKPYLAR_PWD_RETRY'])
+        return '', 503, {'Retry-After': retry}
+
+    if not verified:
         return abort(401)  # password failed
 
     login_user(user)  # remember=fdata.get('remember_me', False))
+    return _logged_in(user)
+
+
+def _logged_in(user, token=True):
+    # Where to go after login and (token mode) a bearer token for the api
     l_to = app.config.get('LOGIN_TO', {}).copy()
-    return urlencode(list(l_to.items()))
+    headers = {}
+    if token and app.config['FLASKPYLAR_API_TOKENS']:
+        token = tokens.make_token(app.secret_key, user.get_id(),
+                                  app.config['FLASKPYLAR_API_TOKEN_TTL'])
+        headers[app.config['FLASKPYLAR_API_TOKEN_HEADER']] = token
+
+    return urlencode(list(l_to.items())), 200, headers
 
 
 @mod.route('/logged', methods=['POST, GET'])
@@ -66,11 +94,162 @@ def logout():
     return ''  # 200 OK
 
 
+def _page_args(args):
+    # after (cursor), limit and fields from the query string. ValueError if
+    # they don't make sense
+    after = args.get('cursor')
+    if after is not None:
+        after = int(after)
+
+    limit = int(args.get('limit', app.config['FLASKPYLAR_PYROES_PAGE']))
+    if not 0 < limit <= app.config['FLASKPYLAR_PYROES_MAX_PAGE']:
+        raise ValueError('limit out of range')
+
+    return after, limit, _fields_arg(args)
+
+
+def _fields_arg(args):
+    # comma separated fields from the query string (default: all)
+    fields = args.get('fields')
+    if fields is None:
+        return FIELDS
+
+    fields = tuple(f for f in fields.split(',') if f)
+    if not fields or any(f not in FIELDS for f in fields):
+        raise ValueError('unknown fields')
+
+    return fields
+
+
 @mod.route('/pyroes/')
 @mod.route('/pyroes/list')
 @login_required
 def plist():
-    return jsonify(pyroes_management.get_pyroes(current_user.id))
+    '''
+    A page of pyroes as a json list. Query args: ``limit``, ``fields``
+    (comma separated) and ``cursor``, taken from the ``X-Next-Cursor`` header
+    (also in ``Link``) of the previous page, which is absent after the last
+    '''
+    try:
+        after, limit, fields = _page_args(request.args)
+    except ValueError:
+        return abort(400)
+
+    uid = current_user.id
+    path = request.script_root + request.path
+    loader = _page_loader(path, uid, after, limit, fields)
+    key = (uid, after, limit, fields)
+    return _pyroes_cache.send(key, pyroes_management.get_version(uid), loader)
+
+
+def _page_loader(path, uid, after, limit, fields):
+    # loader for _pyroes_cache: the page and the headers pointing to the next
+    def loader():
+        pyroes, nxt = pyroes_management.get_pyroes(uid, after=after,
+                                                   limit=limit, fields=fields)
+        headers = {}
+        if nxt is not None:
+            headers['X-Next-Cursor'] = str(nxt)
+            qs = urlencode([('cursor', nxt), ('limit', limit),
+                            ('fields', ','.join(fields))])
+            headers['Link'] = '<{}?{}>; rel="next"'.format(path, qs)
+
+        return pyroes, headers
+
+    return loader
+
+
+def _search_args(args):
+    # q, limit and fields from the query string. ValueError if they don't
+    # make sense
+    limit = int(args.get('limit', app.config['FLASKPYLAR_SEARCH_LIMIT']))
+    if not 0 < limit <= app.config['FLASKPYLAR_PYROES_MAX_PAGE']:
+        raise ValueError('limit out of range')
+
+    return args.get('q', ''), limit, _fields_arg(args)
+
+
+@mod.route('/pyroes/search')
+@login_required
+def psearch():
+    '''
+    Pyroes with names having words starting with those of the query, as a
+    json list. Query args: ``q``, ``limit`` and ``fields``
+    '''
+    try:
+        query, limit, fields = _search_args(request.args)
+    except ValueError:
+        return abort(400)
+
+    pyroes = pyroes_management.search_pyroes(current_user.id, query,
+                                             limit=limit, fields=fields)
+    with phase('serialize'):
+        return jsonify(pyroes)
+
+
+@mod.route('/pyroes/export')
+@login_required
+def pexport():
+    '''
+    All pyroes of the user as NDJSON (one per line), streamed in batches
+    from the store. Query args: ``fields``
+    '''
+    try:
+        fields = _fields_arg(request.args)
+    except ValueError:
+        return abort(400)
+
+    batches = pyroes_management.iter_pyroes(
+        current_user.id, fields=fields,
+        batch=app.config['FLASKPYLAR_EXPORT_BATCH'])
+    return stream_ndjson(batches, level=app.config['FLASKPYLAR_EXPORT_GZIP'])
+
+
+@mod.route('/pyroes/bulk', methods=['POST'])
+@login_required
+def pbulk():
+    '''
+    Adds the pyroes of the body, a json array or NDJSON (by Content-Type),
+    which is parsed as it is read and written in batches. Returns a summary
+    per batch. If the body is not valid json the batches written before the
+    error are kept and 400 is returned with the summary and the error.
+
+    With a store which is not shared (``memory``) and several worker
+    processes the pyroes would only be seen by the worker taking the import:
+    409 is returned and nothing is written
+    '''
+    if not pyroes_management.writes_shared():
+        return jsonify({
+            'error': 'the pyroes store is not shared by the worker processes',
+        }), 409
+
+    if request.mimetype == 'application/json':
+        pyroes = iter_json_array(request.stream)
+    elif request.mimetype == NDJSON_MIMETYPE:
+        pyroes = iter_ndjson(request.stream)
+    else:
+        return abort(415)
+
+    batches, status, error = [], 200, None
+    try:
+        with phase('data'):  # parsing the body, validating and writing
+            for summary in pyroes_management.import_pyroes(
+                    current_user.id, pyroes,
+                    batch=app.config['FLASKPYLAR_BULK_BATCH']):
+                batches.append(summary)
+    except ValueError as e:  # invalid json
+        status, error = 400, str(e)
+
+    result = {
+        'batches': batches,
+        'written': sum(b['written'] for b in batches),
+        'rejected': sum(b['rejected'] for b in batches),
+    }
+    if error is not None:
+        result['error'] = error
+
+    with phase('serialize'):
+        return jsonify(result), status
 
 
 app.register_blueprint(mod)
@@ -0,0 +1,79 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from flask import json
+
+from . import api
+from . import compress
+from . import pyroes_management
+
+# async variants of the read views of api.py, served by asgi.AsgiApp for
+# requests authenticated with a bearer token. Views get the asgi app (to run
+# blocking calls in its threads with ``run``), the request and the uid and
+# return (status, headers, body)
+
+
+async def plist(asgi, req, uid):
+    '''See api.plist'''
+    try:
+        after, limit, fields = api._page_args(req.args)
+    except ValueError:
+        return 400, [], b''
+
+    version = await asgi.run(pyroes_management.get_version, uid)
+    loader = api._page_loader(req.path, uid, after, limit, fields)
+    key = (uid, after, limit, fields)
+    entry = await asgi.run(api._pyroes_cache.get, key, version, loader)
+    config = asgi.app.config
+    not_modified, encoding, headers = compress.negotiate_cached(
+        entry.body, 'application/json', entry.etag, req.accept_encodings,
+        req.if_none_match, config)
+
+    headers += [('Content-Type', 'application/json'),
+                ('Cache-Control', 'private, no-cache')]
+    headers += list(entry.headers.items())
+    if not_modified:
+        return 304, headers, b''
+
+    body = await asgi.run(compress.encode, entry.body, entry.encoded,
+                          encoding, config)
+    return 200, headers, body
+
+
+async def psearch(asgi, req, uid):
+    '''See api.psearch'''
+    try:
+        query, limit, fields = api._search_args(req.args)
+    except ValueError:
+        return 400, [], b''
+
+    def search():
+        pyroes = pyroes_management.search_pyroes(uid, query, limit=limit,
+                                                 fields=fields)
+        return json.dumps(pyroes).encode('utf-8')
+
+    body = await asgi.run(search)
+    headers = [('Content-Type', 'application/json')]
+    config = asgi.app.config
+    encoding = compress.accepted_encoding(
+        'application/json', len(body), req.accept_encodings, config)
+    if encoding is not None:  # like the wsgi app with CompressMiddleware
+        body = await asgi.run(compress.compress, body, encoding, config)
+        headers += [('Content-Encoding', encoding),
+                    ('Vary', 'Accept-Encoding')]
+
+    return 200, headers, body
+
+
+_prefix = api.mod.url_prefix
+routes = {
+    ('GET', _prefix + '/pyroes/'): plist,
+    ('GET', _prefix + '/pyroes/list'): plist,
+    ('GET', _prefix + '/pyroes/search'): psearch,
+}
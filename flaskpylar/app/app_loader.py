@@ -10,13 +10,37 @@ from __future__ import (absolute_import, division, print_function,
 import os.path
 from urllib.parse import urlencode
 
-from flask import (Blueprint, redirect, render_template, request,
-                   send_from_directory, url_for, abort)
+from flask import (Blueprint, jsonify, redirect, render_template,
+                   request, safe_join, url_for, abort)
 
 import flask_login
 from flask_login import current_user
 
-from . import app
+from . import app, generate_csrf_token
+from .import_cache import ImportCache
+from .metrics import phase
+from .module_bundle import ModuleBundler, valid_modname
+from .module_index import ModuleIndex
+from .page_cache import PageCache
+from .static_files import send_precompressed
+
+# Imports served during testing, shared by all blueprints
+import_cache = ImportCache(app.config['FLASKPYLAR_IMPORT_CACHE_BYTES'])
+# Index of existing files in the apps dir (per dir) to answer misses cheaply
+module_indexes = {}
+# Rendered index pages, shared by all blueprints
+page_cache = PageCache(app, generate_csrf_token)
+
+
+class Blueprint(Blueprint):
+    # Deliver precompressed (.br, .gz) versions of static files if available
+    def send_static_file(self, filename):
+        if not self.has_static_folder:
+            raise RuntimeError('No static folder for this object')
+
+        cache_timeout = self.get_send_file_max_age(filename)
+        return send_precompressed(self.static_folder, filename,
+                                  cache_timeout=cache_timeout)
 
 
 def load_app(
@@ -73,7 +97,33 @@ def load_app(
     if app.config['TESTING']:
         @mod.route('/bpstatic/<filename>')
         def bpstatic(filename):
-            return send_from_directory(dev_f, filename)
+            return send_precompressed(dev_f, filename)
+
+        # All modules reachable from the root module (default: the app) in a
+        # single vfs file, to avoid brython's one request per import
+        bundler = ModuleBundler(base_folder, app.config['FLASKPYLAR_APP_PKG'])
+
+        @mod.route('/_modules')
+        @login_required
+        def modules():
+            root = request.args.get('root', app.config['FLASKPYLAR_APP_PKG'])
+            if not valid_modname(root):
+                abort(404)
+
+            return bundler.send(bpname, root)
+
+        if base_folder not in module_indexes:
+            module_indexes[base_folder] = ModuleIndex(
+                base_folder, app.config['FLASKPYLAR_MODULE_INDEX_INTERVAL'])
+
+        module_index = module_indexes[base_folder]
+
+        # Manifest of importable modules, to let the client skip probes
+        @mod.route('/_modules.json')
+        @login_required
+        def modules_manifest():
+            app_pkg = app.config['FLASKPYLAR_APP_PKG']
+            return jsonify(modules=module_index.modules(bpname, app_pkg))
 
     @mod.route('/')
     @mod.route('/<path:path>')
@@ -95,7 +145,11 @@ def load_app(
         if path is None:  # simplest case, / called ... calling for index
             # use ".index.html" for custom template in blueprint folder
             app.logger.debug('kwargs is: %s', str(kwargs))
-            return render_template(index_name, **kwargs)
+            with phase('render'):
+                if app.config['FLASKPYLAR_PAGE_CACHE']:
+                    return page_cache.send(index_name, kwargs)
+
+                return render_template(index_name, **kwargs)
 
         if not app.config['TESTING']:  # return imports only during testing
             abort(404)
@@ -112,11 +166,25 @@ def load_app(
             # inside app, add blueprint name
             # ppath = os.path.join(mod.static_folder, bpname)
             ppath = os.path.join(base_folder, bpname)
+            relpath = bpname + '/' + path
         else:  # outside app, return at static folder level
             # ppath = mod.static_folder
             ppath = base_folder
+            relpath = path
+
+        # brython probes several candidates per import: answer the misses
+        # from the index without going to the filesystem
+        if not module_index.exists(relpath):
+            return '', 404
+
+        # simply return the file (cached in memory, 304 if not modified).
+        # The "v" cache-buster changes if the file may have changed
+        max_age = app.config['FLASKPYLAR_IMPORT_MAX_AGE']
+        resp = import_cache.send(safe_join(ppath, path), max_age=max_age)
+        if resp is None:
+            abort(404)
 
-        return send_from_directory(ppath, path)  # simply return the file
+        return resp
 
     # Blueprint and routes created, register it and return it
     app.register_blueprint(mod)
@@ -0,0 +1,275 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import asyncio
+import concurrent.futures
+import functools
+import sys
+import time
+
+from werkzeug.http import parse_accept_header, parse_etags
+from werkzeug.urls import url_decode
+
+from . import tokens
+from .access_log import ROUTE_KEY
+
+
+class AsgiRequest(object):
+    '''The parts of an ASGI http request used by the async views'''
+    def __init__(self, scope):
+        self.scope = scope
+        self.method = scope['method']
+        self.path = scope.get('root_path', '') + scope['path']
+        self.args = url_decode(scope.get('query_string', b''))
+        self.headers = {}
+        for k, v in scope['headers']:
+            k, v = k.decode('latin-1').lower(), v.decode('latin-1')
+            if k in self.headers:
+                v = self.headers[k] + ',' + v
+
+            self.headers[k] = v
+
+        self.if_none_match = parse_etags(self.headers.get('if-none-match'))
+        self.accept_encodings = parse_accept_header(
+            self.headers.get('accept-encoding'))
+
+
+class BodyReader(object):
+    '''
+    File-like ``wsgi.input`` pulling the request body from the ASGI receive
+    channel. Used from the threads running the wsgi app
+    '''
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buf = b''
+        self._more = True
+
+    def _pull(self):
+        fut = asyncio.run_coroutine_threadsafe(self._receive(), self._loop)
+        msg = fut.result()
+        if msg['type'] != 'http.request':  # http.disconnect
+            self._more = False
+            return
+
+        self._buf += msg.get('body', b'')
+        self._more = msg.get('more_body', False)
+
+    def read(self, size=-1):
+        while self._more and (size is None or size < 0 or
+                              len(self._buf) < size):
+            self._pull()
+
+        if size is None or size < 0:
+            size = len(self._buf)
+
+        data, self._buf = self._buf[:size], self._buf[size:]
+        return data
+
+    def readline(self, size=-1):
+        while self._more and b'\n' not in self._buf and \
+                (size is None or size < 0 or len(self._buf) < size):
+            self._pull()
+
+        end = self._buf.find(b'\n') + 1 or len(self._buf)
+        if size is not None and size >= 0:
+            end = min(end, size)
+
+        data, self._buf = self._buf[:end], self._buf[end:]
+        return data
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                break
+            yield line
+
+
+class AsgiApp(object):
+    '''
+    ASGI application for the flask app. Requests to the views of
+    ``api_async.routes`` authenticated with a bearer token are served by the
+    async views, which run blocking calls (store, serialization) in a pool of
+    threads. Everything else (including sessions with cookies and logins,
+    whose hashing happens in the process pool of passwords.verifier) is
+    delegated to the wsgi app, run in the same pool, streaming request and
+    response bodies.
+
+    The requests served by the async views go to the metrics and the access
+    log of the wsgi app too. Those carrying a profile trigger token are
+    delegated to the wsgi app, to be profiled (sampling only covers the
+    wsgi app)
+    '''
+    def __init__(self, app, threads=None):
+        self.app = app
+        app.setup()
+
+        from . import api_async
+        self.routes = api_async.routes
+
+        from . import access_log, metrics, profiling
+        sinks = (app.extensions.get(metrics.EXTENSION),
+                 app.extensions.get(access_log.EXTENSION))
+        self.sinks = [sink for sink in sinks if sink is not None]
+        self.profiler = app.extensions.get(profiling.EXTENSION)
+
+        if threads is None:
+            threads = app.config['FLASKPYLAR_ASGI_THREADS']
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(threads)
+
+    async def run(self, func, *args, **kwargs):
+        '''Runs the blocking ``func`` in the pool of threads'''
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+
+        if scope['type'] != 'http':
+            return  # no websockets
+
+        view = self.routes.get((scope['method'], scope['path']))
+        if view is not None:
+            req = AsgiRequest(scope)
+            uid = self._token_uid(req)
+            environ = None
+            if uid is not None and (self.sinks or self.profiler is not None):
+                environ = self._environ(scope, None)
+                # as marked by the wsgi app: same endpoints as the views
+                environ[ROUTE_KEY] = ('api', 'api.' + view.__name__)
+
+            if uid is not None and (self.profiler is None or
+                                    not self.profiler.triggered(environ)):
+                t0 = time.perf_counter()
+                status, headers, body = await view(self, req, uid)
+                await self._respond(send, status, headers, body)
+                for sink in self.sinks:
+                    sink.log(environ, status, len(body),
+                             time.perf_counter() - t0)
+                return
+
+        await self._wsgi(scope, receive, send)
+
+    def _token_uid(self, req):
+        auth = req.headers.get('authorization', '')
+        scheme, _, token = auth.partition(' ')
+        if scheme.lower() != 'bearer' or not token:
+            return None
+
+        return tokens.load_token(self.app.secret_key, token.strip())
+
+    @staticmethod
+    def _headers(headers):
+        return [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                for k, v in headers]
+
+    async def _respond(self, send, status, headers, body):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': self._headers(headers),
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            msg = await receive()
+            if msg['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif msg['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _environ(self, scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        # PEP 3333: native strings with the bytes of the path as latin-1
+        path = scope['path'].encode('utf-8').decode('latin-1')
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            'PATH_INFO': path,
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': str(server[0]),
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+            'REMOTE_ADDR': client[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.input_terminated': True,  # the reader knows the end
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for k, v in scope['headers']:
+            k = k.decode('latin-1').upper().replace('-', '_')
+            v = v.decode('latin-1')
+            if k not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                k = 'HTTP_' + k
+
+            if k in environ:
+                v = environ[k] + ',' + v
+
+            environ[k] = v
+
+        return environ
+
+    async def _wsgi(self, scope, receive, send):
+        loop = asyncio.get_event_loop()
+        environ = self._environ(scope, BodyReader(receive, loop))
+        await loop.run_in_executor(self.executor, self._call_wsgi, environ,
+                                   send, loop)
+
+    def _call_wsgi(self, environ, send, loop):
+        # Runs in a thread: messages are sent through the event loop
+        def sync_send(msg):
+            asyncio.run_coroutine_threadsafe(send(msg), loop).result()
+
+        response = {}  # status/headers until sent
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and response.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = self._headers(headers)
+            return write
+
+        def start():
+            if not response.get('sent'):
+                response['sent'] = True
+                sync_send({
+                    'type': 'http.response.start',
+                    'status': response['status'],
+                    'headers': response['headers'],
+                })
+
+        def write(data):
+            if data:
+                start()
+                sync_send({'type': 'http.response.body', 'body': data,
+                           'more_body': True})
+
+        result = self.app(environ, start_response)
+        try:
+            for data in result:
+                write(data)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+        start()
+        sync_send({'type': 'http.response.body', 'body': b''})
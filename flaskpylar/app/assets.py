@@ -0,0 +1,61 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import json
+import os.path
+
+import flask
+
+# logical name -> fingerprinted name (loaded once at startup)
+_MANIFEST = {}
+# fingerprinted names, which can be cached forever
+_FINGERPRINTED = set()
+
+
+def load_manifest(app):
+    '''
+    Loads the asset manifest generated by ``app-manager.py`` from the static
+    folder of the app. Missing manifest means no fingerprinting
+    '''
+    _MANIFEST.clear()
+    _FINGERPRINTED.clear()
+
+    mname = os.path.join(app.static_folder, app.config['FLASKPYLAR_MANIFEST'])
+    try:
+        with open(mname) as f:
+            _MANIFEST.update(json.load(f))
+    except FileNotFoundError:
+        app.logger.debug('No asset manifest found at: %s', mname)
+        return
+    except (OSError, ValueError) as e:
+        app.logger.error('Failed to load asset manifest %s: %s', mname, e)
+        return
+
+    _FINGERPRINTED.update(_MANIFEST.values())
+    app.logger.debug('Loaded asset manifest with %d entries', len(_MANIFEST))
+
+
+def resolve(filename):
+    '''Returns the fingerprinted name for filename if any'''
+    return _MANIFEST.get(filename, filename)
+
+
+def is_fingerprinted(filename):
+    return filename in _FINGERPRINTED
+
+
+def url_for(endpoint, **values):
+    '''
+    Drop-in replacement for ``flask.url_for`` which resolves the logical names
+    of static files to fingerprinted ones
+    '''
+    if endpoint == 'static' and 'filename' in values:
+        values['filename'] = resolve(values['filename'])
+
+    return flask.url_for(endpoint, **values)
@@ -0,0 +1,266 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import itertools
+import zlib
+
+from flask import Response, current_app, request
+from werkzeug.datastructures import Headers
+from werkzeug.http import (parse_accept_header, parse_options_header,
+                           quote_etag)
+from werkzeug.wsgi import ClosingIterator
+
+from .metrics import phase
+
+try:
+    import brotli
+except ImportError:
+    brotli = None  # only gzip
+
+# Encodings applied on the fly, in order of preference
+ENCODINGS = ('gzip',) if brotli is None else ('br', 'gzip')
+
+# Set in the environ by views whose responses must go out as they are (static
+# files, which have precompressed siblings)
+SKIP_KEY = 'flaskpylar.no_compress'
+
+
+def skip():
+    '''Keeps the response of the current request from being compressed'''
+    request.environ[SKIP_KEY] = True
+
+
+def choose_encoding(accepted):
+    '''Returns the preferred encoding in ``accepted`` (werkzeug Accept)'''
+    for encoding in ENCODINGS:
+        if accepted[encoding]:
+            return encoding
+
+    return None
+
+
+class _Brotli(object):
+    # brotli with the compress/flush interface of zlib compress objects
+    def __init__(self, quality):
+        self._c = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._c.process(data)
+
+    def flush(self):
+        return self._c.finish()
+
+
+def compressor(encoding, config):
+    '''Returns an object with ``compress`` and ``flush`` for encoding'''
+    if encoding == 'br':
+        return _Brotli(config['FLASKPYLAR_COMPRESS_BROTLI'])
+
+    return zlib.compressobj(config['FLASKPYLAR_COMPRESS_GZIP'],
+                            zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def compress(data, encoding, config):
+    '''Returns data compressed with encoding'''
+    c = compressor(encoding, config)
+    return c.compress(data) + c.flush()
+
+
+def eligible(mimetype, size, config):
+    '''Whether a body of mimetype and size would be compressed'''
+    return config['FLASKPYLAR_COMPRESS'] and \
+        mimetype in config['FLASKPYLAR_COMPRESS_TYPES'] and \
+        size >= config['FLASKPYLAR_COMPRESS_MIN_SIZE']
+
+
+def accepted_encoding(mimetype, size, accepted, config):
+    '''
+    Returns the encoding for a body of mimetype and size if it is eligible
+    and the client accepts one (``accepted``), else None
+    '''
+    if not eligible(mimetype, size, config):
+        return None
+
+    return choose_encoding(accepted)
+
+
+def encode(data, encoded, encoding, config):
+    '''
+    Returns the cached ``data`` compressed with encoding (as it is for None).
+    The compressed variants are kept in ``encoded`` (a dict of the cache
+    entry), to compress them only once
+    '''
+    if encoding is None:
+        return data
+
+    body = encoded.get(encoding)
+    if body is None:
+        with phase('compress'):
+            body = encoded[encoding] = compress(data, encoding, config)
+
+    return body
+
+
+def negotiate_cached(data, mimetype, etag, accepted, if_none_match, config):
+    '''
+    Negotiates the response for the cached ``data`` with the client
+    (``accepted`` encodings and ``if_none_match``, werkzeug structures).
+    Returns ``(not_modified, encoding, headers)``: if a 304 is enough, the
+    encoding for the body (None: as it is) and the ``ETag`` (weak for
+    compressed bodies), ``Vary`` and ``Content-Encoding`` headers
+    '''
+    encoding = accepted_encoding(mimetype, len(data), accepted, config)
+    not_modified = if_none_match.contains_weak(etag)
+    headers = [('ETag', quote_etag(etag, weak=encoding is not None))]
+    if eligible(mimetype, len(data), config):
+        headers.append(('Vary', 'Accept-Encoding'))
+
+    if encoding is not None and not not_modified:
+        headers.append(('Content-Encoding', encoding))
+
+    return not_modified, encoding, headers
+
+
+def send_cached(data, encoded, mimetype, etag):
+    '''
+    Returns a conditional response (304 if ``If-None-Match`` matches etag)
+    for the cached ``data``. Compressed bodies are taken from/kept in
+    ``encoded`` (see ``encode``) and carry a weak ETag
+    '''
+    config = current_app.config
+    not_modified, encoding, headers = negotiate_cached(
+        data, mimetype, etag, request.accept_encodings, request.if_none_match,
+        config)
+    if not_modified:
+        resp = Response(status=304)
+    else:
+        body = encode(data, encoded, encoding, config)
+        resp = Response(body, mimetype=mimetype)
+
+    resp.headers.extend(headers)
+    return resp
+
+
+class CompressMiddleware(object):
+    '''
+    Compresses eligible responses (``FLASKPYLAR_COMPRESS_*``) with the best
+    encoding accepted by the client. The beginning of the body is read up to
+    the minimum size: complete bodies are compressed at once (with
+    ``Content-Length``) and longer ones as they are streamed. Responses with
+    a ``Content-Encoding`` (precompressed static files, cached compressed
+    bodies, gzipped exports) or flagged with ``skip`` are left alone
+    '''
+    def __init__(self, app, config):
+        self._app = app
+        self.config = config
+        self.types = frozenset(config['FLASKPYLAR_COMPRESS_TYPES'])
+        self.min_size = config['FLASKPYLAR_COMPRESS_MIN_SIZE']
+
+    def _wanted(self, environ, status, headers):
+        if environ.get(SKIP_KEY) or 'Content-Encoding' in headers:
+            return False
+
+        code = int(status.split(' ', 1)[0])
+        if code < 200 or code in (204, 206, 304):
+            return False
+
+        mimetype = parse_options_header(headers.get('Content-Type', ''))[0]
+        if mimetype not in self.types:
+            return False
+
+        if 'no-transform' in headers.get('Cache-Control', ''):
+            return False
+
+        length = headers.get('Content-Length', type=int)
+        return length is None or length >= self.min_size
+
+    def __call__(self, environ, start_response):
+        accepted = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING'))
+        encoding = choose_encoding(accepted)
+        if encoding is None or environ['REQUEST_METHOD'] == 'HEAD':
+            return self._app(environ, start_response)
+
+        started, writes = [], []
+
+        def _start_response(status, headers, exc_info=None):
+            started[:] = [status, headers, exc_info]
+            return write
+
+        def write(data):  # legacy writes: the body goes out as it is
+            if not writes:
+                writes.append(start_response(*started))
+            writes[0](data)
+
+        result = self._app(environ, _start_response)
+        if writes:
+            return result
+
+        it = iter(result)
+        chunks = []
+        if not started:  # start_response may be called on first iteration
+            chunks.extend(itertools.islice(it, 1))
+
+        status, headers, exc_info = started
+        headers = Headers(headers)
+        if not self._wanted(environ, status, headers):
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            if not chunks:
+                return result  # untouched (for example file wrappers)
+
+            return ClosingIterator(itertools.chain(chunks, it),
+                                   getattr(result, 'close', None))
+
+        # Read up to the minimum size to see if the body is shorter
+        size, done = sum(len(x) for x in chunks), True
+        for chunk in it:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= self.min_size:
+                done = False
+                break
+
+        length = headers.get('Content-Length', type=int)
+        if length is not None and size >= length:
+            done = True
+
+        if done and size < self.min_size:
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            if hasattr(result, 'close'):
+                result.close()
+            return chunks
+
+        headers['Content-Encoding'] = encoding
+        if 'accept-encoding' not in headers.get('Vary', '').lower():
+            headers.add('Vary', 'Accept-Encoding')
+        etag = headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            headers['ETag'] = 'W/' + etag  # the bytes are not the same
+
+        if done:  # whole body in hand
+            body = compress(b''.join(chunks), encoding, self.config)
+            headers['Content-Length'] = str(len(body))
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            if hasattr(result, 'close'):
+                result.close()
+            return [body]
+
+        headers.pop('Content-Length', None)
+        start_response(status, headers.to_wsgi_list(), exc_info)
+        c = compressor(encoding, self.config)
+        body = self._compressed(c, itertools.chain(chunks, it))
+        return ClosingIterator(body, getattr(result, 'close', None))
+
+    @staticmethod
+    def _compressed(c, chunks):
+        for chunk in chunks:
+            data = c.compress(chunk)
+            if data:
+                yield data
+
+        yield c.flush()
@@ -4,38 +4,129 @@
 # Copyright 2018 Daniel Rodriguez. All Rights Reserved.
 # Use of this source code is governed by the MIT license
 ###############################################################################
-from anpylar import http, Service
+from anpylar import http, Service, window
 
 import json
 
 
 class ApiService(Service):
     token = ''
+    token_header = 'X-Auth-Token'  # server delivers the token in it
+    token_key = 'flaskpylar-api-token'  # key in sessionStorage
 
     def __init__(self):
         self.http = http.Http(
             url='/api',
             fullresp=True,  # not only body, but full response, incl status
         )
+        # The token survives the navigation from login to the other apps
+        self.token = window.sessionStorage.getItem(self.token_key) or ''
+        # Last list of pyroes and ETag per page, reused on 304 answers
+        self.pyroes_pages = {}
+        self._search = None  # search in flight
+
+    def auth_headers(self):
+        if not self.token:
+            return None  # the session cookie will be used
+
+        return {'Authorization': 'Bearer ' + self.token}
 
     def login(self, username, password):
         data = {'username': username, 'password': password}
         # Be Specific about encoding of body
         headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-        return self.http.post(url='login', headers=headers, data=data)
+
+        def store_token(resp):
+            if resp.status == 200:
+                # none if already logged in: the current one is kept
+                token = resp.getResponseHeader(self.token_header)
+                if token:
+                    self.token = token
+                    window.sessionStorage.setItem(self.token_key, token)
+
+            return resp
+
+        return self.http.post(url='login', headers=headers,
+                              data=data).map(store_token)
 
     def logout(self):
+        # Without token, for the session cookie to be cleared
+        self.token = ''
+        window.sessionStorage.removeItem(self.token_key)
         return self.http.get(url='logout')
 
-    def get_pyroes(self):
+    pyroes_next = None  # cursor for the next page (None after the last)
+
+    def get_pyroes(self, cursor=None, limit=None):
+        data = {}
+        if cursor is not None:
+            data['cursor'] = cursor
+        if limit is not None:
+            data['limit'] = limit
+
+        page = (cursor, limit)
+
         def pyroes_decode(resp):
+            if resp.status in (200, 304):
+                self.pyroes_next = resp.getResponseHeader('X-Next-Cursor')
+
+            if resp.status == 304:
+                return self.pyroes_pages[page][1]  # unchanged
+
             pyroes = []
             if resp.status == 200:
                 try:
                     pyroes = json.loads(resp.text)
                 except:
                     pass
+                else:
+                    etag = resp.getResponseHeader('ETag') or ''
+                    self.pyroes_pages[page] = (etag, pyroes)
 
             return pyroes
 
-        return self.http.get(url='pyroes').map(pyroes_decode)
+        headers = self.auth_headers() or {}
+        if page in self.pyroes_pages:
+            headers['If-None-Match'] = self.pyroes_pages[page][0]
+
+        return self.http.get(url='pyroes/list', headers=headers,
+                             data=data or None).map(pyroes_decode)
+
+    def search(self, query, limit=None):
+        '''
+        Pyroes with names having words which start with those of query. A new
+        search cancels the one in flight, so it can be called as the user
+        types (debounced, for example with call_delayed)
+        '''
+        self.cancel_search()
+
+        data = {'q': window.encodeURIComponent(query)}
+        if limit is not None:
+            data['limit'] = limit
+
+        req = self.http.get(url='pyroes/search', headers=self.auth_headers(),
+                            data=data)
+        self._search = req
+
+        def search_decode(resp):
+            if self._search is req:
+                self._search = None
+
+            pyroes = []
+            if resp.status == 200:
+                try:
+                    pyroes = json.loads(resp.text)
+                except:
+                    pass
+
+            return pyroes
+
+        return req.map(search_decode)
+
+    def cancel_search(self):
+        req, self._search = self._search, None
+        if req is not None:
+            try:
+                req.cancel()
+            except AttributeError:
+                pass  # not yet sent (not subscribed)
@@ -0,0 +1,121 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import hashlib
+import mimetypes
+import os
+import threading
+
+from . import compress
+
+
+ImportEntry = collections.namedtuple(
+    'ImportEntry',
+    ['data', 'mtime', 'size', 'etag', 'mimetype', 'encoded'])
+
+
+class ImportCache(object):
+    '''
+    Keeps the contents of files imported by brython during testing in memory,
+    keyed by resolved path. The total size (contents plus their compressed
+    variants) is bounded by ``max_bytes`` with the least recently used entries
+    evicted first. Entries are invalidated when the modification time or size
+    of the file changes
+    '''
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = collections.OrderedDict()
+        self._nbytes = {}  # bytes of the entries counted in size
+        self._lock = threading.Lock()
+
+    def _drop(self, filename):
+        if self._entries.pop(filename, None) is not None:
+            self.size -= self._nbytes.pop(filename)
+
+    def _evict(self):
+        while self.size > self.max_bytes:
+            filename, _ = self._entries.popitem(last=False)
+            self.size -= self._nbytes.pop(filename)
+
+    def _count_encoded(self, filename, entry):
+        # Adds the compressed variants of entry (if still kept) to the size
+        nbytes = entry.size + sum(len(x) for x in list(entry.encoded.values()))
+        with self._lock:
+            if self._entries.get(filename) is not entry:
+                return  # not kept (too big, dropped or evicted meanwhile)
+
+            self.size += nbytes - self._nbytes[filename]
+            self._nbytes[filename] = nbytes
+            self._evict()
+
+    def get(self, filename):
+        '''Returns an ``ImportEntry`` for filename or None if not a file'''
+        try:
+            st = os.stat(filename)
+        except OSError:
+            st = None
+
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry is not None:
+                if st is not None and entry.mtime == st.st_mtime_ns and \
+                   entry.size == st.st_size:
+                    self._entries.move_to_end(filename)
+                    return entry
+
+                self._drop(filename)  # stale
+
+        if st is None or not os.path.isfile(filename):
+            return None
+
+        with open(filename, 'rb') as f:
+            data = f.read()
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'text/plain'
+        entry = ImportEntry(data, st.st_mtime_ns, len(data),
+                            hashlib.sha1(data).hexdigest(), mimetype, {})
+
+        if entry.size > self.max_bytes:
+            return entry  # deliver it, but don't keep it
+
+        with self._lock:
+            self._drop(filename)
+            self._entries[filename] = entry
+            self._nbytes[filename] = entry.size
+            self.size += entry.size
+            self._evict()
+
+        return entry
+
+    def send(self, filename, max_age=None):
+        '''
+        Returns a response for filename or None if it is not a file. It
+        carries an ETag (weak if compressed) and answers conditional requests
+        with 304. With ``max_age`` the response can be cached for that long,
+        else the client has to revalidate
+        '''
+        entry = self.get(filename)
+        if entry is None:
+            return None
+
+        nencoded = len(entry.encoded)
+        resp = compress.send_cached(entry.data, entry.encoded, entry.mimetype,
+                                    entry.etag)
+        if len(entry.encoded) != nencoded:  # a new compressed variant
+            self._count_encoded(filename, entry)
+
+        if max_age:
+            resp.cache_control.public = True
+            resp.cache_control.max_age = max_age
+        else:
+            resp.cache_control.no_cache = True
+
+        return resp
@@ -0,0 +1,341 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import atexit
+import bisect
+import collections
+import contextlib
+import glob
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+
+from flask import Response, abort, g, has_request_context, request
+
+from .access_log import ROUTE_KEY, MeasureMiddleware, mark_routes
+
+EXTENSION = 'flaskpylar_metrics'  # key in app.extensions
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# name, type, help
+FAMILIES = (
+    ('flaskpylar_requests_total', 'counter',
+     'Requests by endpoint, blueprint, method and status class'),
+    ('flaskpylar_request_duration_seconds', 'histogram',
+     'Time until the response body has been sent'),
+    ('flaskpylar_response_bytes_total', 'counter',
+     'Bytes of the response bodies'),
+    ('flaskpylar_phase_seconds', 'summary',
+     'Time spent in the phases of the requests (as in Server-Timing)'),
+)
+
+_HEADER = struct.Struct('<Q')  # bytes in use
+_KEYLEN = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+INITIAL_SIZE = 64 * 1024
+
+
+def _entries(buf):
+    # Yields (key, value, offset of the value) of the entries in buf
+    used = min(_HEADER.unpack_from(buf, 0)[0], len(buf))
+    pos = _HEADER.size
+    while pos < used:
+        klen = _KEYLEN.unpack_from(buf, pos)[0]
+        key = bytes(buf[pos + _KEYLEN.size:pos + _KEYLEN.size + klen])
+        pos += _KEYLEN.size + klen
+        pos += -pos % 8  # values are aligned
+        yield key.decode('utf-8'), _VALUE.unpack_from(buf, pos)[0], pos
+        pos += _VALUE.size
+
+
+class MmapValues(object):
+    '''
+    Float values by key in a file mapped in memory, to be written by a single
+    process (one file per process) and read by any. Layout: bytes in use,
+    then entries with the length of the key, the key (utf-8, padded to 8
+    bytes) and the value (a double)
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._fd = os.open(filename, os.O_RDWR | os.O_CREAT)
+        self._size = max(os.fstat(self._fd).st_size, INITIAL_SIZE)
+        os.ftruncate(self._fd, self._size)
+        self._map = mmap.mmap(self._fd, self._size)
+        self._used = _HEADER.unpack_from(self._map, 0)[0] or _HEADER.size
+        self._offsets = {k: pos for k, _, pos in _entries(self._map)}
+
+    def _new(self, key):
+        data = key.encode('utf-8')
+        pos = self._used + _KEYLEN.size + len(data)
+        pos += -pos % 8
+        end = pos + _VALUE.size
+        if end > self._size:
+            self._map.close()
+            self._size = max(2 * self._size, end)
+            os.ftruncate(self._fd, self._size)
+            self._map = mmap.mmap(self._fd, self._size)
+
+        _KEYLEN.pack_into(self._map, self._used, len(data))
+        start = self._used + _KEYLEN.size
+        self._map[start:start + len(data)] = data
+        _VALUE.pack_into(self._map, pos, 0.0)
+        _HEADER.pack_into(self._map, 0, end)  # complete: make it visible
+        self._used = end
+        self._offsets[key] = pos
+        return pos
+
+    def add(self, key, amount):
+        with self._lock:
+            pos = self._offsets.get(key)
+            if pos is None:
+                pos = self._new(key)
+
+            value = _VALUE.unpack_from(self._map, pos)[0]
+            _VALUE.pack_into(self._map, pos, value + amount)
+
+    @staticmethod
+    def read(filename):
+        '''Returns a dict with the values in filename'''
+        with open(filename, 'rb') as f:
+            buf = f.read()
+
+        if len(buf) < _HEADER.size:
+            return {}
+
+        return {k: v for k, v, _ in _entries(buf)}
+
+
+def _key(name, **labels):
+    return json.dumps([name, sorted(labels.items())])
+
+
+def _status_class(status):
+    return '{}xx'.format(status // 100)
+
+
+class Metrics(object):
+    '''
+    Request counts, latency histograms, response sizes and phase times per
+    endpoint and blueprint. Each worker process adds to its own file in
+    ``directory`` and the values of all files are added up when collected
+    '''
+    def __init__(self, directory, buckets):
+        self.directory = directory
+        self.buckets = tuple(sorted(buckets))
+        self._les = [repr(float(b)) for b in self.buckets] + ['+Inf']
+        self._values = None
+        self._pid = None
+        self._keys = {}  # cache of encoded keys
+        self._lock = threading.Lock()
+
+    def _store(self):
+        # Each process has its own file (workers forked after loading the app
+        # included)
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    filename = os.path.join(
+                        self.directory, 'metrics-{}.db'.format(pid))
+                    self._values = MmapValues(filename)
+                    self._pid = pid
+
+        return self._values
+
+    def _add(self, cachekey, amount, name, **labels):
+        key = self._keys.get(cachekey)
+        if key is None:
+            key = self._keys[cachekey] = _key(name, **labels)
+
+        self._store().add(key, amount)
+
+    def observe(self, endpoint, blueprint, method, status, nbytes, duration):
+        '''Adds a request to the metrics'''
+        endpoint, blueprint = endpoint or '', blueprint or ''
+        route = (endpoint, blueprint)
+        status = _status_class(status)
+        self._add(('req', route, method, status), 1,
+                  'flaskpylar_requests_total', endpoint=endpoint,
+                  blueprint=blueprint, method=method, status=status)
+
+        le = self._les[bisect.bisect_left(self.buckets, duration)]
+        name = 'flaskpylar_request_duration_seconds'
+        self._add(('bucket', route, le), 1, name + '_bucket',
+                  endpoint=endpoint, blueprint=blueprint, le=le)
+        self._add(('sum', route), duration, name + '_sum',
+                  endpoint=endpoint, blueprint=blueprint)
+        self._add(('count', route), 1, name + '_count',
+                  endpoint=endpoint, blueprint=blueprint)
+
+        self._add(('bytes', route), nbytes, 'flaskpylar_response_bytes_total',
+                  endpoint=endpoint, blueprint=blueprint)
+
+    def log(self, environ, status, nbytes, duration):
+        # for access_log.MeasureMiddleware
+        blueprint, endpoint = environ.get(ROUTE_KEY, (None, None))
+        self.observe(endpoint, blueprint, environ.get('REQUEST_METHOD'),
+                     status, nbytes, duration)
+
+    def observe_phases(self, endpoint, phases):
+        '''Adds the seconds spent in each phase (a dict) of a request'''
+        endpoint = endpoint or ''
+        name = 'flaskpylar_phase_seconds'
+        for pname, seconds in phases.items():
+            self._add(('phase_sum', endpoint, pname), seconds, name + '_sum',
+                      endpoint=endpoint, phase=pname)
+            self._add(('phase_count', endpoint, pname), 1, name + '_count',
+                      endpoint=endpoint, phase=pname)
+
+    def collect(self):
+        '''Returns the values of all processes added up by key'''
+        values = collections.defaultdict(float)
+        pattern = os.path.join(self.directory, 'metrics-*.db')
+        for filename in glob.glob(pattern):
+            try:
+                for k, v in MmapValues.read(filename).items():
+                    values[k] += v
+            except (OSError, ValueError, struct.error):
+                continue  # being created, skip it this time
+
+        return values
+
+    def exposition(self):
+        '''Returns the metrics in the prometheus text format'''
+        samples = collections.defaultdict(list)  # name -> [(labels, value)]
+        for key, value in self.collect().items():
+            name, labels = json.loads(key)
+            samples[name].append((labels, value))
+
+        lines = []
+        for family, mtype, helptxt in FAMILIES:
+            lines.append('# HELP {} {}'.format(family, helptxt))
+            lines.append('# TYPE {} {}'.format(family, mtype))
+            if mtype == 'histogram':
+                lines.extend(self._buckets(family, samples))
+
+            for suffix in ('', '_sum', '_count'):
+                for labels, value in sorted(samples.get(family + suffix, ())):
+                    lines.append(_sample(family + suffix, labels, value))
+
+        return '\n'.join(lines) + '\n'
+
+    def _buckets(self, family, samples):
+        # Buckets are kept per range and exposed as cumulative counts
+        series = collections.defaultdict(dict)
+        for labels, value in samples.get(family + '_bucket', ()):
+            labels = dict(labels)
+            le = labels.pop('le')
+            series[tuple(sorted(labels.items()))][le] = value
+
+        for labels, counts in sorted(series.items()):
+            total = 0.0
+            for le in self._les:
+                total += counts.get(le, 0.0)
+                lbls = sorted(labels + (('le', le),))
+                yield _sample(family + '_bucket', lbls, total)
+
+
+def _escape(value):
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _sample(name, labels, value):
+    lbls = ','.join('{}="{}"'.format(k, _escape(v)) for k, v in labels)
+    return '{}{{{}}} {}'.format(name, lbls, repr(float(value)))
+
+
+@contextlib.contextmanager
+def phase(name):
+    '''
+    Times the block (or decorated function) as part of phase ``name`` of the
+    current request (auth, data, serialize, render). The times of a phase are
+    added up and delivered in the ``Server-Timing`` header. Outside of a
+    request it does nothing
+    '''
+    if not has_request_context():
+        yield
+        return
+
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases = g.get('_phases')
+        if phases is None:
+            phases = g._phases = collections.OrderedDict()
+
+        phases[name] = phases.get(name, 0.0) + time.perf_counter() - t0
+
+
+def _server_timing(phases):
+    return ', '.join('{};dur={:.3f}'.format(k, v * 1000.0)
+                     for k, v in phases.items())
+
+
+def _remove_dir(directory, pid):
+    # only by the process which made it, not by the workers forked from it
+    if os.getpid() == pid:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def install(app):
+    '''
+    Wraps the wsgi app of the flask ``app`` to collect metrics, adds the
+    ``Server-Timing`` header to the responses and the (prometheus) metrics
+    endpoint (``FLASKPYLAR_METRICS_*``), only answered to the addresses in
+    ``FLASKPYLAR_METRICS_ALLOW``. Returns the ``Metrics``
+
+    It has to be called before the workers are forked: the files of the
+    workers of earlier runs in ``FLASKPYLAR_METRICS_DIR`` are removed and a
+    temporary directory is removed when the process exits
+    '''
+    config = app.config
+    directory = config['FLASKPYLAR_METRICS_DIR']
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix='flaskpylar-metrics-')
+        atexit.register(_remove_dir, directory, os.getpid())
+    elif not os.path.isdir(directory):
+        os.makedirs(directory)
+    else:
+        # values of dead workers would be added up forever
+        for filename in glob.glob(os.path.join(directory, 'metrics-*.db')):
+            os.remove(filename)
+
+    metrics = Metrics(directory, config['FLASKPYLAR_METRICS_BUCKETS'])
+    app.extensions[EXTENSION] = metrics
+
+    @app.after_request
+    def server_timing(response):
+        phases = g.get('_phases')
+        if phases:
+            response.headers['Server-Timing'] = _server_timing(phases)
+            metrics.observe_phases(request.endpoint, phases)
+
+        return response
+
+    allow = config['FLASKPYLAR_METRICS_ALLOW']
+
+    def metrics_view():
+        if allow is not None and request.remote_addr not in allow:
+            abort(404)  # internal: not even there for others
+
+        return Response(metrics.exposition(), content_type=CONTENT_TYPE)
+
+    app.add_url_rule(config['FLASKPYLAR_METRICS_PATH'], 'metrics',
+                     metrics_view)
+
+    mark_routes(app)
+    app.wsgi_app = MeasureMiddleware(app.wsgi_app, metrics)
+    return metrics
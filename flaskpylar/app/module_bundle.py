@@ -0,0 +1,205 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import ast
+import collections
+import hashlib
+import json
+import os
+import re
+import threading
+
+from . import compress
+
+
+# Same format as the auto_vfs.js files generated by anpylar-paketize: the vfs
+# is registered with anpylar (VFSAutoPathFinder) when it loads, hence this has
+# to be loaded before anpylar.js
+VFS_TEMPLATE = '''\
+;(function() {{
+    var vfspath = {vfspath}
+    var $vfs = {vfs}
+
+    if(window.__ANPYLAR__ === undefined)
+        window.__ANPYLAR__ = {{autoload: []}}  // ensure global scope
+
+    window.__ANPYLAR__.autoload.push(function($B) {{
+        $B.path.splice(2, 0, vfspath)
+        $B.imported['_importlib'].VFSAutoPathFinder(vfspath, $vfs)
+    }})
+}})()
+'''
+
+# Non-python files in the packages (templates/css of components)
+EXTRA_EXTS = ('.html', '.css')
+
+# Dotted python module name: no path separators or parent references
+MODNAME = re.compile(r'^[A-Za-z_]\w*(\.[A-Za-z_]\w*)*$')
+
+BundleEntry = collections.namedtuple(
+    'BundleEntry', ['data', 'etag', 'inputs', 'encoded'])
+
+
+def valid_modname(modname):
+    return MODNAME.match(modname) is not None
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class ModuleBundler(object):
+    '''
+    Statically walks the import graph of a root module of a blueprint (the
+    sources under ``base_folder/bpname`` for the app package and under
+    ``base_folder`` for anything else, like libs) and delivers all modules in
+    one vfs file. Bundles are kept until the mtime of any input changes
+    '''
+    def __init__(self, base_folder, app_pkg):
+        self.base_folder = base_folder
+        self.app_pkg = app_pkg
+        self._bundles = {}
+        self._lock = threading.Lock()
+
+    def _locate(self, bpname, modname, inputs):
+        # Returns (path, is_package) or (None, False). Probes are recorded
+        if not valid_modname(modname):
+            return None, False
+
+        parts = modname.split('.')
+        root = self.base_folder
+        if parts[0] == self.app_pkg:
+            root = os.path.join(root, bpname)
+
+        basepath = os.path.join(root, *parts)
+        base = os.path.realpath(self.base_folder)
+        for path, is_pkg in ((os.path.join(basepath, '__init__.py'), True),
+                             (basepath + '.py', False)):
+            inputs[path] = mtime = _mtime(path)
+            if mtime is not None:
+                if os.path.commonpath([base, os.path.realpath(path)]) != base:
+                    return None, False  # outside of the sources (links)
+
+                return path, is_pkg
+
+        return None, False
+
+    @staticmethod
+    def _imports(modname, src, is_pkg):
+        # Yields the names of modules which may be imported by modname
+        try:
+            tree = ast.parse(src)
+        except SyntaxError:
+            return  # brython will report it when importing
+
+        package = modname if is_pkg else modname.rpartition('.')[0]
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    yield alias.name
+
+            elif isinstance(node, ast.ImportFrom):
+                if node.level:
+                    base = package
+                    for _ in range(node.level - 1):
+                        base = base.rpartition('.')[0]
+
+                    mod = '.'.join(x for x in (base, node.module) if x)
+                else:
+                    mod = node.module
+
+                if not mod:
+                    continue
+
+                yield mod
+                for alias in node.names:  # may be submodules
+                    if alias.name != '*':
+                        yield mod + '.' + alias.name
+
+    def _build(self, bpname, root):
+        inputs = {}  # path -> mtime (None for probed paths not found)
+        vfs = collections.defaultdict(dict)  # top-level package -> vfs
+        seen = set()
+        pending = [root]
+        while pending:
+            modname = pending.pop()
+            if modname in seen:
+                continue
+
+            seen.add(modname)
+            parts = modname.split('.')
+            # parent packages are imported first by python
+            pending.extend('.'.join(parts[:i]) for i in range(1, len(parts)))
+
+            path, is_pkg = self._locate(bpname, modname, inputs)
+            if path is None:
+                continue  # not ours: anpylar, browser, stdlib ...
+
+            with open(path, encoding='utf-8') as f:
+                src = f.read()
+
+            entry = ['.py', src]
+            if is_pkg:
+                entry.append(1)
+                # files needed by components are fetched from the vfs too
+                pkgdir = os.path.dirname(path)
+                inputs[pkgdir] = _mtime(pkgdir)
+                for fname in sorted(os.listdir(pkgdir)):
+                    if fname.endswith(EXTRA_EXTS):
+                        fpath = os.path.join(pkgdir, fname)
+                        inputs[fpath] = _mtime(fpath)
+                        with open(fpath, encoding='utf-8') as f:
+                            vname = '/'.join(parts + [fname])
+                            ext = os.path.splitext(fname)[1]
+                            vfs[parts[0]][vname] = [ext, f.read()]
+
+            vfs[parts[0]][modname] = entry
+            pending.extend(self._imports(modname, src, is_pkg))
+
+        chunks = []
+        for top in sorted(vfs):
+            chunks.append(VFS_TEMPLATE.format(
+                vfspath=json.dumps(top + '.vfs.js'),
+                vfs=json.dumps(vfs[top], sort_keys=True)))
+
+        data = '\n'.join(chunks).encode('utf-8')
+        return BundleEntry(data, hashlib.sha1(data).hexdigest(), inputs, {})
+
+    def get(self, bpname, root):
+        '''
+        Returns a BundleEntry for the import graph of root. ``ValueError`` is
+        raised if root is not a module name
+        '''
+        if not valid_modname(root):
+            raise ValueError('Invalid module name: {!r}'.format(root))
+
+        key = (bpname, root)
+        with self._lock:
+            entry = self._bundles.get(key)
+
+        if entry is not None and \
+           all(_mtime(p) == m for p, m in entry.inputs.items()):
+            return entry
+
+        entry = self._build(bpname, root)
+        with self._lock:
+            self._bundles[key] = entry
+
+        return entry
+
+    def send(self, bpname, root):
+        '''Returns a (conditional) response with the bundle for root'''
+        entry = self.get(bpname, root)
+        resp = compress.send_cached(entry.data, entry.encoded,
+                                    'application/javascript', entry.etag)
+        resp.cache_control.no_cache = True  # always revalidate
+        return resp
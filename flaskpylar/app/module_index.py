@@ -0,0 +1,115 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import threading
+import time
+
+
+class ModuleIndex(object):
+    '''
+    Index of the files under the apps directory of the development dir, to
+    answer lookups for missing files (brython probes several candidates for
+    each import) without touching the filesystem.
+
+    The index is kept current by checking the mtime of the directories (at
+    most once every ``interval`` seconds) and rescanning if any changed
+    '''
+    SKIP_DIRS = ('__pycache__',)
+
+    def __init__(self, root, interval=1.0):
+        self.root = root
+        self.interval = interval
+        self._files = frozenset()
+        self._dirs = {}  # dir path -> mtime
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._scan()
+
+    def _scan(self):
+        files, dirs = set(), {}
+        for d, dnames, fnames in os.walk(self.root):
+            dnames[:] = [x for x in dnames if x not in self.SKIP_DIRS]
+            try:
+                dirs[d] = os.stat(d).st_mtime_ns
+            except OSError:
+                continue
+
+            rel = os.path.relpath(d, self.root)
+            rel = '' if rel == os.curdir else rel.replace(os.sep, '/') + '/'
+            files.update(rel + fname for fname in fnames)
+
+        self._files, self._dirs = frozenset(files), dirs
+
+    def _changed(self):
+        for d, mtime in self._dirs.items():
+            try:
+                if os.stat(d).st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                return True
+
+        return False
+
+    def refresh(self):
+        '''Rescans if the interval has elapsed and anything changed'''
+        now = time.monotonic()
+        if now - self._checked < self.interval:
+            return
+
+        with self._lock:
+            if now - self._checked < self.interval:
+                return  # done by another thread
+
+            if self._changed():
+                self._scan()
+
+            self._checked = time.monotonic()
+
+    def exists(self, relpath):
+        '''Says if the file at relpath (with "/" separator) exists'''
+        self.refresh()
+        return relpath in self._files
+
+    def modules(self, bpname, app_pkg):
+        '''
+        Returns the sorted names of the modules importable by the blueprint:
+        the app package from the blueprint directory and packages/modules from
+        the apps directory
+        '''
+        self.refresh()
+        files = self._files
+
+        def is_package(parts):
+            return '/'.join(parts + ['__init__.py']) in files
+
+        names = set()
+        for relpath in files:
+            if not relpath.endswith('.py'):
+                continue
+
+            parts = relpath[:-3].split('/')
+            if parts[0] == bpname and len(parts) > 1 and parts[1] == app_pkg:
+                parts = parts[1:]
+            elif parts[0] != app_pkg and (len(parts) == 1 or
+                                          is_package(parts[:1])):
+                pass  # top level module or inside a top level package
+            else:
+                continue
+
+            if parts[-1] == '__init__':
+                parts = parts[:-1]
+
+            # all parents have to be packages
+            prefix = [bpname] if parts[0] == app_pkg else []
+            if all(is_package(prefix + parts[:i])
+                   for i in range(1, len(parts))):
+                names.add('.'.join(parts))
+
+        return sorted(names)
@@ -0,0 +1,125 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import hashlib
+import threading
+import uuid
+
+from flask import render_template, request
+from jinja2 import meta
+
+from . import compress
+
+PageEntry = collections.namedtuple(
+    'PageEntry', ['etag', 'parts', 'templates', 'encoded'])
+
+
+def _template_names(env, name):
+    # name and the templates it extends/includes (recursively)
+    names, pending = [], [name]
+    while pending:
+        name = pending.pop()
+        if name in names:
+            continue
+
+        names.append(name)
+        source = env.loader.get_source(env, name)[0]
+        pending.extend(n for n in meta.find_referenced_templates(
+            env.parse(source)) if n is not None)
+
+    return names
+
+
+class PageCache(object):
+    '''
+    Keeps the rendered html of pages which only depend on values constant
+    for the deployment (blueprint, config, urls), per blueprint, template and
+    generation (see ``invalidate``).
+
+    The per-session CSRF token is rendered as a placeholder, replaced in the
+    cached html when sending it. If the jinja environment reloads templates
+    (debug), entries are dropped when any of their templates changes
+    '''
+    def __init__(self, app, csrf_token):
+        self.app = app
+        self.csrf_token = csrf_token  # callable for the session token
+        # unguessable: a rendered value can't become the placeholder
+        self.placeholder = '@@csrf-{}@@'.format(uuid.uuid4().hex)
+        self.generation = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        '''Drops all pages (for example after changing the config)'''
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def _render(self, template, context):
+        env = self.app.jinja_env
+        html = render_template(template, csrf_token=lambda: self.placeholder,
+                               **context)
+        parts = html.encode('utf-8').split(self.placeholder.encode('utf-8'))
+        etag = hashlib.sha1(html.encode('utf-8')).hexdigest()
+        templates = ()
+        if env.auto_reload:
+            templates = tuple(env.get_template(name)
+                              for name in _template_names(env, template))
+
+        return PageEntry(etag, parts, templates, {})
+
+    def get(self, template, context):
+        '''Returns the ``PageEntry`` of template rendered with context'''
+        key = (request.blueprint, request.script_root, template)
+        with self._lock:
+            generation = self.generation
+            entry = self._entries.get(key + (generation,))
+
+        if entry is not None and \
+           not all(t.is_up_to_date for t in entry.templates):
+            self.invalidate()
+            with self._lock:
+                generation = self.generation
+
+            entry = None
+
+        if entry is None:
+            # rendered outside of the lock and only kept if no invalidate
+            # happened meanwhile (it could be rendered with stale values)
+            rendered = self._render(template, context)
+            with self._lock:
+                if generation != self.generation:
+                    return rendered
+
+                entry = self._entries.setdefault(key + (generation,),
+                                                 rendered)
+
+        return entry
+
+    def send(self, template, context):
+        '''
+        Returns the response for template rendered with context (which has
+        to be the same for all requests to the blueprint). It has to be
+        revalidated by the client: a matching ``If-None-Match`` gets a 304
+        '''
+        entry = self.get(template, context)
+        if len(entry.parts) == 1:
+            body, encoded, etag = entry.parts[0], entry.encoded, entry.etag
+        else:
+            token = self.csrf_token()
+            body = token.encode('utf-8').join(entry.parts)
+            encoded = {}  # per session: not kept
+            etag = '{}-{}'.format(entry.etag, hashlib.sha1(
+                token.encode('utf-8')).hexdigest()[:16])
+
+        resp = compress.send_cached(body, encoded, 'text/html', etag)
+        resp.cache_control.private = True
+        resp.cache_control.no_cache = True
+        return resp
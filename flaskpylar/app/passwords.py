@@ -0,0 +1,160 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import concurrent.futures
+import functools
+import multiprocessing
+import os
+import sys
+import threading
+
+from passlib.context import CryptContext
+
+from . import app
+
+# Schemes which can be verified (and will be updated) if not the configured
+# one. They are those of passlib's custom_app_context, used in the past
+KNOWN_SCHEMES = ('sha512_crypt', 'sha256_crypt')
+
+
+class VerifierBusy(Exception):
+    '''Raised when all verification slots are taken'''
+    pass
+
+
+@functools.lru_cache(maxsize=None)
+def make_context(scheme, rounds):
+    '''
+    Context hashing with scheme and rounds. Hashes with other known schemes or
+    with other rounds (less or more) still verify, but need an update
+    '''
+    schemes = [scheme] + [x for x in KNOWN_SCHEMES if x != scheme]
+    kwargs = {}
+    if rounds:
+        kwargs[scheme + '__default_rounds'] = rounds
+        kwargs[scheme + '__min_rounds'] = rounds
+        kwargs[scheme + '__max_rounds'] = rounds
+
+    return CryptContext(schemes=schemes, default=scheme, deprecated='auto',
+                        **kwargs)
+
+
+def _verify_and_update(settings, password, passhash):
+    # Runs in the worker processes: contexts are cached per settings
+    return make_context(*settings).verify_and_update(password, passhash)
+
+
+def _noop():
+    pass
+
+
+def _pool_context():
+    # The pool may be made from a thread of a multithreaded worker: its
+    # processes must not be forked from it (they could inherit held locks).
+    # Before python 3.7 (no mp_context) see Verifier.start
+    if sys.version_info < (3, 7):
+        return {}
+
+    methods = multiprocessing.get_all_start_methods()
+    method = 'forkserver' if 'forkserver' in methods else 'spawn'
+    return {'mp_context': multiprocessing.get_context(method)}
+
+
+def server_processes():
+    '''Worker processes of the server (uwsgi), 1 if unknown'''
+    try:
+        import uwsgi
+    except ImportError:
+        return 1
+
+    return max(1, uwsgi.numproc)
+
+
+class Verifier(object):
+    '''
+    Verifies passwords in pools of processes, to keep the cpu bound hashing
+    away from the request workers. ``workers`` hashing processes and
+    ``workers + queue`` verifications in flight are shared out among the
+    worker processes of the server: each has a pool and a bound of its own
+    (nothing is left held by a worker which is killed) and ``VerifierBusy``
+    is raised beyond the bound. With 0 workers, verification happens inline
+    '''
+    def __init__(self, scheme, rounds, workers, queue, timeout):
+        self.settings = (scheme, rounds)
+        self.workers = workers
+        self.queue = queue
+        self.timeout = timeout
+        self._pid = None
+        self._pool = self._slots = None
+        self._lock = threading.Lock()
+
+    @property
+    def context(self):
+        return make_context(*self.settings)
+
+    def hash(self, password):
+        return self.context.hash(password)
+
+    def _get_pool(self):
+        # Pool and slots of this process, made lazily: they don't survive a
+        # fork. Returns (pool, slots)
+        with self._lock:
+            if self._pid != os.getpid():
+                nprocs = server_processes()
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=max(1, -(-self.workers // nprocs)),
+                    **_pool_context())
+                self._slots = threading.BoundedSemaphore(
+                    max(1, -(-(self.workers + self.queue) // nprocs)))
+                self._pid = os.getpid()
+
+            return self._pool, self._slots
+
+    def start(self):
+        '''
+        Starts the hashing processes of this process. To be called right
+        after the fork of a server worker (see wsgi.py), before it runs any
+        threads: before python 3.7 they are forked from it
+        '''
+        if self.workers:
+            self._get_pool()[0].submit(_noop).result()
+
+    def verify_and_update(self, password, passhash):
+        '''
+        Returns ``(verified, newhash)`` where ``newhash`` is not ``None`` if
+        the hash has to be replaced (scheme or rounds changed)
+        '''
+        if not self.workers:
+            return self.context.verify_and_update(password, passhash)
+
+        pool, slots = self._get_pool()
+        if not slots.acquire(False):
+            raise VerifierBusy()
+
+        try:
+            future = pool.submit(
+                _verify_and_update, self.settings, password, passhash)
+        except Exception:
+            slots.release()
+            raise
+
+        future.add_done_callback(lambda f: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError:
+            raise VerifierBusy()
+
+
+verifier = Verifier(
+    scheme=app.config['FLASKPYLAR_PWD_SCHEME'],
+    rounds=app.config['FLASKPYLAR_PWD_ROUNDS'],
+    workers=app.config['FLASKPYLAR_PWD_WORKERS'],
+    queue=app.config['FLASKPYLAR_PWD_QUEUE'],
+    timeout=app.config['FLASKPYLAR_PWD_TIMEOUT'],
+)
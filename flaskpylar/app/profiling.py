@@ -0,0 +1,246 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import cProfile
+import collections
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+
+from werkzeug.urls import url_decode
+
+from . import tokens
+from .access_log import ROUTE_KEY, file_wrappers, mark_routes
+
+# Profiling is triggered by a token (see make_trigger) in a header or in the
+# query string, or by sampling
+TRIGGER_SALT = b'flaskpylar-profile'
+EXTENSION = 'flaskpylar_profiling'  # key in app.extensions
+TRIGGER_CLAIM = 'profile'
+
+PSTATS_EXT = '.pstats'
+COLLAPSED_EXT = '.collapsed'  # flamegraph.pl/speedscope input
+NO_ENDPOINT = '_none'  # directory for requests not matching a route
+
+
+def make_trigger(key, ttl):
+    '''Returns a token which triggers profiling for ``ttl`` seconds'''
+    return tokens.make_token(key, TRIGGER_CLAIM, ttl, salt=TRIGGER_SALT)
+
+
+def check_trigger(key, token):
+    return tokens.load_token(key, token, salt=TRIGGER_SALT) == TRIGGER_CLAIM
+
+
+def _frame_name(code):
+    return '{} ({}:{})'.format(code.co_name,
+                               os.path.basename(code.co_filename),
+                               code.co_firstlineno)
+
+
+class StackSampler(object):
+    '''
+    Takes the stack of a thread (by id) every ``interval`` seconds from a
+    background thread and counts the stacks, in the collapsed format of
+    flamegraphs (frames from the root separated by ``;``). The interval is in
+    practice bounded by the switch interval of the interpreter
+    '''
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        names = {}  # code -> frame name
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = names.get(code)
+                if name is None:
+                    name = names[code] = _frame_name(code)
+
+                stack.append(name)
+                frame = frame.f_back
+
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, filename):
+        with open(filename, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write('{} {}\n'.format(stack, count))
+
+
+class _Profile(object):
+    # cProfile or the stack sampler of a request, enabled while the app runs
+    def __init__(self, mode, interval):
+        self.mode = mode
+        if mode == 'cprofile':
+            self._prof = cProfile.Profile()
+        else:
+            self._prof = StackSampler(threading.get_ident(), interval)
+            self._prof.start()
+
+    def enable(self):
+        if self.mode == 'cprofile':
+            self._prof.enable()
+
+    def disable(self):
+        if self.mode == 'cprofile':
+            self._prof.disable()
+
+    def save(self, basename):
+        if self.mode == 'cprofile':
+            self._prof.dump_stats(basename + PSTATS_EXT)
+        else:
+            self._prof.stop()
+            self._prof.dump(basename + COLLAPSED_EXT)
+
+
+class _ProfiledBody(object):
+    # Keeps profiling while the body is produced and saves the profile when
+    # the body is closed
+    def __init__(self, result, profile, done):
+        self._result = result
+        self._profile = profile
+        self._done = done
+
+    def __iter__(self):
+        it = iter(self._result)
+        while True:
+            self._profile.enable()
+            try:
+                data = next(it)
+            except StopIteration:
+                return
+            finally:
+                self._profile.disable()
+
+            yield data
+
+    def close(self):
+        try:
+            if hasattr(self._result, 'close'):
+                self._profile.enable()
+                try:
+                    self._result.close()
+                finally:
+                    self._profile.disable()
+        finally:
+            self._done()
+
+
+class ProfileMiddleware(object):
+    '''
+    Profiles the requests which carry a valid trigger token (in the header
+    or the query arg given by ``FLASKPYLAR_PROFILE_HEADER/ARG``) and a
+    fraction ``FLASKPYLAR_PROFILE_SAMPLE`` of the others. The request runs
+    under ``cProfile`` (a ``.pstats`` file) or the stack sampler (a
+    ``.collapsed`` file) and the files are written to a directory per
+    endpoint under ``FLASKPYLAR_PROFILE_DIR``. Triggered responses name the
+    file in the profile header
+    '''
+    def __init__(self, app, secret_key, config):
+        self._app = app
+        self.secret_key = secret_key
+        self.mode = config['FLASKPYLAR_PROFILE_MODE']
+        if self.mode not in ('cprofile', 'sampler'):
+            raise ValueError('Unknown profile mode: {}'.format(self.mode))
+
+        self.directory = config['FLASKPYLAR_PROFILE_DIR']
+        self.sample = config['FLASKPYLAR_PROFILE_SAMPLE']
+        self.interval = config['FLASKPYLAR_PROFILE_INTERVAL']
+        self.header = config['FLASKPYLAR_PROFILE_HEADER']
+        self.arg = config['FLASKPYLAR_PROFILE_ARG']
+        self._environ_header = \
+            'HTTP_' + self.header.upper().replace('-', '_')
+        self._seq = itertools.count()
+
+    def triggered(self, environ):
+        '''Whether the request carries a valid trigger token'''
+        token = environ.get(self._environ_header)
+        if token is None and self.arg in environ.get('QUERY_STRING', ''):
+            token = url_decode(environ['QUERY_STRING']).get(self.arg)
+
+        return token is not None and check_trigger(self.secret_key, token)
+
+    def _basename(self, environ):
+        _, endpoint = environ.get(ROUTE_KEY, (None, None))
+        dirname = os.path.join(self.directory, endpoint or NO_ENDPOINT)
+        name = '{}-{}-{}'.format(int(time.time() * 1000), os.getpid(),
+                                 next(self._seq))
+        return dirname, name
+
+    def __call__(self, environ, start_response):
+        triggered = self.triggered(environ)
+        if not triggered and \
+           (not self.sample or random.random() >= self.sample):
+            return self._app(environ, start_response)
+
+        names = []
+        is_file_wrapper = file_wrappers(environ)
+
+        def _start_response(status, headers, exc_info=None):
+            # the endpoint is known once the app answers
+            names[:] = self._basename(environ)
+            if triggered:
+                headers = list(headers)
+                headers.append((self.header, '/'.join(names)))
+
+            return start_response(status, headers, exc_info)
+
+        def done():
+            if not names:
+                names[:] = self._basename(environ)
+
+            dirname, name = names
+            os.makedirs(dirname, exist_ok=True)
+            profile.save(os.path.join(dirname, name))
+
+        profile = _Profile(self.mode, self.interval)
+        profile.enable()
+        try:
+            result = self._app(environ, _start_response)
+        except Exception:
+            profile.disable()
+            done()
+            raise
+
+        profile.disable()
+        if is_file_wrapper(result):  # untouched, for sendfile
+            done()
+            return result
+
+        return _ProfiledBody(result, profile, done)
+
+
+def install(app):
+    '''
+    Wraps the wsgi app of the flask ``app`` with the profiler. Returns the
+    ``ProfileMiddleware``
+    '''
+    mark_routes(app)
+    profiler = ProfileMiddleware(app.wsgi_app, app.secret_key, app.config)
+    app.extensions[EXTENSION] = profiler
+    app.wsgi_app = profiler
+    return profiler
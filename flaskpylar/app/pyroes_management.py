@@ -7,6 +7,13 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+import itertools
+
+from . import app
+from .metrics import phase
+from .passwords import server_processes
+from .pyroes_store import FIELDS, make_pyroes_store
+
 
 _Pyroes = [
     {'pyd': 11, 'name': 'Pyro Nakamura'},
@@ -22,5 +29,127 @@ _Pyroes = [
 ]
 
 
-def get_pyroes(uid):
-    return _Pyroes
+# Users without pyroes of their own see _Pyroes
+_STORE = make_pyroes_store(app.config, default=_Pyroes)
+
+
+@phase('data')
+def get_pyroes(uid, after=None, limit=None, fields=FIELDS):
+    '''
+    Returns ``(pyroes, nxt)``: a page of at most ``limit`` pyroes of the user
+    with a pyd greater than ``after`` and only ``fields``. ``nxt`` is the
+    ``after`` for the next page or ``None`` after the last one
+    '''
+    if limit is None:
+        limit = app.config['FLASKPYLAR_PYROES_PAGE']
+
+    return _STORE.page(str(uid), after=after, limit=limit, fields=fields)
+
+
+@phase('data')
+def search_pyroes(uid, query, limit=None, fields=FIELDS):
+    '''
+    Returns at most ``limit`` pyroes of the user with names having words which
+    start with the words of ``query``
+    '''
+    if limit is None:
+        limit = app.config['FLASKPYLAR_SEARCH_LIMIT']
+
+    return _STORE.search(str(uid), query, limit=limit, fields=fields)
+
+
+def writes_shared():
+    '''
+    Tells if the pyroes written by a worker are seen by all: the store is
+    shared or there is a single worker process
+    '''
+    return _STORE.shared or server_processes() == 1
+
+
+@phase('data')
+def get_version(uid):
+    return _STORE.version(str(uid))
+
+
+@phase('data')
+def set_pyroes(uid, pyroes):
+    _STORE.set_pyroes(str(uid), pyroes)
+
+
+@phase('data')
+def add_pyroes(uid, pyroes):
+    _STORE.add_pyroes(str(uid), pyroes)
+
+
+def iter_pyroes(uid, fields=FIELDS, batch=1000):
+    '''Yields all the pyroes of the user in lists of at most ``batch``'''
+    uid, after = str(uid), None
+    while True:
+        pyroes, after = _STORE.page(uid, after=after, limit=batch,
+                                    fields=fields)
+        if pyroes:
+            yield pyroes
+
+        if after is None:
+            break
+
+
+# pyds are stored as sqlite INTEGERs (signed 64 bits)
+MAX_PYD = 2 ** 63 - 1
+
+
+def validate_pyro(pyro):
+    '''Returns a pyro with only FIELDS or raises ValueError'''
+    if not isinstance(pyro, dict):
+        raise ValueError('not an object')
+
+    pyd, name = pyro.get('pyd'), pyro.get('name')
+    if not isinstance(pyd, int) or isinstance(pyd, bool) or \
+       not 0 <= pyd <= MAX_PYD:
+        raise ValueError('pyd must be an integer from 0 to {}'.format(MAX_PYD))
+
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError('name must be a non-empty string')
+
+    return {'pyd': pyd, 'name': name}
+
+
+def import_pyroes(uid, pyroes, batch=1000, max_errors=10):
+    '''
+    Adds the (unvalidated) pyroes, an iterable which may be a stream, in
+    transactions of up to ``batch`` pyroes, yielding a summary per batch.
+    Invalid pyroes are skipped and reported (up to ``max_errors`` per batch).
+    The version of the data is bumped once at the end (also if the iterable
+    raises an exception) if anything was written
+    '''
+    uid, written = str(uid), False
+    pyroes = iter(pyroes)
+    try:
+        for nbatch in itertools.count():
+            start = nbatch * batch
+            items = list(itertools.islice(pyroes, batch))
+            if not items:
+                break
+
+            valid, errors = [], []
+            for i, pyro in enumerate(items, start):
+                try:
+                    valid.append(validate_pyro(pyro))
+                except ValueError as e:
+                    if len(errors) < max_errors:
+                        errors.append({'index': i, 'error': str(e)})
+
+            if valid:
+                _STORE.add_pyroes(uid, valid, bump=False)
+                written = True
+
+            yield {
+                'batch': nbatch,
+                'received': len(items),
+                'written': len(valid),
+                'rejected': len(items) - len(valid),
+                'errors': errors,
+            }
+    finally:
+        if written:
+            _STORE.bump_version(uid)
@@ -0,0 +1,409 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import bisect
+import itertools
+import re
+import threading
+
+from .sqlite_store import SqliteStore
+
+FIELDS = ('pyd', 'name')
+
+_WORD_RE = re.compile(r'\w+')
+TOKEN_END = '\U0010ffff'  # sorts after any token with a given prefix
+WRITE_CHUNK = 10000  # pyroes per executemany when writing
+SEARCH_PROBE = 1000  # entries counted (at most) per term to choose the scan
+
+
+def paginate(pyroes, keys, after, limit, fields):
+    '''
+    Page of the ``pyroes`` (sorted by pyd, with ``keys`` the pyds) after the
+    pyd ``after`` (``None`` for the start). See ``PyroesStore.page``
+    '''
+    start = 0 if after is None else bisect.bisect_right(keys, after)
+    items = pyroes[start:start + limit]
+    nxt = items[-1]['pyd'] if start + limit < len(pyroes) else None
+    return [{f: p[f] for f in fields} for p in items], nxt
+
+
+def tokenize(text):
+    '''Lowercase words of text (sorted and without repetitions)'''
+    return sorted(set(_WORD_RE.findall(text.lower())))
+
+
+def _scan(rows, prefix, others, limit, fields):
+    # rows: (token, pyd, name) sorted by token from the first token >= prefix.
+    # Names have to match the other prefixes too
+    res, seen = [], set()
+    # lookaheads: a word starting with each of the others anywhere
+    match = others and re.compile(''.join(
+        r'(?=.*\b' + re.escape(o) + ')' for o in others), re.DOTALL).match
+    for token, pyd, name in rows:
+        if len(res) >= limit or not token.startswith(prefix):
+            break
+
+        if pyd in seen:
+            continue
+
+        seen.add(pyd)
+        if match and not match(name.lower()):
+            continue
+
+        pyro = {'pyd': pyd, 'name': name}
+        res.append({f: pyro[f] for f in fields})
+
+    return res
+
+
+class TokenIndex(object):
+    '''
+    Sorted array of ``(token, pyd)`` for the words of the names of pyroes.
+    Looking up a prefix is a binary search and a scan of the entries which
+    have it
+    '''
+    def __init__(self, pyroes):
+        self._names = {p['pyd']: p['name'] for p in pyroes}
+        self._entries = sorted((t, pyd) for pyd, name in self._names.items()
+                               for t in tokenize(name))
+
+    def _count(self, prefix):
+        entries = self._entries
+        return (bisect.bisect_left(entries, (prefix + TOKEN_END,)) -
+                bisect.bisect_left(entries, (prefix,)))
+
+    def _rows(self, prefix):
+        entries, names = self._entries, self._names
+        for i in range(bisect.bisect_left(entries, (prefix,)), len(entries)):
+            token, pyd = entries[i]
+            yield token, pyd, names[pyd]
+
+    def search(self, query, limit, fields=FIELDS):
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        # scan the entries of the most selective term, checking the others
+        prefix = min(terms, key=self._count)
+        others = [t for t in terms if t != prefix]
+        return _scan(self._rows(prefix), prefix, others, limit, fields)
+
+
+class PyroesStore(object):
+    '''
+    Interface for the storage of the pyroes of each user, as dictionaries
+    with ``FIELDS`` and kept ordered by ``pyd`` (unique per user). Users
+    without pyroes of their own see the ``default`` ones. ``shared`` tells if
+    all worker processes see the same data
+    '''
+    shared = False
+
+    def __init__(self, default=()):
+        self.default = sorted(default, key=lambda p: p['pyd'])
+        self._default_keys = [p['pyd'] for p in self.default]
+        self._default_index = TokenIndex(self.default)
+
+    def _default_page(self, after, limit, fields):
+        return paginate(self.default, self._default_keys, after, limit, fields)
+
+    def page(self, uid, after=None, limit=100, fields=FIELDS):
+        '''
+        Returns ``(pyroes, nxt)`` with at most ``limit`` pyroes with a pyd
+        greater than ``after`` and only ``fields``. ``nxt`` is the ``after``
+        for the next page or ``None`` if this is the last one
+        '''
+        raise NotImplementedError
+
+    def search(self, uid, query, limit=20, fields=FIELDS):
+        '''
+        Returns at most ``limit`` pyroes (with ``fields``) with names which
+        have words starting with each of the words of ``query`` (case is
+        ignored), ordered by the matching word
+        '''
+        raise NotImplementedError
+
+    def version(self, uid):
+        '''
+        Returns the version of the data of the user, which changes with each
+        update. ``0`` if the user has no pyroes of its own
+        '''
+        raise NotImplementedError
+
+    def set_pyroes(self, uid, pyroes):
+        '''Replaces the pyroes of the user'''
+        raise NotImplementedError
+
+    def add_pyroes(self, uid, pyroes, bump=True):
+        '''
+        Adds (or replaces those with the same pyd) pyroes of the user in a
+        single transaction. With ``bump`` false the version is left as it is,
+        to update it once with ``bump_version`` after several additions
+        '''
+        raise NotImplementedError
+
+    def bump_version(self, uid):
+        '''Changes the version of the data of the user'''
+        raise NotImplementedError
+
+
+class MemoryPyroesStore(PyroesStore):
+    '''
+    Pyroes kept in sorted lists per user in the process. The search index of
+    a user is made on the first search after a change. Not ``shared``: writes
+    are only seen by the worker which takes them
+    '''
+    def __init__(self, default=()):
+        super().__init__(default)
+        self._pyroes = {}  # uid: (keys, pyroes)
+        self._indexes = {}  # uid: TokenIndex
+        self._versions = {}
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def page(self, uid, after=None, limit=100, fields=FIELDS):
+        try:
+            keys, pyroes = self._pyroes[uid]
+        except KeyError:
+            return self._default_page(after, limit, fields)
+
+        return paginate(pyroes, keys, after, limit, fields)
+
+    def search(self, uid, query, limit=20, fields=FIELDS):
+        index = self._indexes.get(uid)
+        if index is None:
+            with self._lock:
+                try:
+                    _, pyroes = self._pyroes[uid]
+                except KeyError:
+                    index = self._default_index
+                else:
+                    index = self._indexes[uid] = TokenIndex(pyroes)
+
+        return index.search(query, limit, fields)
+
+    def version(self, uid):
+        return self._versions.get(uid, 0)
+
+    def _set(self, uid, bypyd, bump=True):
+        pyroes = [bypyd[k] for k in sorted(bypyd)]
+        self._pyroes[uid] = ([p['pyd'] for p in pyroes], pyroes)
+        self._indexes.pop(uid, None)
+        if bump:
+            self._versions[uid] = next(self._counter)
+
+    def set_pyroes(self, uid, pyroes):
+        with self._lock:
+            self._set(uid, {p['pyd']: dict(p) for p in pyroes})
+
+    def add_pyroes(self, uid, pyroes, bump=True):
+        with self._lock:
+            _, old = self._pyroes.get(uid, ((), ()))
+            bypyd = {p['pyd']: p for p in old}
+            bypyd.update((p['pyd'], dict(p)) for p in pyroes)
+            self._set(uid, bypyd, bump=bump)
+
+    def bump_version(self, uid):
+        with self._lock:
+            self._versions[uid] = next(self._counter)
+
+
+class SqlitePyroesStore(PyroesStore, SqliteStore):
+    '''
+    Pyroes kept in a SQLite database, clustered by ``(uid, pyd)``, so that a
+    page is a range scan of the primary key, which doesn't depend on how many
+    pyroes the user has. The words of the names are kept (in the same
+    transactions) in a table clustered by ``(uid, token, pyd)`` for prefix
+    searches. Versions are kept in the database and therefore shared by all
+    workers
+    '''
+    shared = True
+
+    SQL_SCHEMA = ('''
+        CREATE TABLE IF NOT EXISTS pyroes (
+            uid INTEGER NOT NULL,
+            pyd INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            PRIMARY KEY (uid, pyd)
+        ) WITHOUT ROWID
+    ''', '''
+        CREATE TABLE IF NOT EXISTS pyroes_versions (
+            uid INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''', '''
+        CREATE TABLE IF NOT EXISTS pyroes_tokens (
+            uid INTEGER NOT NULL,
+            token TEXT NOT NULL,
+            pyd INTEGER NOT NULL,
+            PRIMARY KEY (uid, token, pyd)
+        ) WITHOUT ROWID
+    ''', '''
+        CREATE INDEX IF NOT EXISTS pyroes_tokens_pyd
+        ON pyroes_tokens (uid, pyd)
+    ''')
+    # First page and next pages, per projection (fields are validated against
+    # FIELDS and pyd is always fetched for the cursor)
+    SQL_FIRST = 'SELECT pyd{} FROM pyroes WHERE uid = ? ORDER BY pyd LIMIT ?'
+    SQL_AFTER = ('SELECT pyd{} FROM pyroes WHERE uid = ? AND pyd > ? '
+                 'ORDER BY pyd LIMIT ?')
+    SQL_VERSION = 'SELECT version FROM pyroes_versions WHERE uid = ?'
+    SQL_BUMP = '''
+        INSERT OR REPLACE INTO pyroes_versions (uid, version)
+        VALUES (?, COALESCE(
+            (SELECT version FROM pyroes_versions WHERE uid = ?), 0) + 1)
+    '''
+    SQL_DELETE = 'DELETE FROM pyroes WHERE uid = ?'
+    SQL_ADD = 'INSERT OR REPLACE INTO pyroes (uid, pyd, name) VALUES (?, ?, ?)'
+    SQL_SEARCH = '''
+        SELECT t.token, t.pyd, p.name FROM pyroes_tokens AS t
+        JOIN pyroes AS p ON p.uid = t.uid AND p.pyd = t.pyd
+        WHERE t.uid = ? AND t.token >= ? AND t.token < ?
+        ORDER BY t.token, t.pyd
+    '''
+    SQL_TOKENS_DELETE = 'DELETE FROM pyroes_tokens WHERE uid = ?'
+    SQL_TOKENS_DELETE_PYD = \
+        'DELETE FROM pyroes_tokens WHERE uid = ? AND pyd = ?'
+    SQL_TOKENS_ADD = ('INSERT OR IGNORE INTO pyroes_tokens (uid, token, pyd) '
+                      'VALUES (?, ?, ?)')
+    SQL_PROBE = '''
+        SELECT COUNT(*) FROM (
+            SELECT 1 FROM pyroes_tokens
+            WHERE uid = ? AND token >= ? AND token < ? LIMIT ?)
+    '''
+    SQL_ANY_TOKEN = 'SELECT 1 FROM pyroes_tokens LIMIT 1'
+    SQL_ALL = 'SELECT uid, pyd, name FROM pyroes'
+
+    def __init__(self, path, poolsize=4, timeout=5.0, default=()):
+        PyroesStore.__init__(self, default)
+        SqliteStore.__init__(self, path, poolsize=poolsize, timeout=timeout)
+        with self.connection() as conn:
+            if conn.execute(self.SQL_ANY_TOKEN).fetchone() is None:
+                self._reindex(conn)  # pyroes from before the search index
+
+    def _reindex(self, conn):
+        rows = conn.execute(self.SQL_ALL)
+        while True:
+            chunk = rows.fetchmany(WRITE_CHUNK)
+            if not chunk:
+                break
+
+            conn.executemany(self.SQL_TOKENS_ADD,
+                             ((uid, t, pyd) for uid, pyd, name in chunk
+                              for t in tokenize(name)))
+
+    @staticmethod
+    def _columns(fields):
+        return ''.join(', ' + f for f in fields if f != 'pyd')
+
+    def page(self, uid, after=None, limit=100, fields=FIELDS):
+        uid = int(uid)
+        cols = self._columns(fields)
+        with self.connection() as conn:
+            if after is None:
+                sql, args = self.SQL_FIRST, (uid, limit + 1)
+            else:
+                sql, args = self.SQL_AFTER, (uid, after, limit + 1)
+
+            rows = conn.execute(sql.format(cols), args).fetchall()
+            if not rows and not self._version(conn, uid):
+                return self._default_page(after, limit, fields)
+
+        nxt = rows[limit - 1][0] if len(rows) > limit else None
+        names = ('pyd',) + tuple(f for f in fields if f != 'pyd')
+        pyroes = []
+        for row in rows[:limit]:
+            p = dict(zip(names, row))
+            pyroes.append({f: p[f] for f in fields})
+
+        return pyroes, nxt
+
+    def search(self, uid, query, limit=20, fields=FIELDS):
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        uid = int(uid)
+        with self.connection() as conn:
+            prefix = terms[0]
+            if len(terms) > 1:  # scan the most selective term (up to PROBE)
+                def probe(t):
+                    args = (uid, t, t + TOKEN_END, SEARCH_PROBE)
+                    return conn.execute(self.SQL_PROBE, args).fetchone()[0]
+
+                prefix = min(terms, key=probe)
+
+            others = [t for t in terms if t != prefix]
+            rows = conn.execute(self.SQL_SEARCH,
+                                (uid, prefix, prefix + TOKEN_END))
+            res = _scan(rows, prefix, others, limit, fields)
+            rows.close()
+            if not res and not self._version(conn, uid):
+                return self._default_index.search(query, limit, fields)
+
+        return res
+
+    def _version(self, conn, uid):
+        row = conn.execute(self.SQL_VERSION, (uid,)).fetchone()
+        return row[0] if row else 0
+
+    def version(self, uid):
+        with self.connection() as conn:
+            return self._version(conn, int(uid))
+
+    def _add(self, conn, uid, pyroes, bump=True, replace=True):
+        # In chunks, for pyroes to be a generator (used twice per chunk). With
+        # replace, the words of pyroes which are replaced are removed
+        pyroes = iter(pyroes)
+        while True:
+            chunk = list(itertools.islice(pyroes, WRITE_CHUNK))
+            if not chunk:
+                break
+
+            if replace:
+                conn.executemany(self.SQL_TOKENS_DELETE_PYD,
+                                 ((uid, p['pyd']) for p in chunk))
+
+            conn.executemany(self.SQL_ADD,
+                             ((uid, p['pyd'], p['name']) for p in chunk))
+            conn.executemany(self.SQL_TOKENS_ADD,
+                             ((uid, t, p['pyd']) for p in chunk
+                              for t in tokenize(p['name'])))
+
+        if bump:
+            conn.execute(self.SQL_BUMP, (uid, uid))
+
+    def set_pyroes(self, uid, pyroes):
+        uid = int(uid)
+        with self.connection() as conn:
+            conn.execute(self.SQL_DELETE, (uid,))
+            conn.execute(self.SQL_TOKENS_DELETE, (uid,))
+            self._add(conn, uid, pyroes, replace=False)
+
+    def add_pyroes(self, uid, pyroes, bump=True):
+        uid = int(uid)
+        with self.connection() as conn:
+            self._add(conn, uid, pyroes, bump=bump)
+
+    def bump_version(self, uid):
+        with self.connection() as conn:
+            conn.execute(self.SQL_BUMP, (int(uid), int(uid)))
+
+
+def make_pyroes_store(config, default=()):
+    '''Creates the store named in FLASKPYLAR_PYROES_STORE'''
+    kind = config['FLASKPYLAR_PYROES_STORE']
+    if kind == 'memory':
+        return MemoryPyroesStore(default=default)
+
+    if kind == 'sqlite':
+        return SqlitePyroesStore(config['FLASKPYLAR_PYROES_DB'],
+                                 poolsize=config['FLASKPYLAR_PYROES_DB_POOL'],
+                                 default=default)
+
+    raise ValueError('Unknown pyroes store: {}'.format(kind))
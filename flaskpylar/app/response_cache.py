@@ -0,0 +1,64 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import hashlib
+
+from flask import json
+
+from . import compress
+from .lru_cache import LRUCache
+from .metrics import phase
+
+
+JsonEntry = collections.namedtuple(
+    'JsonEntry', ['version', 'etag', 'body', 'headers', 'encoded'])
+
+
+class JsonResponseCache(object):
+    '''
+    Keeps encoded json bodies (with an ETag) per key, for example per user.
+    An entry is valid as long as the version of the data it was made from
+    (given by the caller) doesn't change, which avoids serializing unchanged
+    data again and lets conditional requests be answered with 304
+    '''
+    def __init__(self, maxsize, ttl=None):
+        self._cache = LRUCache(maxsize, ttl=ttl)
+
+    def get(self, key, version, loader):
+        '''
+        Returns a ``JsonEntry`` for key, calling ``loader`` if there is no
+        entry for ``version``. It returns the data to serialize and the
+        headers (a dict) which go with it
+        '''
+        entry = self._cache.get(key)
+        if entry is None or entry.version != version:
+            data, headers = loader()
+            with phase('serialize'):
+                body = json.dumps(data).encode('utf-8')
+                etag = hashlib.sha1(body).hexdigest()
+
+            entry = JsonEntry(version, etag, body, headers, {})
+            self._cache.set(key, entry)
+
+        return entry
+
+    def send(self, key, version, loader):
+        '''
+        Returns a response for the data of key/version which has to be
+        revalidated by the client. Matching ``If-None-Match`` gets a 304. The
+        body is compressed if the client accepts it (once per encoding)
+        '''
+        entry = self.get(key, version, loader)
+        resp = compress.send_cached(entry.body, entry.encoded,
+                                    'application/json', entry.etag)
+        resp.headers.extend(entry.headers)
+        resp.cache_control.private = True
+        resp.cache_control.no_cache = True
+        return resp
@@ -0,0 +1,84 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import contextlib
+import os
+import queue
+import sqlite3
+import threading
+
+
+class SqliteStore(object):
+    '''
+    Base for stores kept in a SQLite database. Each worker process has its
+    own pool of connections, which also keep the compiled statements (the SQL
+    strings of the stores are constant). The statements in ``SQL_SCHEMA`` are
+    executed when the store is created, with a connection which is closed
+    afterwards: stores made before forking (see create_app) don't hand one
+    down to the workers
+    '''
+    SQL_SCHEMA = ()
+
+    def __init__(self, path, poolsize=4, timeout=5.0):
+        self.path = path
+        self.poolsize = poolsize
+        self.timeout = timeout
+        self._pid = None
+        self._pool = None
+        self._inherited = None  # pool of the parent process (see _get_pool)
+        self._lock = threading.Lock()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('PRAGMA journal_mode=WAL')  # readers don't block
+                for sql in self.SQL_SCHEMA:
+                    conn.execute(sql)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout,
+                               check_same_thread=False,
+                               cached_statements=64)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _get_pool(self):
+        # Connections can't cross a fork: a new pool for a new process. The
+        # pool is in place before the pid, for threads not holding the lock
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    if self._pid is not None:
+                        # not used, nor closed (it would be in the parent's
+                        # files): kept from being collected
+                        self._inherited = self._pool
+
+                    self._pool = queue.LifoQueue(maxsize=self.poolsize)
+                    self._pid = pid
+
+        return self._pool
+
+    @contextlib.contextmanager
+    def connection(self):
+        pool = self._get_pool()
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+
+        try:
+            with conn:  # commit / rollback
+                yield conn
+        finally:
+            try:
+                pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
@@ -0,0 +1,71 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import mimetypes
+import os.path
+
+from flask import current_app, request, safe_join, send_file
+from werkzeug.exceptions import NotFound
+
+from . import compress
+
+# Precompressed siblings generated by app-manager.py, in order of preference.
+# Files are never compressed on the fly
+PRECOMPRESSED = (
+    ('br', '.br'),
+    ('gzip', '.gz'),
+)
+
+
+def send_precompressed(directory, filename, **kwargs):
+    '''
+    Replacement for ``send_from_directory`` which delivers a precompressed
+    sibling (``filename.br``, ``filename.gz``) of the requested file if the
+    client accepts the encoding and the sibling exists.
+    '''
+    compress.skip()  # never compressed on the fly
+
+    filename = safe_join(directory, filename)
+    if not os.path.isabs(filename):
+        filename = os.path.join(current_app.root_path, filename)
+
+    if not os.path.isfile(filename):
+        raise NotFound()
+
+    # mimetype has to be that of the original and not that of the sibling
+    mimetype = kwargs.pop('mimetype', None)
+    if mimetype is None:
+        mimetype = mimetypes.guess_type(filename)[0]
+        if mimetype is None:
+            mimetype = 'application/octet-stream'
+
+    kwargs.setdefault('conditional', True)
+
+    encoding, has_siblings = None, False
+    accepted = request.accept_encodings
+    for enc, ext in PRECOMPRESSED:
+        if not os.path.isfile(filename + ext):
+            continue
+
+        has_siblings = True
+        if encoding is None and accepted[enc]:
+            encoding = enc
+            sendname = filename + ext
+
+    if encoding is None:
+        sendname = filename
+
+    resp = send_file(sendname, mimetype=mimetype, **kwargs)
+    if encoding is not None:
+        resp.headers['Content-Encoding'] = encoding
+
+    if has_siblings:  # the answer depends on what the client accepts
+        resp.vary.add('Accept-Encoding')
+
+    return resp
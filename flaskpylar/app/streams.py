@@ -0,0 +1,161 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import codecs
+import json as stdjson
+import zlib
+
+from flask import Response, json, request
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+READ_SIZE = 64 * 1024
+MAX_ITEM = 1024 * 1024  # chars of an element of a json array being parsed
+NUMBER_CHARS = frozenset('0123456789+-.eE')
+
+
+def ndjson_chunks(batches):
+    '''Yields one chunk (bytes) of newline delimited json per batch'''
+    for batch in batches:
+        yield ''.join(json.dumps(x) + '\n' for x in batch).encode('utf-8')
+
+
+def gzip_chunks(chunks, level=6):
+    '''Compresses the stream of chunks as a single gzip member'''
+    z = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = z.compress(chunk)
+        if data:
+            yield data
+
+    yield z.flush()
+
+
+def stream_ndjson(batches, level=6):
+    '''
+    Returns a streamed response with the items of ``batches`` (an iterable
+    of lists) as NDJSON. Only one batch is in memory at a time. The stream is
+    gzipped if the client accepts it
+    '''
+    chunks = ndjson_chunks(batches)
+    gzipped = bool(request.accept_encodings['gzip'])
+    if gzipped:
+        chunks = gzip_chunks(chunks, level=level)
+
+    resp = Response(chunks, mimetype=NDJSON_MIMETYPE)
+    if gzipped:
+        resp.headers['Content-Encoding'] = 'gzip'
+
+    resp.vary.add('Accept-Encoding')
+    resp.cache_control.private = True
+    resp.cache_control.no_store = True
+    resp.headers['X-Accel-Buffering'] = 'no'  # nginx: pass chunks along
+    return resp
+
+
+def _text_chunks(stream, size=READ_SIZE):
+    # Decoded (utf-8) chunks of stream, without splitting characters
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while True:
+        data = stream.read(size)
+        text = decoder.decode(data, final=not data)
+        if text:
+            yield text
+
+        if not data:
+            break
+
+
+def iter_ndjson(stream, size=READ_SIZE):
+    '''
+    Yields the values of a NDJSON stream (a file-like object with bytes),
+    reading ``size`` bytes at a time. Raises ``ValueError`` if a line is not
+    valid json
+    '''
+    buf = ''
+    for text in _text_chunks(stream, size):
+        lines = (buf + text).split('\n')
+        buf = lines.pop()  # last line may be incomplete
+        for line in lines:
+            if line.strip():
+                yield stdjson.loads(line)
+
+    if buf.strip():
+        yield stdjson.loads(buf)
+
+
+def iter_json_array(stream, size=READ_SIZE, max_item=MAX_ITEM):
+    '''
+    Yields the elements of a json array read from stream (a file-like object
+    with bytes) ``size`` bytes at a time, without holding the whole array in
+    memory. Raises ``ValueError`` if it is not a valid json array or if an
+    element is longer than ``max_item`` chars
+    '''
+    decoder = stdjson.JSONDecoder()
+    chunks = _text_chunks(stream, size)
+    buf, pos, eof = '', 0, False
+
+    def more():
+        # Appends a chunk to the buffer dropping what has been consumed
+        nonlocal buf, pos, eof
+        text = next(chunks, None)
+        if text is None:
+            eof = True
+        else:
+            buf, pos = buf[pos:] + text, 0
+
+    def skip_ws():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+
+            if pos < len(buf) or eof:
+                return
+            more()
+
+    def expect(chars):
+        nonlocal pos
+        skip_ws()
+        if pos >= len(buf) or buf[pos] not in chars:
+            raise ValueError('Expected one of "{}" at char {}'.format(
+                chars, pos))
+        pos += 1
+        return buf[pos - 1]
+
+    expect('[')
+    skip_ws()
+    if pos < len(buf) and buf[pos] == ']':
+        pos += 1
+    else:
+        while True:
+            skip_ws()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                except ValueError:
+                    if eof or len(buf) - pos > max_item:
+                        raise
+                    more()  # the value may be incomplete
+                    continue
+
+                # a number followed only by what could still be part of it
+                # ("1." of "1.5") may go on in the next chunk
+                if eof or not isinstance(value, (int, float)) or \
+                   not NUMBER_CHARS.issuperset(buf[end:]):
+                    break
+                more()
+
+            pos = end
+            yield value
+            if expect(',]') == ']':
+                break
+
+    skip_ws()
+    if pos < len(buf):
+        raise ValueError('Extra data after the array at char {}'.format(pos))
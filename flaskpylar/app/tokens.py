@@ -0,0 +1,106 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import base64
+import hashlib
+import hmac
+import time
+
+from flask.sessions import SecureCookieSession, SecureCookieSessionInterface
+
+from .metrics import phase
+
+# Bearer tokens for the api: "uid.expiry.signature", with the signature being
+# an HMAC (sha256) of "uid.expiry" keyed with the app SECRET_KEY. The claims
+# are verified without any lookup of the user in the store
+TOKEN_SALT = b'flaskpylar-api-token'
+ENVIRON_KEY = 'flaskpylar.token_uid'
+
+
+def _signature(key, payload, salt):
+    if not isinstance(key, bytes):
+        key = key.encode('utf-8')
+
+    mac = hmac.new(salt + key, payload, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(mac).rstrip(b'=')
+
+
+def make_token(key, uid, ttl, now=None, salt=TOKEN_SALT):
+    '''
+    Returns a token for ``uid`` valid for ``ttl`` seconds. Tokens for other
+    purposes use another ``salt``
+    '''
+    expiry = int((now or time.time()) + ttl)
+    payload = '{}.{}'.format(uid, expiry).encode('utf-8')
+    return (payload + b'.' + _signature(key, payload, salt)).decode('ascii')
+
+
+def load_token(key, token, now=None, salt=TOKEN_SALT):
+    '''Returns the uid of ``token`` or ``None`` if invalid/expired'''
+    try:
+        payload, sig = token.encode('ascii').rsplit(b'.', 1)
+        uid, expiry = payload.decode('ascii').rsplit('.', 1)
+        expiry = int(expiry)
+    except (UnicodeError, ValueError):
+        return None
+
+    if not hmac.compare_digest(sig, _signature(key, payload, salt)):
+        return None
+
+    if expiry < (now or time.time()):
+        return None
+
+    return uid
+
+
+def bearer_token(request):
+    # The token from an "Authorization: Bearer xxx" header or None
+    auth = request.headers.get('Authorization', '')
+    scheme, _, token = auth.partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+
+    return token.strip()
+
+
+class TokenSession(SecureCookieSession):
+    # Session of a token request: never written back as a cookie
+    pass
+
+
+class TokenSessionInterface(SecureCookieSessionInterface):
+    '''
+    Api requests (path under ``prefix``) carrying a valid bearer token get
+    an empty session, skipping the decoding of the session cookie and never
+    setting it. The uid of the token is left in the wsgi environ for the
+    request loader of flask-login. Other requests use the cookie session as
+    usual
+    '''
+    def __init__(self, prefix='/api/'):
+        self.prefix = prefix
+
+    @phase('auth')
+    def open_session(self, app, request):
+        token = None
+        if request.path.startswith(self.prefix):
+            token = bearer_token(request)
+
+        if token is not None:
+            uid = load_token(app.secret_key, token)
+            if uid is not None:
+                request.environ[ENVIRON_KEY] = uid
+                return TokenSession()
+
+        return super().open_session(app, request)
+
+    def save_session(self, app, session, response):
+        if isinstance(session, TokenSession):
+            return
+
+        return super().save_session(app, session, response)
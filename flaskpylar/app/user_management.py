@@ -7,50 +7,105 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
-from flask_login import LoginManager, UserMixin
-from passlib.apps import custom_app_context as pwd_context
+from flask_login import LoginManager
 
 
 from . import app
+from . import tokens
+from .lru_cache import LRUCache
+from .metrics import phase
+from .passwords import verifier
+from .user_store import make_user_store
 
 login_manager = LoginManager(app)  # available as app.login_manager
 
+# flask-login calls the user_loader on each request. Keep the users of the
+# last sessions around (per worker) to skip the store
+_user_cache = LRUCache(app.config['FLASKPYLAR_USER_CACHE_SIZE'],
+                       ttl=app.config['FLASKPYLAR_USER_CACHE_TTL'])
+
 
 @login_manager.user_loader
+@phase('auth')
 def load_user(uid):
-    return User.get_by_id(uid)
+    user = _user_cache.get(uid)
+    if user is None:
+        user = User.get_by_id(uid)
+        if user is not None:
+            _user_cache.set(uid, user)
+
+    return user
+
+
+@login_manager.request_loader
+def load_user_from_token(request):
+    # The token was verified when opening the session (tokens.py)
+    uid = request.environ.get(tokens.ENVIRON_KEY)
+    if uid is None:
+        return None
+
+    # Only the id is carried by the token: no store lookup
+    return User(uid, None, None)
+
 
+class User(object):
+    # Implements what flask_login.UserMixin does, which has no __slots__ and
+    # would therefore bring a __dict__ to each instance
+    __slots__ = ('id', 'username', 'passhash')
 
-class User(UserMixin):
-    _USERS = {
-        'test': ('0', pwd_context.encrypt('test')),  # name: (uid, pwd)
-    }
+    _STORE = make_user_store(app.config)
+    _STORE.add('test', verifier.hash('test'))  # name, pwd
 
-    # Convert to: uid: (name, hash)
-    _USERS_ID = {idpwd[0]: (name, idpwd[1]) for name, idpwd in _USERS.items()}
+    is_active = True
+    is_authenticated = True
+    is_anonymous = False
 
     def __init__(self, uid, username, passhash):
-        self.id = uid  # mixin expects 'id'
+        self.id = uid  # flask-login expects 'id'
         self.username = username
         self.passhash = passhash
 
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        if isinstance(other, User):
+            return self.get_id() == other.get_id()
+
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = object.__hash__
+
+    @phase('auth')
     def check_password(self, password):
-        return pwd_context.verify(password, self.passhash)
+        # May raise passwords.VerifierBusy if too many are being checked
+        verified, newhash = verifier.verify_and_update(password,
+                                                       self.passhash)
+        if verified and newhash is not None:
+            # scheme/rounds have changed: rehash transparently
+            User._STORE.set_passhash(self.id, newhash)
+            _user_cache.pop(self.id)
+            self.passhash = newhash
+
+        return verified
 
     @staticmethod
     def get_by_id(uid):
-        try:
-            username, passhash = User._USERS_ID[uid]
-        except KeyError:
+        user = User._STORE.get_by_id(uid)
+        if user is None:
             return None  # Failed to find user by uid
 
-        return User(uid, username, passhash)
+        return User(*user)
 
     @staticmethod
+    @phase('auth')
     def get_by_name(username):
-        try:
-            uid, passhash = User._USERS[username]
-        except KeyError:
+        user = User._STORE.get_by_name(username)
+        if user is None:
             return None  # Failed to find user by name
 
-        return User(uid, username, passhash)
+        return User(*user)
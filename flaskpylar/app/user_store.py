@@ -0,0 +1,135 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import threading
+
+from .sqlite_store import SqliteStore
+
+
+class UserStore(object):
+    '''
+    Interface for the storage of users. Users are returned as tuples
+    ``(uid, username, passhash)`` with ``uid`` as a string (as flask-login
+    uses it) or ``None`` if not found
+    '''
+    def get_by_id(self, uid):
+        raise NotImplementedError
+
+    def get_by_name(self, username):
+        raise NotImplementedError
+
+    def add(self, username, passhash):
+        '''Adds a user if not present and returns its uid'''
+        raise NotImplementedError
+
+    def set_passhash(self, uid, passhash):
+        raise NotImplementedError
+
+
+class MemoryUserStore(UserStore):
+    '''Users kept in dictionaries (by name and by id) in the process'''
+    def __init__(self):
+        self._users = {}  # name: (uid, pwd)
+        self._users_id = {}  # uid: (name, pwd)
+        self._lock = threading.Lock()
+
+    def get_by_id(self, uid):
+        try:
+            username, passhash = self._users_id[uid]
+        except KeyError:
+            return None
+
+        return uid, username, passhash
+
+    def get_by_name(self, username):
+        try:
+            uid, passhash = self._users[username]
+        except KeyError:
+            return None
+
+        return uid, username, passhash
+
+    def add(self, username, passhash):
+        with self._lock:
+            if username in self._users:
+                return self._users[username][0]
+
+            uid = str(len(self._users))
+            self._users[username] = (uid, passhash)
+            self._users_id[uid] = (username, passhash)
+            return uid
+
+    def set_passhash(self, uid, passhash):
+        with self._lock:
+            username, _ = self._users_id[uid]
+            self._users[username] = (uid, passhash)
+            self._users_id[uid] = (username, passhash)
+
+
+class SqliteUserStore(UserStore, SqliteStore):
+    '''
+    Users kept in a SQLite database with indexed lookups by id (primary key)
+    and name (unique index)
+    '''
+    SQL_SCHEMA = ('''
+        CREATE TABLE IF NOT EXISTS users (
+            uid INTEGER PRIMARY KEY,
+            username TEXT NOT NULL UNIQUE,
+            passhash TEXT NOT NULL
+        )
+    ''',)
+    SQL_BY_ID = 'SELECT uid, username, passhash FROM users WHERE uid = ?'
+    SQL_BY_NAME = \
+        'SELECT uid, username, passhash FROM users WHERE username = ?'
+    SQL_ADD = 'INSERT OR IGNORE INTO users (username, passhash) VALUES (?, ?)'
+    SQL_PASSHASH = 'UPDATE users SET passhash = ? WHERE uid = ?'
+
+    @staticmethod
+    def _row(row):
+        if row is None:
+            return None
+
+        return str(row[0]), row[1], row[2]
+
+    def get_by_id(self, uid):
+        try:
+            uid = int(uid)
+        except (TypeError, ValueError):
+            return None
+
+        with self.connection() as conn:
+            return self._row(conn.execute(self.SQL_BY_ID, (uid,)).fetchone())
+
+    def get_by_name(self, username):
+        with self.connection() as conn:
+            row = conn.execute(self.SQL_BY_NAME, (username,)).fetchone()
+            return self._row(row)
+
+    def add(self, username, passhash):
+        with self.connection() as conn:
+            conn.execute(self.SQL_ADD, (username, passhash))
+            row = conn.execute(self.SQL_BY_NAME, (username,)).fetchone()
+            return str(row[0])
+
+    def set_passhash(self, uid, passhash):
+        with self.connection() as conn:
+            conn.execute(self.SQL_PASSHASH, (passhash, int(uid)))
+
+
+def make_user_store(config):
+    '''Creates the store named in FLASKPYLAR_USER_STORE'''
+    kind = config['FLASKPYLAR_USER_STORE']
+    if kind == 'memory':
+        return MemoryUserStore()
+
+    if kind == 'sqlite':
+        return SqliteUserStore(config['FLASKPYLAR_USER_DB'],
+                               poolsize=config['FLASKPYLAR_USER_DB_POOL'])
+
+    raise ValueError('Unknown user store: {}'.format(kind))
@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+'''
+ASGI entry point, to be run with an ASGI server, for example:
+
+    uvicorn asgi:application --workers 2 --uds /tmp/flaskpylar.sock
+
+Like uwsgi with run.py, it runs the packed application (not testing)
+'''
+from app import create_app
+from app.asgi import AsgiApp
+
+application = AsgiApp(create_app())
@@ -0,0 +1,8 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+# Benchmarks for the application. Run them from the flaskpylar directory, for
+# example: python -m bench.login_load --help
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+'''
+Throughput of /api/pyroes through a threaded server without access log, with
+all requests logged and with a sample of them. The log goes to a temporary
+file:
+
+    python -m bench.access_log --clients 8 --sample 0.1
+'''
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from . import common
+
+
+def load(port, clients, duration, url, headers):
+    lats = []
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def loop():
+        while time.monotonic() < stop_at:
+            status, _, _, lat = common.request(port, 'GET', url,
+                                               headers=headers)
+            if status != 200:
+                raise SystemExit('request failed: {}'.format(status))
+            with lock:
+                lats.append(lat)
+
+    threads = [threading.Thread(target=loop) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return common.summarize(lats, duration)
+
+
+def run(pargs=None):
+    args = parse_args(pargs)
+
+    from app import app
+    from app import access_log
+    from app import tokens
+    app.config['FLASKPYLAR_ACCESS_LOG'] = False  # installed per mode below
+    app.setup()
+    base = app.wsgi_app
+
+    token = tokens.make_token(app.secret_key, '0', 3600)
+    headers = {'Authorization': 'Bearer ' + token}
+    logdir = tempfile.mkdtemp()
+
+    server = common.start_server(app)
+    port = server.server_port
+
+    result = {'config': vars(args)}
+    modes = [('off', None), ('all', 1.0), ('sampled', args.sample)]
+    for name, sample in modes:
+        app.wsgi_app = base
+        log = None
+        if sample is not None:
+            logfile = os.path.join(logdir, name + '.log')
+            app.config['FLASKPYLAR_ACCESS_LOG_FILE'] = logfile
+            app.config['FLASKPYLAR_ACCESS_LOG_SAMPLE'] = sample
+            log = access_log.install(app)
+
+        res = result[name] = load(port, args.clients, args.duration, args.url,
+                                  headers)
+        if log is not None:
+            log.stop()  # flushes the queue
+            with open(logfile) as f:
+                res['lines'] = sum(1 for _ in f)
+            res['dropped'] = log.handler.dropped
+
+    server.shutdown()
+    common.output(result, args.output)
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Access log overhead benchmark')
+
+    parser.add_argument('--clients', type=int, default=8,
+                        help='Concurrent clients')
+
+    parser.add_argument('--duration', type=float, default=5.0,
+                        help='Seconds per mode')
+
+    parser.add_argument('--sample', type=float, default=0.1,
+                        help='Fraction of requests logged in "sampled" mode')
+
+    parser.add_argument('--url', default='/api/pyroes/',
+                        help='Api url to request')
+
+    parser.add_argument('--output', help='Also write the results here')
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    run()
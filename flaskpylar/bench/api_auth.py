@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+'''
+Per request overhead of /api/pyroes authenticated with the session cookie and
+with a bearer token. Requests are made in-process with the test client, to
+leave the network out of the measure:
+
+    python -m bench.api_auth
+'''
+import argparse
+import time
+
+from . import common
+
+
+def run(pargs=None):
+    args = parse_args(pargs)
+
+    from app import app
+    app.config['TESTING'] = True
+    app.config['FLASKPYLAR_API_TOKENS'] = True
+    app.config['FLASKPYLAR_PWD_WORKERS'] = 0  # single login, done inline
+    app.setup()
+
+    client = app.test_client()  # keeps the session cookie
+    resp = client.post('/api/login',
+                       data={'username': 'test', 'password': 'test'})
+    if resp.status_code != 200:
+        raise SystemExit('login failed: {}'.format(resp.status_code))
+
+    token = resp.headers[app.config['FLASKPYLAR_API_TOKEN_HEADER']]
+
+    def measure(client, headers):
+        lats = []
+        for i in range(args.warmup + args.requests):
+            t0 = time.perf_counter()
+            r = client.get(args.url, headers=headers)
+            lat = time.perf_counter() - t0
+            if r.status_code != 200:
+                raise SystemExit('request failed: {}'.format(r.status_code))
+            if i >= args.warmup:
+                lats.append(lat)
+
+        return common.summarize(lats, sum(lats))
+
+    result = {
+        'config': vars(args),
+        'cookie': measure(client, None),
+        # a client without cookies: the token is all there is
+        'token': measure(app.test_client(),
+                         {'Authorization': 'Bearer ' + token}),
+    }
+    common.output(result, args.output)
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Session cookie vs bearer token api benchmark')
+
+    parser.add_argument('--requests', type=int, default=5000,
+                        help='Requests measured per authentication mode')
+
+    parser.add_argument('--warmup', type=int, default=200,
+                        help='Requests made before measuring')
+
+    parser.add_argument('--url', default='/api/pyroes/',
+                        help='Api url to request')
+
+    parser.add_argument('--output', help='Also write the results here')
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    run()
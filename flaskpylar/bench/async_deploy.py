@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+'''
+Sync (prefork wsgi workers, as with uwsgi) versus async (ASGI, asgi.py)
+deployments with a simulated slow backend behind /api/pyroes: the views are
+patched to wait for it (sleeping or awaiting) before getting the pyroes. The
+number of concurrent clients is increased and the highest one served within
+the latency target is reported for each deployment. Needs uvicorn:
+
+    python -m bench.async_deploy --delay 0.05 --workers 2
+'''
+import argparse
+import asyncio
+import functools
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from . import common
+
+DELAY_ENV = 'FLASKPYLAR_BENCH_DELAY'
+
+
+def _configure(app):
+    app.config['FLASKPYLAR_API_TOKENS'] = True
+
+
+def slow_view(view, delay):
+    # The flask view after a blocking call to the backend (the worker waits)
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        time.sleep(delay)
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def slow_async_view(view, delay):
+    # The async view after a call with an async client (nothing waits)
+    @functools.wraps(view)
+    async def wrapper(*args, **kwargs):
+        await asyncio.sleep(delay)
+        return await view(*args, **kwargs)
+
+    return wrapper
+
+
+def make_asgi():
+    # factory for uvicorn (each worker process)
+    from app import app, api_async
+    from app.asgi import AsgiApp
+    _configure(app)
+    delay = float(os.environ[DELAY_ENV])
+    for route, view in list(api_async.routes.items()):
+        if view is api_async.plist:
+            api_async.routes[route] = slow_async_view(view, delay)
+
+    return AsgiApp(app)
+
+
+def serve_sync(port, workers):
+    from werkzeug.serving import make_server
+    from app import app
+    _configure(app)
+    app.setup()
+    app.view_functions['api.plist'] = slow_view(
+        app.view_functions['api.plist'], float(os.environ[DELAY_ENV]))
+    make_server('127.0.0.1', port, app, processes=workers).serve_forever()
+
+
+def serve_async(port, workers):
+    import uvicorn
+    uvicorn.run('bench.async_deploy:make_asgi', factory=True, host='127.0.0.1',
+                port=port, workers=workers, log_level='warning')
+
+
+def load(port, concurrency, duration, headers):
+    lats, statuses = [], {}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def loop():
+        while time.monotonic() < stop_at:
+            status, _, _, lat = common.request(port, 'GET', '/api/pyroes/',
+                                               headers=headers)
+            with lock:
+                lats.append(lat)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    threads = [threading.Thread(target=loop) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return common.summarize(lats, duration, statuses)
+
+
+def run(pargs=None):
+    args = parse_args(pargs)
+    if args.serve:
+        server = serve_sync if args.serve == 'sync' else serve_async
+        return server(args.port, args.workers)
+
+    from app import app
+    from app import tokens
+    token = tokens.make_token(app.secret_key, '0', 3600)
+    headers = {'Authorization': 'Bearer ' + token}
+
+    env = dict(os.environ)
+    env[DELAY_ENV] = str(args.delay)
+    target = args.delay * args.latency_factor
+
+    result = {'config': vars(args)}
+    for mode in args.modes:
+        port = common.free_port()
+        cmd = [sys.executable, '-m', 'bench.async_deploy', '--serve', mode,
+               '--port', str(port), '--workers', str(args.workers)]
+        proc = subprocess.Popen(cmd, env=env)
+        try:
+            common.wait_port(port)
+            levels, best = {}, 0
+            for c in args.concurrency:
+                res = levels[c] = load(port, c, args.duration, headers)
+                if res['p99_ms'] is not None and \
+                   res['p99_ms'] / 1000.0 <= target:
+                    best = c
+
+            result[mode] = {
+                'levels': levels,
+                'max_concurrency_within_target': best,
+                'target_p99_ms': target * 1000.0,
+            }
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    common.output(result, args.output)
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Sync vs async deployment benchmark')
+
+    parser.add_argument('--delay', type=float, default=0.05,
+                        help='Seconds taken by the simulated backend')
+
+    parser.add_argument('--workers', type=int, default=2,
+                        help='Worker processes of each deployment')
+
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 2, 4, 8, 16, 32, 64],
+                        help='Concurrent clients to try')
+
+    parser.add_argument('--latency-factor', type=float, default=2.0,
+                        help='Latency target (p99): delay times this')
+
+    parser.add_argument('--duration', type=float, default=5.0,
+                        help='Seconds per concurrency level')
+
+    parser.add_argument('--modes', nargs='+', default=['sync', 'async'],
+                        choices=['sync', 'async'],
+                        help='Deployments to test')
+
+    parser.add_argument('--output', help='Also write the results here')
+
+    # internal: run a server
+    parser.add_argument('--serve', choices=['sync', 'async'],
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,105 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+import http.client
+import json
+import os
+import resource
+import socket
+import sys
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+
+def percentile(values, pct):
+    # values must be sorted
+    if not values:
+        return None
+
+    idx = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[idx]
+
+
+def summarize(latencies, duration, statuses=None):
+    # latencies in seconds, reported in milliseconds
+    latencies = sorted(latencies)
+    res = {
+        'count': len(latencies),
+        'throughput': len(latencies) / duration if duration else None,
+    }
+    for pct in (50, 95, 99):
+        lat = percentile(latencies, pct)
+        res['p{}_ms'.format(pct)] = None if lat is None else lat * 1000.0
+
+    if statuses is not None:
+        res['statuses'] = {str(k): v for k, v in sorted(statuses.items())}
+
+    return res
+
+
+def rss():
+    # Current resident set size in bytes (peak if /proc is not available)
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024  # KiB
+
+
+def start_server(app, host='127.0.0.1', port=0):
+    # Threaded werkzeug server in a background thread. Returns the server
+    # (server.server_port has the chosen port)
+    server = make_server(host, port, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def free_port(host='127.0.0.1'):
+    with socket.socket() as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+def wait_port(port, timeout=30.0, host='127.0.0.1'):
+    # Waits for a server (launched as a separate process) to accept
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+
+    raise SystemExit('server on port {} did not start'.format(port))
+
+
+def request(port, method, url, body=None, headers=None, host='127.0.0.1'):
+    # Returns (status, headers, body, latency) for a request on a new
+    # connection (no cookies kept)
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    t0 = time.perf_counter()
+    try:
+        conn.request(method, url, body=body, headers=headers or {})
+        resp = conn.getresponse()
+        data = resp.read()
+    finally:
+        conn.close()
+
+    return resp.status, dict(resp.getheaders()), data, \
+        time.perf_counter() - t0
+
+
+def output(result, filename=None):
+    txt = json.dumps(result, indent=2, sort_keys=True)
+    if filename:
+        with open(filename, 'w') as f:
+            f.write(txt + '\n')
+
+    print(txt)
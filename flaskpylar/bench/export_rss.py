@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+'''
+Checks that streaming the export of a large collection of pyroes keeps the
+memory of the worker within a budget. The data is generated if the user has
+none. Exits with status 1 if the RSS grows more than the budget:
+
+    python -m bench.export_rss --size 1000000 --budget-mb 32
+'''
+import argparse
+import os
+import tempfile
+import zlib
+
+from . import common
+from .pyroes_data import generate_pyroes
+
+
+def run(pargs=None):
+    args = parse_args(pargs)
+    db = args.db or os.path.join(tempfile.mkdtemp(), 'pyroes.sqlite3')
+
+    from app import app
+    from app import tokens
+    app.config['TESTING'] = True
+    app.config['FLASKPYLAR_PYROES_STORE'] = 'sqlite'
+    app.config['FLASKPYLAR_PYROES_DB'] = db
+    app.config['FLASKPYLAR_API_TOKENS'] = True
+    app.setup()
+
+    from app import pyroes_management
+    if not pyroes_management.get_version(args.uid):
+        pyroes_management.set_pyroes(args.uid, generate_pyroes(args.size))
+
+    headers = {'Authorization': 'Bearer ' + tokens.make_token(
+        app.secret_key, args.uid, 3600)}
+    if args.gzip:
+        headers['Accept-Encoding'] = 'gzip'
+
+    client = app.test_client()
+    base = peak = common.rss()
+    resp = client.get('/api/pyroes/export', headers=headers, buffered=False)
+
+    unzip = zlib.decompressobj(16 + zlib.MAX_WBITS) if args.gzip else None
+    nbytes = lines = 0
+    for i, chunk in enumerate(resp.response):
+        nbytes += len(chunk)
+        lines += (unzip.decompress(chunk) if unzip else chunk).count(b'\n')
+        if not i % args.sample:
+            peak = max(peak, common.rss())
+
+    resp.close()
+    peak = max(peak, common.rss())
+
+    mb = 1024.0 * 1024.0
+    result = {
+        'config': vars(args),
+        'status': resp.status_code,
+        'content_encoding': resp.headers.get('Content-Encoding'),
+        'rows': lines,
+        'bytes': nbytes,
+        'rss_base_mb': base / mb,
+        'rss_peak_mb': peak / mb,
+        'rss_growth_mb': (peak - base) / mb,
+        'ok': lines == args.size and (peak - base) / mb <= args.budget_mb,
+    }
+    common.output(result, args.output)
+    if not result['ok']:
+        raise SystemExit(1)
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Memory used by streamed pyroes exports')
+
+    parser.add_argument('--db', help='SQLite database (default: temporary)')
+
+    parser.add_argument('--uid', type=int, default=2000000,
+                        help='User whose pyroes are exported')
+
+    parser.add_argument('--size', type=int, default=1000000,
+                        help='Pyroes to generate if the user has none')
+
+    parser.add_argument('--budget-mb', type=float, default=32.0,
+                        help='Allowed growth of the RSS during the export')
+
+    parser.add_argument('--gzip', action='store_true',
+                        help='Request the export gzipped')
+
+    parser.add_argument('--sample', type=int, default=10,
+                        help='Sample the RSS every n chunks')
+
+    parser.add_argument('--output', help='Also write the results here')
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+'''
+Login throughput versus latency of other endpoints under login load.
+
+Compare password verification inline in the request worker with the process
+pool, with the deployment of uwsgi.conf (processes, threads) or a threaded
+werkzeug server:
+
+    python -m bench.login_load --pwd-workers 0
+    python -m bench.login_load --pwd-workers 2
+    python -m bench.login_load --server werkzeug
+'''
+import argparse
+import collections
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+from . import common
+
+
+def start_uwsgi(settings):
+    # uwsgi.conf (wsgi.py) serving http on a local port. The settings file
+    # overrides the config of the app
+    uwsgi = shutil.which('uwsgi')
+    if uwsgi is None:
+        raise SystemExit('uwsgi not found')
+
+    port = common.free_port()
+    env = dict(os.environ, FLASKPYLAR_SETTINGS=settings)
+    cmd = [uwsgi, '--ini', 'uwsgi.conf', '--http-socket',
+           '127.0.0.1:{}'.format(port), '--disable-logging']
+    proc = subprocess.Popen(cmd, env=env, stderr=subprocess.DEVNULL)
+    common.wait_port(port)
+    return proc, port
+
+
+def run(pargs=None):
+    args = parse_args(pargs)
+
+    overrides = {
+        'FLASKPYLAR_PWD_WORKERS': args.pwd_workers,
+        'FLASKPYLAR_PWD_QUEUE': args.pwd_queue,
+    }
+    if args.server == 'uwsgi':
+        with tempfile.NamedTemporaryFile('w', suffix='.py',
+                                         delete=False) as f:
+            for k, v in overrides.items():
+                f.write('{} = {!r}\n'.format(k, v))
+
+        proc, port = start_uwsgi(f.name)
+        stop = proc.terminate
+    else:
+        from app import app
+        app.config['TESTING'] = True
+        app.config.update(overrides)
+        app.setup()
+
+        server = common.start_server(app)
+        port = server.server_port
+        stop = server.shutdown
+
+    body = urlencode({'username': 'test', 'password': 'test'})
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+    results = collections.defaultdict(list)
+    statuses = collections.defaultdict(collections.Counter)
+    lock = threading.Lock()
+    stop_at = time.monotonic() + args.duration
+
+    def loop(name, method, url, body=None, headers=None):
+        while time.monotonic() < stop_at:
+            status, _, _, lat = common.request(port, method, url, body,
+                                               headers)
+            with lock:
+                results[name].append(lat)
+                statuses[name][status] += 1
+
+    threads = [threading.Thread(target=loop, args=('login', 'POST',
+                                                   '/api/login', body,
+                                                   headers))
+               for _ in range(args.logins)]
+    threads += [threading.Thread(target=loop, args=('probe', 'GET',
+                                                    args.probe_url))
+                for _ in range(args.probes)]
+
+    for t in threads:
+        t.start()
+
+    for t in threads:
+        t.join()
+
+    stop()
+    if args.server == 'uwsgi':
+        proc.wait()
+        os.remove(f.name)
+
+    result = {
+        'config': vars(args),
+        'login': common.summarize(results['login'], args.duration,
+                                  statuses['login']),
+        'probe': common.summarize(results['probe'], args.duration,
+                                  statuses['probe']),
+    }
+    common.output(result, args.output)
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Login load benchmark')
+
+    parser.add_argument('--server', default='uwsgi',
+                        choices=['uwsgi', 'werkzeug'],
+                        help='uwsgi.conf or a threaded werkzeug server')
+
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help='Seconds to run')
+
+    parser.add_argument('--logins', type=int, default=8,
+                        help='Concurrent clients logging in')
+
+    parser.add_argument('--probes', type=int, default=2,
+                        help='Concurrent clients requesting the probe url')
+
+    parser.add_argument('--probe-url', default='/api/logout',
+                        help='Cheap endpoint measured under login load')
+
+    parser.add_argument('--pwd-workers', type=int, default=2,
+                        help='Password verification processes (0: inline)')
+
+    parser.add_argument('--pwd-queue', type=int, default=8,
+                        help='Waiting verifications before rejecting (503)')
+
+    parser.add_argument('--output', help='Also write the results here')
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    run()
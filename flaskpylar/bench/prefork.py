@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+'''
+Memory of the worker processes (RSS, PSS and private/USS, from /proc) and
+time to their first request, for a prefork server (like uwsgi) whose app is:
+
+  - lazy: set up by each worker after the fork (as with lazy-apps, or as
+    run.py under uwsgi would have needed, since its setup never ran)
+  - prefork: made by create_app (set up and warmed up) before the fork
+  - freeze: as prefork plus gc.freeze (python >= 3.7, else as prefork)
+
+Each worker listens on its own port to be reached individually (linux):
+
+    python -m bench.prefork --workers 4 --requests 500
+'''
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from . import common
+
+MODES = ['lazy', 'prefork', 'freeze']
+MEM_FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty',
+              'Private_Clean', 'Private_Dirty')
+
+
+def memory(pid):
+    # Memory in bytes of process pid by MEM_FIELDS, plus Uss (private)
+    fname = '/proc/{}/smaps_rollup'.format(pid)
+    if not os.path.exists(fname):
+        fname = '/proc/{}/smaps'.format(pid)  # summed up, slower
+
+    mem = dict.fromkeys(MEM_FIELDS, 0)
+    with open(fname) as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in mem:
+                mem[key] += int(value.split()[0]) * 1024  # kB
+
+    mem['Uss'] = mem['Private_Clean'] + mem['Private_Dirty']
+    return mem
+
+
+def serve(mode, nworkers, testing):
+    # Master of the workers: prints their pids and ports when forked
+    socks = []
+    for _ in range(nworkers):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(128)
+        socks.append(sock)
+
+    import app
+    if mode != 'lazy':
+        app.create_app(testing=testing, freeze=mode == 'freeze')
+
+    workers = []
+    for sock in socks:
+        pid = os.fork()
+        if not pid:
+            try:
+                from werkzeug.serving import make_server
+                logging.getLogger('werkzeug').setLevel(logging.ERROR)
+                if mode == 'lazy':
+                    app.create_app(testing=testing, warmup=False,
+                                   freeze=False)
+
+                make_server('127.0.0.1', sock.getsockname()[1], app.app,
+                            fd=sock.fileno()).serve_forever()
+            finally:
+                os._exit(0)
+
+        workers.append({'pid': pid, 'port': sock.getsockname()[1]})
+
+    def stop(signum, frame):
+        for worker in workers:
+            os.kill(worker['pid'], signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    print(json.dumps({'pid': os.getpid(), 'workers': workers}), flush=True)
+    for worker in workers:
+        os.waitpid(worker['pid'], 0)
+
+
+def first_requests(workers, url):
+    # Concurrent first request to each worker, as a server under load would
+    # see it. Returns the seconds until each answered
+    res = [None] * len(workers)
+    t0 = time.perf_counter()
+
+    def first(i, port):
+        status, _, _, _ = common.request(port, 'GET', url)
+        if status != 200:
+            raise SystemExit('first request: status {}'.format(status))
+
+        res[i] = time.perf_counter() - t0
+
+    threads = [threading.Thread(target=first, args=(i, w['port']))
+               for i, w in enumerate(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return res
+
+
+def measure(mode, args):
+    cmd = [sys.executable, '-m', 'bench.prefork', '--serve', mode,
+           '--workers', str(args.workers)]
+    if args.testing:
+        cmd.append('--testing')
+
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                            universal_newlines=True)
+    try:
+        info = json.loads(proc.stdout.readline())
+        workers = info['workers']
+        firsts = first_requests(workers, args.url)
+
+        lats = []
+        for _ in range(args.requests):
+            for worker in workers:
+                for url in args.urls:
+                    lats.append(common.request(worker['port'], 'GET', url)[3])
+
+        mems = [memory(w['pid']) for w in workers]
+        master = memory(info['pid'])
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    def mean(key):
+        return sum(m[key] for m in mems) / len(mems)
+
+    return {
+        'first_request_ms': [x * 1000.0 for x in firsts],
+        'first_request_max_ms': max(firsts) * 1000.0,
+        'requests': common.summarize(lats, sum(lats)),
+        'workers': mems,
+        'worker_mean_rss': mean('Rss'),
+        'worker_mean_pss': mean('Pss'),
+        'worker_mean_uss': mean('Uss'),
+        'master': master,
+    }
+
+
+def run(pargs=None):
+    args = parse_args(pargs)
+    if args.serve:
+        return serve(args.serve, args.workers, args.testing)
+
+    result = {
+        'config': vars(args),
+        'python': platform.python_version(),
+        'gc_freeze': hasattr(gc, 'freeze'),
+    }
+    for mode in args.modes:
+        result[mode] = measure(mode, args)
+
+    common.output(result, args.output)
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Prefork app factory benchmark')
+
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Worker processes')
+
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES,
+                        help='How the app is made (see above)')
+
+    parser.add_argument('--url', default='/users/',
+                        help='First request to each worker')
+
+    parser.add_argument('--urls', nargs='+',
+                        default=['/users/', '/api/logout'],
+                        help='Requested in turn after the first request')
+
+    parser.add_argument('--requests', type=int, default=200,
+                        help='Rounds of --urls per worker before measuring '
+                             'the memory')
+
+    parser.add_argument('--testing', action='store_true',
+                        help='Run the app in testing mode')
+
+    parser.add_argument('--output', help='Also write the results here')
+
+    # internal: run the master of the workers
+    parser.add_argument('--serve', choices=MODES, help=argparse.SUPPRESS)
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+'''
+Generates users with collections of pyroes of different sizes in a SQLite
+pyroes database. The user with index i has sizes[i] pyroes and uid
+uid_base + i:
+
+    python -m bench.pyroes_data --db pyroes.sqlite3 --sizes 10 1000 1000000
+'''
+import argparse
+import random
+import time
+
+SIZES = [10, 1000, 100000, 1000000]
+UID_BASE = 1000000
+
+
+FIRST = ['Pyro', 'Mopynder', 'Pyter', 'Angela', 'Claire', 'Noah', 'Pysaac',
+         'Pyki', 'Pylar', 'Hiro', 'Matt', 'Nathan', 'Sylar', 'Elle', 'Adam',
+         'Maya', 'Micah', 'Monica', 'Tracy', 'Ando']
+LAST = ['Nakamura', 'Shuresh', 'Pytrelli', 'Pynnet', 'Mendez', 'Sanders',
+        'Parkman', 'Bishop', 'Monroe', 'Herrera', 'Masahashi', 'Gray',
+        'Strauss', 'Dawson', 'Pytian', 'Suresh', 'Linderman', 'Deveaux']
+
+
+def generate_pyroes(size, seed=0):
+    # pyds 1 ... size. Names: "first last number" from a seeded generator
+    rnd = random.Random(seed)
+    for pyd in range(1, size + 1):
+        name = '{} {} {}'.format(rnd.choice(FIRST), rnd.choice(LAST),
+                                 rnd.randrange(1000000))
+        yield {'pyd': pyd, 'name': name}
+
+
+def run(pargs=None):
+    args = parse_args(pargs)
+
+    from app.pyroes_store import SqlitePyroesStore
+    store = SqlitePyroesStore(args.db)
+
+    for i, size in enumerate(args.sizes):
+        uid = args.uid_base + i
+        t0 = time.perf_counter()
+        store.set_pyroes(uid, generate_pyroes(size))
+        print('uid {}: {} pyroes in {:.2f}s'.format(
+            uid, size, time.perf_counter() - t0))
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Pyroes data generator')
+
+    parser.add_argument('--db', default='pyroes.sqlite3',
+                        help='SQLite database to fill')
+
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES,
+                        help='Number of pyroes of each user')
+
+    parser.add_argument('--uid-base', type=int, default=UID_BASE,
+                        help='uid of the first user')
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+'''
+Query time of the first, a middle and the last page of pyroes and size of
+the api responses for users with collections of different sizes. Generate the
+data first with the same sizes:
+
+    python -m bench.pyroes_data --db pyroes.sqlite3
+    python -m bench.pyroes_pages --db pyroes.sqlite3
+'''
+import argparse
+import time
+
+from . import common
+from .pyroes_data import SIZES, UID_BASE
+
+
+def run(pargs=None):
+    args = parse_args(pargs)
+
+    from app import app
+    from app import tokens
+    app.config['TESTING'] = True
+    app.config['FLASKPYLAR_PYROES_STORE'] = 'sqlite'
+    app.config['FLASKPYLAR_PYROES_DB'] = args.db
+    app.config['FLASKPYLAR_API_TOKENS'] = True
+    app.setup()
+
+    from app.pyroes_store import SqlitePyroesStore
+    store = SqlitePyroesStore(args.db)
+
+    client = app.test_client()
+    fields = ','.join(args.fields) if args.fields else None
+
+    result = {'config': vars(args), 'sizes': {}}
+    for i, size in enumerate(args.sizes):
+        uid = args.uid_base + i
+        # cursors for the pages (pyds are 1 ... size)
+        cursors = {
+            'first': None,
+            'middle': size // 2,
+            'last': max(0, size - args.limit),
+        }
+        res = result['sizes'][size] = {}
+        for name, after in cursors.items():
+            lats = []
+            for _ in range(args.requests):
+                t0 = time.perf_counter()
+                store.page(uid, after=after, limit=args.limit,
+                           fields=args.fields or ('pyd', 'name'))
+                lats.append(time.perf_counter() - t0)
+
+            res['query_' + name] = common.summarize(lats, sum(lats))
+
+        token = tokens.make_token(app.secret_key, uid, 3600)
+        qs = {'limit': args.limit}
+        if fields:
+            qs['fields'] = fields
+
+        resp = client.get('/api/pyroes/list', query_string=qs,
+                          headers={'Authorization': 'Bearer ' + token})
+        res['api_status'] = resp.status_code
+        res['api_bytes'] = len(resp.get_data())
+        res['api_next_cursor'] = resp.headers.get('X-Next-Cursor')
+
+    common.output(result, args.output)
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Pyroes pagination benchmark')
+
+    parser.add_argument('--db', default='pyroes.sqlite3',
+                        help='SQLite database made by bench.pyroes_data')
+
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES,
+                        help='Sizes used when generating the data')
+
+    parser.add_argument('--uid-base', type=int, default=UID_BASE,
+                        help='uid used for the first size')
+
+    parser.add_argument('--limit', type=int, default=100,
+                        help='Page size')
+
+    parser.add_argument('--fields', nargs='*',
+                        help='Fields to fetch (default: all)')
+
+    parser.add_argument('--requests', type=int, default=200,
+                        help='Queries per page and size')
+
+    parser.add_argument('--output', help='Also write the results here')
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+'''
+Latency of searches of pyroes by name with the memory and the SQLite stores
+for users with collections of different sizes:
+
+    python -m bench.pyroes_search --sizes 100000 1000000
+'''
+import argparse
+import collections
+import os
+import random
+import tempfile
+import time
+
+from . import common
+from .pyroes_data import generate_pyroes
+
+
+def make_queries(n, size, seed=1):
+    # Prefixes of words of existing names (1, 2 and 3 words)
+    rnd = random.Random(seed)
+    names = [p['name'] for p in generate_pyroes(min(size, 1000))]
+    queries = []
+    for i in range(n):
+        words = rnd.choice(names).split()
+        words = rnd.sample(words, 1 + i % len(words))
+        queries.append(' '.join(w[:rnd.randint(2, len(w))] for w in words))
+
+    return queries
+
+
+def run(pargs=None):
+    args = parse_args(pargs)
+    db = args.db or os.path.join(tempfile.mkdtemp(), 'pyroes.sqlite3')
+
+    from app.pyroes_store import MemoryPyroesStore, SqlitePyroesStore
+
+    result = {'config': vars(args), 'sizes': {}}
+    stores = []
+    if 'memory' in args.stores:
+        stores.append(('memory', MemoryPyroesStore()))
+    if 'sqlite' in args.stores:
+        stores.append(('sqlite', SqlitePyroesStore(db)))
+
+    for size in args.sizes:
+        uid = size  # one user per size
+        queries = make_queries(args.queries, size)
+        res = result['sizes'][size] = {}
+        for name, store in stores:
+            t0 = time.perf_counter()
+            if not store.version(uid):
+                store.set_pyroes(uid, generate_pyroes(size))
+            store.search(uid, 'x', limit=1)  # memory: make the index
+            load = time.perf_counter() - t0
+
+            lats, found = collections.defaultdict(list), 0
+            for q in queries:
+                t0 = time.perf_counter()
+                found += len(store.search(uid, q, limit=args.limit))
+                lats[len(q.split())].append(time.perf_counter() - t0)
+
+            alllats = [x for v in lats.values() for x in v]
+            res[name] = common.summarize(alllats, sum(alllats))
+            res[name]['by_words'] = {
+                n: common.summarize(v, sum(v)) for n, v in sorted(lats.items())
+            }
+            res[name]['load_s'] = load
+            res[name]['avg_results'] = found / float(len(queries))
+
+    common.output(result, args.output)
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Pyroes search benchmark')
+
+    parser.add_argument('--db', help='SQLite database (default: temporary)')
+
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[100000, 1000000],
+                        help='Number of pyroes of the users')
+
+    parser.add_argument('--stores', nargs='+', default=['memory', 'sqlite'],
+                        choices=['memory', 'sqlite'], help='Stores to test')
+
+    parser.add_argument('--queries', type=int, default=1000,
+                        help='Searches per size and store')
+
+    parser.add_argument('--limit', type=int, default=20,
+                        help='Results per search')
+
+    parser.add_argument('--output', help='Also write the results here')
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    run()
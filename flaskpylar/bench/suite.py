@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+'''
+Throughput and latency (p50/p95/p99) of the hot paths of the app, without
+network: login, the pyroes of users with collections of several sizes, the
+render of a blueprint index and a storm of module imports (TESTING mode).
+
+The app is driven in-process with the test client or through a server
+launched locally (werkzeug or uwsgi). The results (json) can be kept as a
+baseline and later runs compared against it, failing (exit code 1) if any
+scenario regressed beyond the threshold:
+
+    python -m bench.suite --output baseline.json
+    python -m bench.suite --baseline baseline.json --threshold 0.2
+    python -m bench.suite --transport uwsgi --workers 2 --clients 4
+'''
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+from . import common
+from .pyroes_data import UID_BASE, generate_pyroes
+
+SCENARIOS = ['login', 'pyroes', 'index', 'imports']
+TRANSPORTS = ['client', 'werkzeug', 'uwsgi']
+METRICS = ['throughput', 'p50_ms', 'p95_ms', 'p99_ms']
+
+SUITE_ENV = 'FLASKPYLAR_BENCH_SUITE'  # json config for launched servers
+IMPORTS_BP = 'users'  # blueprint without login whose imports are requested
+
+
+def make_app(config=None):
+    # Configures the app for the suite. Launched servers take the config
+    # from the environment
+    if config is None:
+        config = json.loads(os.environ[SUITE_ENV])
+
+    from app import app
+    app.config['TESTING'] = True  # imports are only served when testing
+    app.config['FLASKPYLAR_PYROES_STORE'] = 'sqlite'
+    app.config['FLASKPYLAR_PYROES_DB'] = config['db']
+    app.config['FLASKPYLAR_API_TOKENS'] = True
+    app.config['FLASKPYLAR_PWD_WORKERS'] = config['pwd_workers']
+    app.setup()
+    return app
+
+
+def serve_werkzeug(port, workers):
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # no request log
+    app = make_app()
+    make_server('127.0.0.1', port, app, threaded=workers <= 1,
+                processes=max(1, workers)).serve_forever()
+
+
+def uwsgi_command(port, workers):
+    uwsgi = shutil.which('uwsgi')
+    if uwsgi is None:
+        raise SystemExit('uwsgi not found')
+
+    return [uwsgi, '--http-socket', '127.0.0.1:{}'.format(port),
+            '--module', 'bench.wsgi:application', '--pythonpath', '.',
+            '--master', '--processes', str(workers), '--enable-threads',
+            '--disable-logging', '--die-on-term']
+
+
+def import_urls(app):
+    # Module files of the imports blueprint and of the shared libs, plus a
+    # missing candidate for each (brython probes for packages)
+    base = os.path.normpath(os.path.join(
+        app.static_folder, '..', app.config['FLASKPYLAR_DEV'],
+        app.config['FLASKPYLAR_APPS']))
+
+    paths = []
+    for d, dnames, fnames in os.walk(base):
+        dnames[:] = sorted(x for x in dnames if x != '__pycache__')
+        rel = os.path.relpath(d, base).replace(os.sep, '/')
+        top = rel.split('/', 1)[0]
+        if top in app.blueprints and top != IMPORTS_BP:
+            continue
+
+        for fname in sorted(fnames):
+            if not fname.endswith('.py'):
+                continue
+
+            path = fname if rel == '.' else rel + '/' + fname
+            if top == IMPORTS_BP:
+                path = path.split('/', 1)[1]  # within the blueprint
+
+            paths.append(path)
+            paths.append(path[:-len('.py')] + '/__init__.py')  # probe
+
+    return ['/{}/{}?v=1'.format(IMPORTS_BP, p) for p in paths]
+
+
+def scenarios(app, args):
+    # name -> requests (method, url, body, headers) made in turn
+    from app import tokens
+    res = {}
+    if 'login' in args.scenarios:
+        body = urlencode({'username': 'test', 'password': 'test'})
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        res['login'] = [('POST', '/api/login', body, headers)]
+
+    if 'pyroes' in args.scenarios:
+        for i, size in enumerate(args.sizes):
+            token = tokens.make_token(app.secret_key, UID_BASE + i, 3600)
+            headers = {'Authorization': 'Bearer ' + token}
+            # a page and the whole collection
+            res['pyroes_page_{}'.format(size)] = \
+                [('GET', '/api/pyroes/', None, headers)]
+            res['pyroes_export_{}'.format(size)] = \
+                [('GET', '/api/pyroes/export', None, headers)]
+
+    if 'index' in args.scenarios:
+        res['index'] = [('GET', '/{}/'.format(IMPORTS_BP), None, None)]
+
+    if 'imports' in args.scenarios:
+        res['imports'] = [('GET', url, None, None) for url in import_urls(app)]
+
+    return res
+
+
+def client_requester(app):
+    # One per client thread. No cookies: each request stands on its own
+    client = app.test_client(use_cookies=False)
+
+    def request(method, url, body=None, headers=None):
+        t0 = time.perf_counter()
+        resp = client.open(url, method=method, data=body, headers=headers,
+                           buffered=True)  # the body is produced and closed
+        resp.get_data()
+        return resp.status_code, time.perf_counter() - t0
+
+    return request
+
+
+def server_requester(port):
+    def request(method, url, body=None, headers=None):
+        status, _, _, lat = common.request(port, method, url, body, headers)
+        return status, lat
+
+    return lambda: request
+
+
+def measure(requester, requests, args):
+    # Requests made in turn by the clients during the duration, once all of
+    # them have warmed up
+    lats, statuses = [], {}
+    lock = threading.Lock()
+    times = {}
+
+    def start():
+        times['start'] = time.monotonic()
+        times['stop'] = times['start'] + args.duration
+
+    barrier = threading.Barrier(args.clients, action=start)
+
+    def loop(i):
+        request = requester()
+        for n in range(args.warmup):
+            request(*requests[(i + n) % len(requests)])
+
+        barrier.wait()
+        while time.monotonic() < times['stop']:
+            status, lat = request(*requests[i % len(requests)])
+            i += 1
+            with lock:
+                lats.append(lat)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    threads = [threading.Thread(target=loop, args=(c,))
+               for c in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return common.summarize(lats, time.monotonic() - times['start'],
+                            statuses)
+
+
+def compare(result, baseline, threshold, metrics):
+    # Returns the regressions (texts) of result versus baseline
+    regressions = []
+    for name, base in sorted(baseline['scenarios'].items()):
+        cur = result['scenarios'].get(name)
+        if cur is None:
+            continue  # not run this time
+
+        if set(cur['statuses']) != set(base['statuses']):
+            regressions.append('{}: statuses {} (baseline {})'.format(
+                name, sorted(cur['statuses']), sorted(base['statuses'])))
+
+        for metric in metrics:
+            b, c = base.get(metric), cur.get(metric)
+            if not b or c is None:
+                continue
+
+            change = (c - b) / b
+            worse = -change if metric == 'throughput' else change
+            if worse > threshold:
+                regressions.append('{}: {} {:.3f} (baseline {:.3f}, '
+                                   '{:+.1%})'.format(name, metric, c, b,
+                                                     change))
+
+    return regressions
+
+
+def run(pargs=None):
+    args = parse_args(pargs)
+    if args.serve:
+        return serve_werkzeug(args.port, args.workers)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        if baseline['config']['transport'] != args.transport:
+            raise SystemExit('the baseline was made with transport: {}'.format(
+                baseline['config']['transport']))
+
+    # Seeded data, identical for each run
+    tmpdir = tempfile.mkdtemp(prefix='flaskpylar-bench-')
+    config = {'db': os.path.join(tmpdir, 'pyroes.sqlite3'),
+              'pwd_workers': args.pwd_workers}
+
+    from app.pyroes_store import SqlitePyroesStore
+    store = SqlitePyroesStore(config['db'])
+    for i, size in enumerate(args.sizes):
+        store.set_pyroes(UID_BASE + i, generate_pyroes(size))
+
+    proc = None
+    try:
+        app = make_app(config)
+        if args.transport == 'client':
+            requester = lambda: client_requester(app)  # noqa: E731
+        else:
+            port = common.free_port()
+            if args.transport == 'uwsgi':
+                cmd = uwsgi_command(port, args.workers)
+            else:
+                cmd = [sys.executable, '-m', 'bench.suite', '--serve',
+                       '--port', str(port), '--workers', str(args.workers)]
+
+            env = dict(os.environ)
+            env[SUITE_ENV] = json.dumps(config)
+            proc = subprocess.Popen(cmd, env=env)
+            common.wait_port(port)
+            requester = server_requester(port)
+
+        result = {
+            'config': vars(args),
+            'python': platform.python_version(),
+            'scenarios': {},
+        }
+        for name, requests in sorted(scenarios(app, args).items()):
+            result['scenarios'][name] = measure(requester, requests, args)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    regressions = []
+    if baseline is not None:
+        regressions = compare(result, baseline, args.threshold, args.metrics)
+        result['regressions'] = regressions
+
+    common.output(result, args.output)
+    if regressions:
+        for regression in regressions:
+            print('REGRESSION ' + regression, file=sys.stderr)
+
+        sys.exit(1)
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Benchmark suite of the hot paths of the app')
+
+    parser.add_argument('--scenarios', nargs='+', default=SCENARIOS,
+                        choices=SCENARIOS, help='Scenarios to run')
+
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10, 1000, 10000],
+                        help='Pyroes of the users of the pyroes scenario')
+
+    parser.add_argument('--transport', default='client', choices=TRANSPORTS,
+                        help='Test client (in-process) or launched server')
+
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Processes of the launched server')
+
+    parser.add_argument('--clients', type=int, default=1,
+                        help='Concurrent clients')
+
+    parser.add_argument('--duration', type=float, default=3.0,
+                        help='Seconds measured per scenario')
+
+    parser.add_argument('--warmup', type=int, default=10,
+                        help='Requests per client before measuring')
+
+    parser.add_argument('--pwd-workers', type=int, default=0,
+                        help='Password verification processes (0: inline)')
+
+    parser.add_argument('--output', help='Also write the results here')
+
+    pgroup = parser.add_argument_group(title='Comparison')
+    pgroup.add_argument('--baseline',
+                        help='Results (--output) of an earlier run to compare')
+
+    pgroup.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative change which is a regression')
+
+    pgroup.add_argument('--metrics', nargs='+', default=METRICS,
+                        choices=METRICS, help='Metrics compared')
+
+    # internal: run a werkzeug server
+    parser.add_argument('--serve', action='store_true',
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,11 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+# Entry point of the uwsgi servers launched by bench.suite (configured with
+# the environment)
+from .suite import make_app
+
+application = make_app()
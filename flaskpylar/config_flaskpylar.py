@@ -8,3 +8,125 @@ FLASKPYLAR_DEV = 'dev'
 FLASKPYLAR_APPS = 'apps'
 FLASKPYLAR_LIBS = 'libs'
 FLASKPYLAR_APP_PKG = 'app'
+
+# Maps logical static names to content-hashed ones (written by app-manager.py)
+FLASKPYLAR_MANIFEST = 'asset-manifest.json'
+FLASKPYLAR_IMMUTABLE_MAX_AGE = 31536000  # 1 year for fingerprinted assets
+
+# Testing: imports are kept in memory (bounded size) and can be cached by the
+# browser for max-age when requested with brython's "v" cache-buster
+FLASKPYLAR_IMPORT_CACHE_BYTES = 32 * 1024 * 1024
+FLASKPYLAR_IMPORT_MAX_AGE = 86400
+# Seconds between checks for changes of the index of files in the apps dir
+FLASKPYLAR_MODULE_INDEX_INTERVAL = 1.0
+
+# Index pages of the blueprints are rendered once (the CSRF token is put in
+# per session) and revalidated with an ETag. They may only depend on the
+# blueprint, the config and urls
+FLASKPYLAR_PAGE_CACHE = True
+
+# Users: "memory" (dictionaries in each process) or "sqlite"
+# (FLASKPYLAR_USER_DB with a pool of FLASKPYLAR_USER_DB_POOL connections per
+# worker)
+FLASKPYLAR_USER_STORE = 'memory'
+FLASKPYLAR_USER_DB = 'users.sqlite3'
+FLASKPYLAR_USER_DB_POOL = 4
+# Per worker cache of loaded users (entries, seconds)
+FLASKPYLAR_USER_CACHE_SIZE = 10000
+FLASKPYLAR_USER_CACHE_TTL = 60
+
+# Pyroes: "memory" or "sqlite" (FLASKPYLAR_PYROES_DB) and size of the pages
+# delivered by the api (by default and at most). "memory" is per process:
+# with several workers (uwsgi.conf) bulk imports are refused (409), use
+# "sqlite" for them
+FLASKPYLAR_PYROES_STORE = 'memory'
+FLASKPYLAR_PYROES_DB = 'pyroes.sqlite3'
+FLASKPYLAR_PYROES_DB_POOL = 4
+FLASKPYLAR_PYROES_PAGE = 100
+FLASKPYLAR_PYROES_MAX_PAGE = 1000
+# Results of a search (by default, at most FLASKPYLAR_PYROES_MAX_PAGE)
+FLASKPYLAR_SEARCH_LIMIT = 20
+# Exports are streamed in batches of pyroes, gzipped (level) if accepted
+FLASKPYLAR_EXPORT_BATCH = 1000
+FLASKPYLAR_EXPORT_GZIP = 6
+# Bulk imports are written in transactions of this many pyroes
+FLASKPYLAR_BULK_BATCH = 1000
+# Per worker cache of encoded api responses (entries, one per user and page)
+FLASKPYLAR_RESPONSE_CACHE_SIZE = 10000
+
+# Compression of dynamic responses of these types and at least this size (in
+# bytes) with brotli (quality, if the package is available) or gzip (level)
+# as accepted by the client. Cached responses keep their compressed bodies
+FLASKPYLAR_COMPRESS = True
+FLASKPYLAR_COMPRESS_TYPES = (
+    'application/json', 'application/x-ndjson', 'application/javascript',
+    'text/html', 'text/css', 'text/plain',
+)
+FLASKPYLAR_COMPRESS_MIN_SIZE = 1024
+FLASKPYLAR_COMPRESS_GZIP = 6
+FLASKPYLAR_COMPRESS_BROTLI = 4
+
+# Access log (also enabled by run.py --logging): a json line per request with
+# the fields (see app/access_log.FIELDS) to the file (None: stderr), for a
+# fraction of the requests (server errors are always logged). Lines are
+# written by a background thread, with at most FLASKPYLAR_ACCESS_LOG_QUEUE
+# pending (more are dropped)
+FLASKPYLAR_ACCESS_LOG = False
+FLASKPYLAR_ACCESS_LOG_FIELDS = (
+    'time', 'method', 'path', 'blueprint', 'status', 'bytes', 'duration',
+)
+FLASKPYLAR_ACCESS_LOG_FILE = None
+FLASKPYLAR_ACCESS_LOG_SAMPLE = 1.0
+FLASKPYLAR_ACCESS_LOG_QUEUE = 10000
+
+# Metrics per endpoint/blueprint in prometheus format at the path below and
+# Server-Timing headers (off by default). The path only answers requests from
+# the remote addresses in FLASKPYLAR_METRICS_ALLOW (None: any, keep it internal
+# at the proxy then). Each worker process writes to a file in the directory
+# (None: a temporary one made before the workers are forked and removed at
+# exit). The files of a given directory are deleted when the app is created
+# (in the uwsgi master), don't share it between servers
+FLASKPYLAR_METRICS = False
+FLASKPYLAR_METRICS_PATH = '/metrics'
+FLASKPYLAR_METRICS_ALLOW = ('127.0.0.1', '::1')
+FLASKPYLAR_METRICS_DIR = None
+FLASKPYLAR_METRICS_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# Profiling of requests carrying a token from "./profiles.py --token" in the
+# header or the query arg below, and of a fraction of all requests. Mode:
+# "cprofile" (.pstats files) or "sampler" (stack samples every interval
+# seconds, .collapsed files for flamegraphs). Files go to a directory per
+# endpoint (merged with ./profiles.py)
+FLASKPYLAR_PROFILE = False
+FLASKPYLAR_PROFILE_MODE = 'cprofile'
+FLASKPYLAR_PROFILE_SAMPLE = 0.0
+FLASKPYLAR_PROFILE_INTERVAL = 0.005
+FLASKPYLAR_PROFILE_HEADER = 'X-Profile'
+FLASKPYLAR_PROFILE_ARG = '_profile'
+FLASKPYLAR_PROFILE_DIR = 'profiles'
+
+# Password hashing (hashes with other schemes/rounds are updated at login)
+FLASKPYLAR_PWD_SCHEME = 'sha512_crypt'
+FLASKPYLAR_PWD_ROUNDS = 656000
+# Verification in FLASKPYLAR_PWD_WORKERS processes (0: inline in the request
+# worker) with at most FLASKPYLAR_PWD_QUEUE waiting requests (503 beyond,
+# Retry-After), both shared out among the uwsgi workers. Waiting requests hold
+# a thread: see threads in uwsgi.conf
+FLASKPYLAR_PWD_WORKERS = 2
+FLASKPYLAR_PWD_QUEUE = 8
+FLASKPYLAR_PWD_TIMEOUT = 10.0
+FLASKPYLAR_PWD_RETRY = 1
+
+# Api bearer tokens: a login with password also returns a signed token (uid,
+# expiry) in the header below (an already logged in login gets none, so tokens
+# can't be renewed without the password). Api requests (/api/) sending it as
+# "Authorization: Bearer xxx" skip the session cookie and the user store
+FLASKPYLAR_API_TOKENS = True
+FLASKPYLAR_API_TOKEN_TTL = 900
+FLASKPYLAR_API_TOKEN_HEADER = 'X-Auth-Token'
+
+# ASGI (asgi.py): threads running the wsgi app and the blocking calls of the
+# async views
+FLASKPYLAR_ASGI_THREADS = 32
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+'''
+Reports of the request profiles written by app/profiling.py: the samples of
+each endpoint are merged into a single ``.pstats`` (with the top functions
+printed) and a single ``.collapsed`` (for flamegraph.pl or speedscope). It
+also makes the tokens which trigger profiling::
+
+  ./profiles.py --token --ttl 600      # curl -H "X-Profile: <token>" ...
+  ./profiles.py --endpoint api.plist --top 30 --output merged
+'''
+import argparse
+import collections
+import glob
+import io
+import os.path
+import pstats
+import sys
+
+import config_flaskpylar as confpylar
+
+PSTATS_EXT = '.pstats'
+COLLAPSED_EXT = '.collapsed'
+
+
+def merge_pstats(filenames):
+    stats = pstats.Stats(filenames[0], stream=io.StringIO())
+    for filename in filenames[1:]:
+        stats.add(filename)
+
+    return stats
+
+
+def merge_collapsed(filenames):
+    stacks = collections.Counter()
+    for filename in filenames:
+        with open(filename) as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack:
+                    stacks[stack] += int(count)
+
+    return stacks
+
+
+def report(dirname, endpoint, args):
+    pfiles = sorted(glob.glob(os.path.join(dirname, '*' + PSTATS_EXT)))
+    cfiles = sorted(glob.glob(os.path.join(dirname, '*' + COLLAPSED_EXT)))
+    if not pfiles and not cfiles:
+        return
+
+    print('=' * 79)
+    print('{}: {} cProfile and {} sampler profiles'.format(
+        endpoint, len(pfiles), len(cfiles)))
+
+    if pfiles:
+        stats = merge_pstats(pfiles)
+        out = io.StringIO()
+        stats.stream = out
+        stats.sort_stats(args.sort).print_stats(args.top)
+        print(out.getvalue())
+        if args.output:
+            stats.dump_stats(os.path.join(args.output, endpoint + PSTATS_EXT))
+
+    if cfiles:
+        stacks = merge_collapsed(cfiles)
+        total = sum(stacks.values())
+        print('Samples: {}. Hottest stacks (leaf frames):'.format(total))
+        for stack, count in stacks.most_common(args.top):
+            print('  {:6.2f}% {}'.format(100.0 * count / total,
+                                         stack.rsplit(';', 1)[-1]))
+
+        if args.output:
+            fname = os.path.join(args.output, endpoint + COLLAPSED_EXT)
+            with open(fname, 'w') as f:
+                for stack, count in sorted(stacks.items()):
+                    f.write('{} {}\n'.format(stack, count))
+
+
+def run(pargs=None):
+    args = parse_args(pargs)
+
+    if args.token:
+        from app import app
+        from app import profiling
+        print(profiling.make_trigger(app.secret_key, args.ttl))
+        return
+
+    if not os.path.isdir(args.dir):
+        print('No profiles directory: {}'.format(args.dir), file=sys.stderr)
+        sys.exit(1)
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+
+    endpoints = args.endpoint or sorted(os.listdir(args.dir))
+    for endpoint in endpoints:
+        dirname = os.path.join(args.dir, endpoint)
+        if os.path.isdir(dirname):
+            report(dirname, endpoint, args)
+
+
+def parse_args(pargs=None):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Flaskpylar request profiles')
+
+    parser.add_argument('--dir', default=confpylar.FLASKPYLAR_PROFILE_DIR,
+                        help='Directory with the profiles')
+
+    parser.add_argument('--endpoint', nargs='+',
+                        help='Endpoints to report (default: all)')
+
+    parser.add_argument('--top', type=int, default=20,
+                        help='Functions/stacks printed per endpoint')
+
+    parser.add_argument('--sort', default='cumulative',
+                        help='pstats sort key')
+
+    parser.add_argument('--output',
+                        help='Write merged .pstats/.collapsed files here')
+
+    pgroup = parser.add_argument_group(title='Triggering')
+    pgroup.add_argument('--token', action='store_true',
+                        help='Print a token which triggers profiling')
+
+    pgroup.add_argument('--ttl', type=int, default=600,
+                        help='Seconds the token is valid')
+
+    return parser.parse_args(pargs)
+
+
+if __name__ == '__main__':
+    run()
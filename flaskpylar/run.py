@@ -8,7 +8,6 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 import argparse
-import pprint
 import os
 import os.path
 from app import app
@@ -24,30 +23,12 @@ if False:
     log.addHandler(out_hdlr)
 
 
-class LoggingMiddleware(object):
-    '''
-    https://stackoverflow.com/q/25466904
-    '''
-    def __init__(self, app):
-        self._app = app
-
-    def __call__(self, environ, resp):
-        errorlog = environ['wsgi.errors']
-        pprint.pprint(('REQUEST', environ), stream=errorlog)
-
-        def log_response(status, headers, *args):
-            pprint.pprint(('RESPONSE', status, headers), stream=errorlog)
-            return resp(status, headers, *args)
-
-        return self._app(environ, log_response)
-
-
 def run():
     args = parse_args()
 
     app.config['TESTING'] = not args.no_testing
     if args.logging:
-        app.wsgi_app = LoggingMiddleware(app.wsgi_app)
+        app.config['FLASKPYLAR_ACCESS_LOG'] = True
 
     extra_files = []
     if args.debug:
@@ -82,7 +63,7 @@ def parse_args():
                         help=('disable testing mode'))
 
     parser.add_argument('--logging', required=False, action='store_true',
-                        help=('log everything possible from wsgi'))
+                        help=('json access log (see FLASKPYLAR_ACCESS_LOG_*)'))
 
     return parser.parse_args()
 
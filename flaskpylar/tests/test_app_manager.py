@@ -0,0 +1,70 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+import importlib.util
+import os
+import re
+
+import pytest
+
+# app-manager.py is a script: loaded from its file
+_spec = importlib.util.spec_from_file_location(
+    'app_manager',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'app-manager.py'))
+app_manager = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(app_manager)
+
+
+@pytest.mark.parametrize('pat, matches, nomatches', [
+    ('*.pyc', ['a.pyc', '.pyc'], ['d/a.pyc', 'a.pyc~']),
+    ('?.py', ['a.py'], ['ab.py', '/.py']),
+    ('**/x', ['x', 'a/x', 'a/b/x'], ['ax', 'a/xy']),
+    ('a/**', ['a/b', 'a/b/c'], ['b/a/c']),
+    ('a/**/b', ['a/b', 'a/x/b', 'a/x/y/b'], ['a/xb', 'ab']),
+    ('[ab]c', ['ac', 'bc'], ['cc', 'abc']),
+    ('[!ab]c', ['cc', 'xc'], ['ac', '/c']),
+    ('[^a]c', ['bc'], ['ac']),
+    ('[]]', [']'], ['a']),
+    ('[!]]', ['a'], [']', '/']),
+    ('[!a-]', ['b'], ['a', '-', '/']),
+    ('a[b', ['a[b'], ['ab']),
+    ('\\*.py', ['*.py'], ['a.py']),
+    ('a.b+c', ['a.b+c'], ['axbbc']),
+])
+def test_glob_to_regex(pat, matches, nomatches):
+    rx = re.compile(app_manager.glob_to_regex(pat))
+    for path in matches:
+        assert rx.fullmatch(path), (pat, path)
+
+    for path in nomatches:
+        assert not rx.fullmatch(path), (pat, path)
+
+
+def _ignorer(tmpdir, patterns):
+    return app_manager.Ignorer(str(tmpdir), str(tmpdir.join('dev')), False,
+                               patterns)
+
+
+@pytest.mark.parametrize('relpath, isdir, skipped', [
+    ('a.pyc', False, True),
+    ('d/e/a.pyc', False, True),
+    ('keep.pyc', False, False),  # re-included
+    ('build', True, True),
+    ('build', False, False),  # only directories
+    ('d/build', True, True),
+    ('docs/x.txt', False, True),  # anchored
+    ('d/docs/x.txt', False, False),
+    ('main.py', False, False),
+])
+def test_ignorer_match(tmpdir, relpath, isdir, skipped):
+    patterns = ['# comment', '', '*.pyc', '!keep.pyc', 'build/',
+                '/docs/*.txt']
+    assert _ignorer(tmpdir, patterns).match(relpath, isdir) is skipped
+
+
+def test_ignorer_last_rule_wins(tmpdir):
+    ignorer = _ignorer(tmpdir, ['*.pyc', '!*.pyc', '*.pyc'])
+    assert ignorer.match('a.pyc', False)
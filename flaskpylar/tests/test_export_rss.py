@@ -0,0 +1,39 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Materialized, this many pyroes take several times the budget
+SIZE = 100000
+BUDGET_MB = 8
+
+
+@pytest.mark.parametrize('gzip', [False, True])
+def test_export_rss(tmpdir, gzip):
+    # bench.export_rss in its own process, for the RSS to be its own
+    output = str(tmpdir.join('result.json'))
+    cmd = [sys.executable, '-m', 'bench.export_rss', '--size', str(SIZE),
+           '--budget-mb', str(BUDGET_MB), '--db',
+           str(tmpdir.join('pyroes.sqlite3')), '--output', output]
+    if gzip:
+        cmd.append('--gzip')
+
+    proc = subprocess.run(cmd, cwd=ROOT, stdout=subprocess.DEVNULL)
+    with open(output) as f:
+        result = json.load(f)
+
+    assert result['status'] == 200
+    assert result['rows'] == SIZE
+    assert result['content_encoding'] == ('gzip' if gzip else None)
+    assert result['rss_growth_mb'] <= BUDGET_MB
+    assert proc.returncode == 0
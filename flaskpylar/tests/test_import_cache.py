@@ -0,0 +1,52 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+import gzip
+
+from app import app
+from app.import_cache import ImportCache
+
+
+def _module(tmpdir, name, nbytes):
+    # a compressible (text/plain) file of nbytes
+    path = tmpdir.join(name)
+    path.write(('x = 1\n' * nbytes)[:nbytes])
+    return str(path)
+
+
+def _send(cache, filename):
+    headers = {'Accept-Encoding': 'gzip'}
+    with app.test_request_context('/', headers=headers):
+        return cache.send(filename)
+
+
+def test_encoded_variants_counted(tmpdir):
+    filename = _module(tmpdir, 'a.txt', 4000)
+    cache = ImportCache(100000)
+    resp = _send(cache, filename)
+    assert resp.headers['Content-Encoding'] == 'gzip'
+
+    entry = cache.get(filename)
+    body = entry.encoded['gzip']
+    assert gzip.decompress(body) == entry.data
+    assert cache.size == len(entry.data) + len(body)
+
+    _send(cache, filename)  # the variant is reused: counted once
+    assert cache.size == len(entry.data) + len(body)
+
+
+def test_encoded_variants_evict(tmpdir):
+    first = _module(tmpdir, 'a.txt', 4000)
+    second = _module(tmpdir, 'b.txt', 4000)
+    cache = ImportCache(2 * 4000)
+    cache.get(first)
+    cache.get(second)
+    assert cache.size <= cache.max_bytes
+
+    _send(cache, second)  # its variant pushes the oldest entry out
+    assert cache.size <= cache.max_bytes
+    assert cache.get(second) is cache.get(second)
+    assert list(cache._entries) == [second]
@@ -0,0 +1,39 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+import os
+
+from flask import Flask
+
+from app import metrics
+from config_flaskpylar import FLASKPYLAR_METRICS_BUCKETS
+
+
+def _app(directory):
+    app = Flask(__name__)
+    app.config.update(
+        FLASKPYLAR_METRICS_DIR=directory,
+        FLASKPYLAR_METRICS_BUCKETS=FLASKPYLAR_METRICS_BUCKETS,
+        FLASKPYLAR_METRICS_ALLOW=None,
+        FLASKPYLAR_METRICS_PATH='/metrics',
+    )
+    return app
+
+
+def test_dir_cleared(tmpdir):
+    # files of workers of earlier runs are not added up
+    tmpdir.join('metrics-1.db').write('')
+    tmpdir.join('other').write('')
+    metrics.install(_app(str(tmpdir)))
+    assert tmpdir.listdir() == [tmpdir.join('other')]
+
+
+def test_temp_dir_removed(tmpdir):
+    directory = str(tmpdir.mkdir('metrics'))
+    metrics._remove_dir(directory, os.getpid() + 1)  # a forked worker
+    assert os.path.isdir(directory)
+    metrics._remove_dir(directory, os.getpid())
+    assert not os.path.exists(directory)
@@ -0,0 +1,79 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+import json
+
+import pytest
+
+from app.module_bundle import ModuleBundler
+
+
+def _imports(modname, src, is_pkg=False):
+    return list(ModuleBundler._imports(modname, src, is_pkg))
+
+
+@pytest.mark.parametrize('src, imports', [
+    ('import a, b.c as d', ['a', 'b.c']),
+    ('from a import b, c', ['a', 'a.b', 'a.c']),
+    ('from a.b import *', ['a.b']),
+    ('from . import x', ['top.pkg', 'top.pkg.x']),
+    ('from .m import x', ['top.pkg.m', 'top.pkg.m.x']),
+    ('from .. import y', ['top', 'top.y']),
+    ('from ..n import y', ['top.n', 'top.n.y']),
+    ('from ... import z', []),  # beyond the top-level package
+    ('def f():\n    import lazy\n', ['lazy']),
+    ('import (', []),  # syntax errors are left to brython
+])
+def test_imports(src, imports):
+    assert sorted(_imports('top.pkg.mod', src)) == sorted(imports)
+
+
+def test_imports_of_package():
+    # relative imports in a package start from the package itself
+    assert _imports('top.pkg', 'from . import x', is_pkg=True) == \
+        ['top.pkg', 'top.pkg.x']
+
+
+def _bundle(entry):
+    # vfs of all modules in the bundle by name
+    vfs = {}
+    for line in entry.data.decode('utf-8').splitlines():
+        line = line.strip()
+        if line.startswith('var $vfs = '):
+            vfs.update(json.loads(line[len('var $vfs = '):]))
+
+    return vfs
+
+
+def test_bundle(tmpdir):
+    base = tmpdir.mkdir('apps')
+    pkg = base.mkdir('users').mkdir('app')
+    pkg.join('__init__.py').write('from .main import Main\n')
+    pkg.join('main.py').write('import lib\nimport browser\n')
+    pkg.join('main.html').write('<p></p>')
+    base.join('lib.py').write('X = 1\n')
+
+    bundler = ModuleBundler(str(base), 'app')
+    vfs = _bundle(bundler.get('users', 'app'))
+    assert sorted(vfs) == ['app', 'app.main', 'app/main.html', 'lib']
+    assert vfs['app'] == ['.py', 'from .main import Main\n', 1]
+    assert bundler.get('users', 'app') is bundler.get('users', 'app')
+
+
+@pytest.mark.parametrize('root', ['..', 'a/b', 'a..b', '.a', '1a', ''])
+def test_bundle_invalid_root(tmpdir, root):
+    with pytest.raises(ValueError):
+        ModuleBundler(str(tmpdir), 'app').get('users', root)
+
+
+def test_bundle_outside_sources(tmpdir):
+    # modules reached through links out of the sources are not bundled
+    base = tmpdir.mkdir('apps')
+    tmpdir.join('secret.py').write('KEY = 1\n')
+    base.join('evil.py').mksymlinkto(tmpdir.join('secret.py'))
+    base.join('ok.py').write('import evil\n')
+    vfs = _bundle(ModuleBundler(str(base), 'app').get('users', 'ok'))
+    assert sorted(vfs) == ['ok']
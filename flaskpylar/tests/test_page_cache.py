@@ -0,0 +1,42 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+from app import app
+from app.page_cache import PageCache, PageEntry
+
+
+def _cache(invalidating=False):
+    # renders without templates; optionally invalidated while rendering
+    cache = PageCache(app, lambda: 'token')
+
+    def render(template, context):
+        if invalidating:
+            cache.invalidate()
+
+        return PageEntry(template, [b'html'], (), {})
+
+    cache._render = render
+    return cache
+
+
+def _get(cache):
+    with app.test_request_context('/'):
+        return cache.get('index.html', {})
+
+
+def test_entry_kept():
+    cache = _cache()
+    entry = _get(cache)
+    assert _get(cache) is entry
+    assert list(cache._entries) == [(None, '', 'index.html', 0)]
+
+
+def test_invalidated_while_rendering():
+    # the page is delivered but not kept under the old generation
+    cache = _cache(invalidating=True)
+    assert _get(cache).etag == 'index.html'
+    assert cache._entries == {}
+    assert cache.generation == 1
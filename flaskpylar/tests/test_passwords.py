@@ -0,0 +1,62 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+import threading
+
+import pytest
+
+from app.passwords import Verifier, VerifierBusy, make_context
+
+SCHEME = 'sha512_crypt'
+
+
+@pytest.mark.parametrize('old, new', [(1000, 2000), (2000, 1000)])
+def test_rounds_rehashed(old, new):
+    # more and fewer rounds than configured are both updated
+    passhash = make_context(SCHEME, old).hash('secret')
+    context = make_context(SCHEME, new)
+    verified, newhash = context.verify_and_update('secret', passhash)
+    assert verified
+    assert newhash is not None
+    assert context.verify_and_update('secret', newhash) == (True, None)
+
+
+def test_other_scheme_rehashed():
+    passhash = make_context('sha256_crypt', 1000).hash('secret')
+    verified, newhash = make_context(SCHEME, 1000).verify_and_update(
+        'secret', passhash)
+    assert verified
+    assert newhash.startswith('$6$')
+
+
+def test_wrong_password():
+    passhash = make_context(SCHEME, 1000).hash('secret')
+    assert make_context(SCHEME, 1000).verify_and_update('wrong', passhash) == \
+        (False, None)
+
+
+def test_verifier_pool():
+    verifier = Verifier(SCHEME, 1000, workers=1, queue=0, timeout=30.0)
+    passhash = verifier.hash('secret')
+    verifier.start()
+    assert verifier.verify_and_update('secret', passhash) == (True, None)
+    assert verifier.verify_and_update('wrong', passhash) == (False, None)
+
+
+def test_verifier_busy():
+    # the bound of the process: a second verification in flight is refused
+    verifier = Verifier(SCHEME, 1000, workers=1, queue=0, timeout=30.0)
+    passhash = verifier.hash('secret')
+    pool, slots = verifier._get_pool()
+    assert slots.acquire(False)  # taken by a verification in flight
+    try:
+        with pytest.raises(VerifierBusy):
+            verifier.verify_and_update('secret', passhash)
+    finally:
+        slots.release()
+
+    assert verifier.verify_and_update('secret', passhash) == (True, None)
+    assert isinstance(slots, type(threading.BoundedSemaphore()))
@@ -0,0 +1,49 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+import os
+import threading
+
+from app.sqlite_store import SqliteStore
+
+
+class _Store(SqliteStore):
+    SQL_SCHEMA = ('CREATE TABLE IF NOT EXISTS t (x INTEGER)',)
+
+
+def test_schema_connection_not_pooled(tmpdir):
+    store = _Store(str(tmpdir.join('t.db')))
+    assert store._pool is None  # nothing to hand down to forked workers
+    with store.connection() as conn:
+        conn.execute('INSERT INTO t VALUES (1)')
+
+    assert store._pool.qsize() == 1
+
+
+def test_new_pool_after_fork(tmpdir):
+    store = _Store(str(tmpdir.join('t.db')))
+    with store.connection() as conn:
+        parent = conn
+
+    store._pid = -1  # as seen from a forked process
+    pools, conns = set(), []
+
+    def use():
+        with store.connection() as conn:
+            conns.append(conn)
+            pools.add(id(store._pool))
+
+    threads = [threading.Thread(target=use) for _ in range(8)]
+    for t in threads:
+        t.start()
+
+    for t in threads:
+        t.join()
+
+    assert len(pools) == 1  # a single new pool for all threads
+    assert parent not in conns
+    assert store._pid == os.getpid()
+    assert store._inherited is not None  # the parent's, left alone
@@ -0,0 +1,56 @@
+###############################################################################
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+import io
+import json
+
+import pytest
+
+from app.streams import iter_json_array, iter_ndjson
+
+ARRAYS = [
+    '[]',
+    ' [ ] ',
+    '[1.5,2]',
+    '[-12.5e+3, 1E-2, 0, -0.25, 123456789]',
+    '[true, false, null, "a,]b", "\\u00e9\\"x"]',
+    '[{"pyd": 1, "name": "Pyro 1.5"}, [1, [2.25, {}]], "ñ"]',
+]
+
+
+def _split_sizes(data):
+    return range(1, len(data.encode('utf-8')) + 2)
+
+
+@pytest.mark.parametrize('text', ARRAYS)
+def test_json_array_every_split(text):
+    # the elements may be split anywhere by the reads
+    for size in _split_sizes(text):
+        stream = io.BytesIO(text.encode('utf-8'))
+        assert list(iter_json_array(stream, size=size)) == json.loads(text), \
+            size
+
+
+@pytest.mark.parametrize('text', ['', '[1,', '[1 2]', '{}', '[1]x', '[1.]'])
+def test_json_array_invalid(text):
+    for size in _split_sizes(text):
+        with pytest.raises(ValueError):
+            list(iter_json_array(io.BytesIO(text.encode('utf-8')), size=size))
+
+
+def test_json_array_max_item():
+    text = '["{}"]'.format('x' * 100)
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.BytesIO(text.encode('utf-8')), size=10,
+                             max_item=50))
+
+
+def test_ndjson_every_split():
+    text = '{"pyd": 1}\n\n{"pyd": 2.5, "name": "ñ"}\n[3]'
+    for size in _split_sizes(text):
+        stream = io.BytesIO(text.encode('utf-8'))
+        assert list(iter_ndjson(stream, size=size)) == \
+            [{'pyd': 1}, {'pyd': 2.5, 'name': 'ñ'}, [3]]
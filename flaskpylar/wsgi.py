@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+# Copyright 2018 Daniel Rodriguez. All Rights Reserved.
+# Use of this source code is governed by the MIT license
+###############################################################################
+'''
+WSGI entry point for uwsgi (see uwsgi.conf). The app is set up and warmed up
+when uwsgi loads this module in the master process, before the workers are
+forked. Like uwsgi with run.py before, it runs the packed application (not
+testing). Each worker starts its password hashing processes right after the
+fork, before running its threads
+'''
+from app import create_app
+from app.passwords import verifier
+
+application = create_app()
+
+try:
+    from uwsgidecorators import postfork
+except ImportError:
+    pass  # not under uwsgi
+else:
+    postfork(verifier.start)